@@ -1,10 +1,30 @@
 import streamlit as st
 import pandas as pd
-import requests
 from io import BytesIO
-import plotly.express as px
-import plotly.graph_objects as go
+import numpy as np
 import time
+import html
+import functools
+
+import dslab_charts as charts
+from dslab_telemetry import telemetry
+from dslab_engine import (
+    LOAD_STAGES,
+    SchemaError,
+    DatasetCache,
+    filter_rows,
+    normalized_query,
+    result_cache,
+    ResultCache,
+    EXPORT_FORMATS,
+    write_export,
+    take_rows,
+    sort_rows,
+    SIMILARITY_DEFAULT_TOP,
+)
+
+# Wall time of this script run, recorded at the end when telemetry is enabled
+rerun_started = time.perf_counter()
 
 # Set page configuration to wide mode with better title and icon
 st.set_page_config(
@@ -93,6 +113,295 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# Shared cache instance, created once per server process
+@st.cache_resource
+def get_dataset_cache():
+    dataset_cache = DatasetCache()
+    telemetry.register_gauges("dataset", dataset_cache.gauges)
+    return dataset_cache
+
+# Function to show load progress; the bar is only created once real work starts
+def make_progress_reporter(container):
+    bar = {}
+
+    def report(stage, fraction, detail=""):
+        if "widget" not in bar:
+            bar["widget"] = container.progress(0.0)
+        start, end = LOAD_STAGES.get(stage, (0.0, 1.0))
+        bar["widget"].progress(start + (end - start) * fraction, text=f"{stage}... {detail}".strip())
+
+    return report
+
+# Larger exports are written per request instead of being memoized
+EXPORT_MEMO_MAX_ROWS = 200_000
+# Export bytes kept per process; the least recently downloaded are dropped beyond it
+EXPORT_CACHE_BYTES = 64 * 1024 * 1024
+
+# Process-wide cache of export bytes, shared across sessions
+@st.cache_resource
+def export_cache():
+    cache = ResultCache(EXPORT_CACHE_BYTES, name="export_cache")
+    telemetry.register_gauges("exports", cache.gauges)
+    return cache
+
+# Function to return memoized export bytes, keyed by dataset version, filter state,
+# selected columns and format
+def memoized_export(version, query_key, columns, export_format, data, rows):
+    cache = export_cache()
+    key = (version, query_key, columns, export_format)
+    found, content = cache.get(key)
+    if not found:
+        buffer = BytesIO()
+        write_export(data, export_format, buffer, rows=rows, columns=columns)
+        content = buffer.getvalue()
+        cache.put(key, content)
+    return content
+
+# Function to build the export only when a download button is clicked; the selected
+# rows and columns are gathered chunk by chunk while the file is written
+def lazy_export(version, query_key, data, rows, columns, export_format):
+    columns = tuple(columns)
+
+    def generate():
+        telemetry.count("export_request")
+        if len(rows) <= EXPORT_MEMO_MAX_ROWS:
+            return memoized_export(version, query_key, columns, export_format, data, rows)
+        # Streamlit takes the download as bytes, so there is nothing to gain from spooling to disk
+        buffer = BytesIO()
+        write_export(data, export_format, buffer, rows=rows, columns=columns)
+        return buffer.getvalue()
+
+    return generate
+
+# Page sizes offered for result tables
+PAGE_SIZES = [25, 50, 100, 250, 500]
+
+# Function to show one page of rows with server-side sorting; only the visible
+# slice of the table is serialized and sent to the browser
+def paged_dataframe(data, rows, columns, key, height=400, inline=True):
+    controls = st.columns(4) if inline else [st.container()] * 4
+    sort_column = controls[0].selectbox("Sort by:", ["(current order)"] + columns, key=f"{key}_sort")
+    descending = controls[1].selectbox("Order:", ["Ascending", "Descending"], key=f"{key}_order") == "Descending"
+    page_size = controls[2].selectbox("Rows per page:", PAGE_SIZES, index=1, key=f"{key}_page_size")
+    page_count = max(1, -(-len(rows) // page_size))
+    # Keep the page number valid when the result set shrinks
+    page_key = f"{key}_page"
+    if st.session_state.get(page_key, 1) > page_count:
+        st.session_state[page_key] = page_count
+    page = controls[3].number_input(f"Page (of {page_count:,}):", min_value=1, max_value=page_count, step=1, key=page_key)
+
+    if sort_column != "(current order)":
+        rows = sort_rows(data, rows, sort_column, ascending=not descending)
+    start = (page - 1) * page_size
+    page_rows = rows[start:start + page_size]
+    st.dataframe(take_rows(data, page_rows, columns), use_container_width=True, height=height)
+    st.caption(f"Showing rows {start + 1 if len(page_rows) else 0:,}–{start + len(page_rows):,} of {len(rows):,}")
+
+# Memoized Plotly figures, shared across sessions and keyed by dataset version,
+# chart id and the chart's parameters; `_build` only runs on a cache miss
+@st.cache_resource(max_entries=64)
+def memoized_figure(version, chart_id, params, _build):
+    telemetry.count("figure_cache_miss")
+    with telemetry.stage(f"chart: {chart_id}"):
+        return _build()
+
+# Function to get a memoized figure, counting cache lookups for the telemetry
+def cached_figure(version, chart_id, params, _build):
+    telemetry.count("figure_request")
+    return memoized_figure(version, chart_id, params, _build)
+
+# Tables behind the analytics sections kept per process; the least recently shown are
+# dropped beyond it
+VIEW_CACHE_BYTES = 32 * 1024 * 1024
+
+# Process-wide cache of the tables shown next to the charts, shared across sessions
+@st.cache_resource
+def view_cache():
+    cache = ResultCache(VIEW_CACHE_BYTES, name="view_cache")
+    telemetry.register_gauges("views", cache.gauges)
+    return cache
+
+# Function to return a memoized table, keyed by dataset version, filter state (None
+# for dataset-wide views), view id and the view's parameters; `build` only runs on a miss
+def memoized_view(version, query_key, view_id, params, build):
+    cache = view_cache()
+    key = (version, query_key, view_id, params)
+    found, table = cache.get(key)
+    if not found:
+        with telemetry.stage(f"view: {view_id}"):
+            table = build()
+        cache.put(key, table)
+    return table
+
+# Column-wise view; a fragment, so picking another column only reruns this section
+@st.fragment
+def column_view(dataset, result_rows, query_key):
+    st.markdown('<h2 class="sub-header">Column-wise View and Analysis</h2>', unsafe_allow_html=True)
+    
+    if len(result_rows):
+        # Create column selector with improved visualization
+        col1, col2 = st.columns([1, 2])
+        
+        with col1:
+            selected_column = st.selectbox(
+                "Select column to analyze:",
+                options=dataset.data.columns.tolist()
+            )
+            
+            # Display one page of the selected column data
+            paged_dataframe(dataset.data, result_rows, [selected_column], key="column_view", height=300, inline=False)
+        
+        # Only the analyzed column of the matching rows is gathered, and only when its
+        # chart or summary is not cached for this result set yet
+        col_data = functools.cache(lambda: take_rows(dataset.data, result_rows, [selected_column]))
+        with col2:
+            # Show visualizations based on column type - enhanced feature
+            if pd.api.types.is_numeric_dtype(dataset.data[selected_column]):
+                st.write("📊 Data Distribution:")
+                fig = cached_figure(dataset.version, "column_histogram", (query_key, selected_column),
+                                    lambda: charts.column_histogram(col_data(), selected_column))
+                st.plotly_chart(fig, use_container_width=True)
+                
+                # Show basic statistics for numeric columns
+                st.write("📈 Basic Statistics:")
+                stats = memoized_view(dataset.version, query_key, "column_stats", selected_column,
+                                      lambda: col_data().describe())
+                st.dataframe(stats)
+            else:
+                # For categorical columns, show value counts with visualization
+                fig = cached_figure(dataset.version, "column_frequency", (query_key, selected_column),
+                                    lambda: charts.column_frequency_chart(col_data(), selected_column))
+                st.plotly_chart(fig, use_container_width=True)
+                
+                # Show unique values count
+                st.metric("Unique Values", memoized_view(dataset.version, query_key, "column_unique", selected_column,
+                                                         lambda: col_data()[selected_column].nunique()))
+
+# Department analytics; a fragment, so moving the slider only reruns this section
+@st.fragment
+def department_analytics(dataset):
+    st.markdown('<h2 class="sub-header">Department-wise Equipment Distribution</h2>', unsafe_allow_html=True)
+
+    # Count equipment per department from the precomputed aggregates
+    with telemetry.stage("aggregate: departments"):
+        dept_counts = dataset.aggregates.counts("department")
+    
+    # Allow user to limit the number of departments shown
+    with st.expander("Chart Settings"):
+        top_n_depts = st.slider(
+            "Number of departments to display:", 
+            min_value=5, 
+            max_value=len(dept_counts), 
+            value=min(10, len(dept_counts)),
+            step=1
+        )
+    
+    # Get top N departments
+    top_depts = dept_counts.nlargest(top_n_depts)
+    
+    # Create horizontal bar chart with improved design
+    st.plotly_chart(cached_figure(dataset.version, "department_counts", (top_n_depts,),
+                                 lambda: charts.department_counts_chart(top_depts)),
+                    use_container_width=True)
+
+    # Department equipment value analysis with interactive features
+    if dataset.aggregates.has_cost:
+        with telemetry.stage("aggregate: department values"):
+            top_value_depts = dataset.aggregates.cost_totals("department").head(top_n_depts)
+
+        st.plotly_chart(cached_figure(dataset.version, "department_values", (top_n_depts,),
+                                     lambda: charts.department_values_chart(top_value_depts, top_n_depts)),
+                        use_container_width=True)
+        
+        # Add a pie chart for department budget allocation - new visualization
+        with st.expander("Department Budget Allocation", expanded=False):
+            st.plotly_chart(cached_figure(dataset.version, "department_budget", (top_n_depts,),
+                                         lambda: charts.department_budget_chart(top_value_depts, top_n_depts)),
+                            use_container_width=True)
+
+    # Equipment mix of the top departments from the precomputed cross-tab, unstacked
+    # once per dataset version and department count
+    with st.expander("Equipment Mix per Department", expanded=False):
+        st.dataframe(
+            memoized_view(dataset.version, None, "department_mix", (top_n_depts,), lambda: dataset.aggregates.crosstab(
+                top_depts.index, dataset.aggregates.counts("equipment").head(15).index)),
+            use_container_width=True
+        )
+
+# Equipment analytics over the whole dataset; every figure depends only on the dataset version
+def equipment_analytics(dataset):
+    data = dataset.data
+    st.markdown('<h2 class="sub-header">Equipment Analytics and Distribution</h2>', unsafe_allow_html=True)
+
+    # Create two columns for layout
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        # Equipment type distribution - horizontal bar chart with enhanced visuals
+        st.plotly_chart(cached_figure(dataset.version, "equipment_counts", (), lambda: charts.top_counts_chart(
+            dataset.aggregates.counts("equipment").head(15), 'Equipment Type', 'Top 15 Most Common Equipment Types', 'Purples')),
+                        use_container_width=True)
+    
+    with col2:
+        # Measurement purpose distribution with enhanced visualization
+        st.plotly_chart(cached_figure(dataset.version, "measure_counts", (), lambda: charts.top_counts_chart(
+            dataset.aggregates.counts("measure").head(15), 'Measurement Purpose', 'Top 15 Measurement Purposes', 'Oranges')),
+                        use_container_width=True)
+
+    # Add equipment age analysis if date information is available; Age is derived at load time
+    cost_column = dataset.columns["cost"]
+    if dataset.columns["purchase_date"] is not None and 'Age' in data.columns:
+        st.markdown('<h3 class="sub-header">Equipment Age Analysis</h3>', unsafe_allow_html=True)
+        
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            # Age distribution histogram with box plot
+            fig_age = cached_figure(dataset.version, "age_histogram", (), lambda: charts.age_histogram(data))
+            st.plotly_chart(fig_age, use_container_width=True)
+        
+        with col2:
+            # Equipment value vs age scatter plot - new visualization
+            if cost_column is not None:
+                fig_value_age = cached_figure(dataset.version, "value_vs_age", (), lambda: charts.value_vs_age_chart(
+                    data, cost_column, dataset.columns["equipment"]))
+                st.plotly_chart(fig_value_age, use_container_width=True)
+
+# Function to list the dropdown options still reachable under the other filters,
+# with their row counts; the current selection is always kept
+def reachable_options(facet, counts, selected):
+    option_counts = {option: count for option, count in zip(facet.options, counts.tolist()) if count > 0 or option == selected}
+    option_counts["All"] = int(counts.sum())
+    return ["All"] + [option for option in facet.options if option in option_counts], option_counts
+
+# Function to show the telemetry: per-stage timings (the latest run and totals since
+# the server started), event counters and gauges such as peak memory
+def telemetry_panel():
+    with st.sidebar.expander("📈 Performance telemetry", expanded=True):
+        stages = pd.DataFrame([
+            {
+                "Stage": name,
+                "Calls": stats.calls,
+                "Last (ms)": stats.last_seconds * 1000,
+                "Mean (ms)": stats.seconds / stats.calls * 1000,
+                "Max (ms)": stats.max_seconds * 1000,
+                "Rows in": stats.rows_in,
+                "Rows out": stats.rows_out,
+            }
+            for name, stats in sorted(telemetry.stages.items())
+        ])
+        st.dataframe(stages, hide_index=True, use_container_width=True)
+        st.dataframe(pd.Series(telemetry.counters, name="Count", dtype="int64"), use_container_width=True)
+        gauges = telemetry.gauges()
+        if "peak_memory_bytes" in gauges:
+            st.metric("Peak memory", f"{gauges['peak_memory_bytes'] / 1e6:,.0f} MB")
+        st.download_button("Download metrics", telemetry.prometheus_text(), file_name="metrics.prom",
+                           mime="text/plain", on_click="ignore")
+
+# Function to request a forced refresh on the next run
+def request_refresh():
+    st.session_state.force_refresh = True
+
 # Function to reset filters
 def reset_filters():
     if 'reset' not in st.session_state:
@@ -113,12 +422,51 @@ def metric_card(title, value, delta=None):
     </div>
     """, unsafe_allow_html=True)
 
+# Maximum number of options offered by the equipment details selector
+MAX_DETAIL_OPTIONS = 200
+
+# Function to render the details of one equipment row as a single HTML card
+def equipment_detail_card(row, columns, dark_mode):
+    border = f"border-bottom: 1px solid {'#444' if dark_mode else '#ddd'};"
+    shown = (columns["equipment"], columns["department"], columns["measure"])
+    fields = [("Department", row[columns["department"]]), ("Measurement Purpose", row[columns["measure"]])]
+    fields += [(name, value) for name, value in row.items() if name not in shown and pd.notna(value)]
+    rows_html = "".join(
+        f'<tr><td style="padding: 8px; {border} width: 30%;"><strong>{html.escape(str(name))}:</strong></td>'
+        f'<td style="padding: 8px; {border}">{html.escape(str(value))}</td></tr>'
+        for name, value in fields
+    )
+    return f"""
+    <div style="background-color: {'#1E1E1E' if dark_mode else '#f8f9fa'}; padding: 20px; border-radius: 10px; margin-top: 20px;">
+        <h3 style="color: {'#90CAF9' if dark_mode else '#1E88E5'};">{html.escape(str(row[columns["equipment"]]))}</h3>
+        <table style="width: 100%; border-collapse: collapse;">{rows_html}</table>
+    </div>
+    """
+
+# Function to list the equipment most similar to one row, optionally only from other
+# departments, as a table with a similarity score per row
+def similar_equipment(dataset, position, other_departments):
+    candidates = None
+    if other_departments:
+        codes = dataset.facet_index.facets["department"].codes
+        candidates = codes != codes[position]
+    with telemetry.stage("similar items", rows_in=1) as stage:
+        rows, scores = dataset.similarity_index.similar([position], SIMILARITY_DEFAULT_TOP, candidates)[0]
+        stage.rows_out = len(rows)
+    columns = dataset.columns
+    shown = [columns[role] for role in ("equipment", "department", "measure") if columns[role] is not None]
+    similar = take_rows(dataset.data, rows, shown).reset_index(drop=True)
+    similar.insert(0, "Similarity", scores)
+    return similar
+
 # Initialize session state for filters
 if 'reset' in st.session_state and st.session_state.reset:
     st.session_state.equipment_search = "All"
     st.session_state.school_department_search = "All"
     st.session_state.measure_search = "All"
     st.session_state.text_search = ""
+    st.session_state.search_columns = []
+    st.session_state.fuzzy_search = False
     st.session_state.dark_mode = False
     st.session_state.reset = False
 elif 'equipment_search' not in st.session_state:
@@ -126,6 +474,8 @@ elif 'equipment_search' not in st.session_state:
     st.session_state.school_department_search = "All"
     st.session_state.measure_search = "All"
     st.session_state.text_search = ""
+    st.session_state.search_columns = []
+    st.session_state.fuzzy_search = False
     st.session_state.dark_mode = False
 
 # App header with logo and improved title
@@ -136,29 +486,27 @@ with col_title:
     st.markdown('<h1 class="main-header">Dhanalakshmi Srinivasan University<br>Laboratory Equipment Search System</h1>', unsafe_allow_html=True)
     st.markdown('<p style="color:#666">Version 1.0 - Search and analyze laboratory equipment across all departments</p>', unsafe_allow_html=True)
 
-# Display a progress bar for better loading UX
+# Display a progress bar only while data is actually being loaded
 with st.spinner("Loading laboratory equipment data..."):
-    progress_bar = st.progress(0)
-    
-    # Google Sheets link
-    sheet_url = "https://docs.google.com/spreadsheets/d/13TE6wJbMV9iDaQaBIKoQOG9rHavqQZKq/export?format=xlsx"
+    progress_area = st.empty()
 
     try:
-        # Simulate loading for better UX
-        for i in range(100):
-            time.sleep(0.01)
-            progress_bar.progress(i + 1)
-        
-        # Download the data from the Google Sheets link
-        response = requests.get(sheet_url)
-        response.raise_for_status()
-
-        # Read the Excel file into a DataFrame
-        data = pd.read_excel(BytesIO(response.content))
+        # Get the data from the shared cache, downloading it only when stale
+        dataset_cache = get_dataset_cache()
+        lookup_started = time.perf_counter()
+        dataset = dataset_cache.get(
+            force=st.session_state.pop('force_refresh', False),
+            progress=make_progress_reporter(progress_area)
+        )
+        lookup_seconds = time.perf_counter() - lookup_started
+        data = dataset.data
         
         # Clear the progress bar after loading
-        progress_bar.empty()
-        st.success("Data loaded successfully!")
+        progress_area.empty()
+        if dataset_cache.last_error is not None:
+            st.warning(f"Showing the last successfully loaded data; the sheet could not be refreshed: {dataset_cache.last_error}")
+        else:
+            st.success("Data loaded successfully!")
         
         # Dark mode toggle in sidebar
         st.sidebar.markdown('<div class="sidebar-content">', unsafe_allow_html=True)
@@ -199,20 +547,57 @@ with st.spinner("Loading laboratory equipment data..."):
             "Search by keyword:",
             value=st.session_state.text_search,
             key="text_search",
-            help="Search across all fields"
+            help="Matches words starting with each search term; all terms must match"
+        )
+        fuzzy_search = st.sidebar.checkbox(
+            "Typo-tolerant ranked search",
+            key="fuzzy_search",
+            help="Rank results by relevance over equipment name, department and measurement purpose, tolerating misspellings"
+        )
+        # Drop scoped columns that no longer exist after a dataset refresh
+        st.session_state.search_columns = [c for c in st.session_state.search_columns if c in dataset.source_columns]
+        search_columns = st.sidebar.multiselect(
+            "Search in columns:",
+            options=dataset.source_columns,
+            key="search_columns",
+            disabled=fuzzy_search,
+            help="Leave empty to search across all fields"
         )
 
-        # Extract relevant columns for search functionality
-        equipment_names = sorted(data.iloc[:, 1].dropna().unique().tolist())
-        schools_departments = sorted(data.iloc[:, 2].dropna().unique().tolist())
-        measures = sorted(data.iloc[:, 14].dropna().unique().tolist())
+        # Text search through the prebuilt keyword index, or ranked by relevance in fuzzy mode;
+        # results of queries any session ran before come from the shared result cache
+        matching_rows = filter_rows(dataset, text_search, fuzzy_search, search_columns)
+
+        # Dropdown options come from the categories precomputed at load time
+        facets = dataset.facet_index.facets
+
+        # Drop selections that no longer exist after a dataset refresh
+        for key, name in [("equipment_search", "equipment"),
+                          ("school_department_search", "department"),
+                          ("measure_search", "measure")]:
+            if st.session_state[key] != "All" and st.session_state[key] not in facets[name].options:
+                st.session_state[key] = "All"
+
+        # Count the options of each dropdown under the search and the other dropdowns
+        with telemetry.stage("option counts", rows_in=len(data) if matching_rows is None else len(matching_rows)):
+            facet_counts = dataset.facet_index.option_counts({
+                "equipment": st.session_state.equipment_search,
+                "department": st.session_state.school_department_search,
+                "measure": st.session_state.measure_search,
+            }, matching_rows)
+        equipment_names, equipment_option_counts = reachable_options(
+            facets["equipment"], facet_counts["equipment"], st.session_state.equipment_search)
+        schools_departments, department_option_counts = reachable_options(
+            facets["department"], facet_counts["department"], st.session_state.school_department_search)
+        measures, measure_option_counts = reachable_options(
+            facets["measure"], facet_counts["measure"], st.session_state.measure_search)
 
         # Dropdown search for equipment name
         equipment_search = st.sidebar.selectbox(
             "Filter by Equipment Name:",
-            ["All"] + equipment_names,
-            index=0 if st.session_state.equipment_search == "All" else equipment_names.index(
-                st.session_state.equipment_search) + 1,
+            equipment_names,
+            index=equipment_names.index(st.session_state.equipment_search),
+            format_func=lambda option: f"{option} ({equipment_option_counts[option]:,})",
             key="equipment_search",
             help="Select specific equipment type"
         )
@@ -220,9 +605,9 @@ with st.spinner("Loading laboratory equipment data..."):
         # Dropdown search for school/department
         school_department_search = st.sidebar.selectbox(
             "Filter by School/Department:",
-            ["All"] + schools_departments,
-            index=0 if st.session_state.school_department_search == "All" else schools_departments.index(
-                st.session_state.school_department_search) + 1,
+            schools_departments,
+            index=schools_departments.index(st.session_state.school_department_search),
+            format_func=lambda option: f"{option} ({department_option_counts[option]:,})",
             key="school_department_search",
             help="Select specific department"
         )
@@ -230,9 +615,9 @@ with st.spinner("Loading laboratory equipment data..."):
         # Dropdown search for what to measure
         measure_search = st.sidebar.selectbox(
             "Filter by Measurement Purpose:",
-            ["All"] + measures,
-            index=0 if st.session_state.measure_search == "All" else measures.index(
-                st.session_state.measure_search) + 1,
+            measures,
+            index=measures.index(st.session_state.measure_search),
+            format_func=lambda option: f"{option} ({measure_option_counts[option]:,})",
             key="measure_search",
             help="Select what the equipment measures"
         )
@@ -252,32 +637,41 @@ with st.spinner("Loading laboratory equipment data..."):
             4. **Download**: Export filtered data as CSV or Excel
             """)
             
+        # Manual refresh control for the shared dataset cache
+        st.sidebar.button("🔄 Refresh data now", on_click=request_refresh, help="Check the Google Sheet for changes now")
+        st.sidebar.caption(f"Data checked at {time.strftime('%H:%M:%S', time.localtime(dataset_cache.checked_at))}")
+        with st.sidebar.expander("⏱️ Load timings"):
+            st.markdown(f"Cache lookup (this run): {lookup_seconds * 1000:.1f} ms")
+            st.markdown(f"Result cache: {len(result_cache):,} entries, "
+                        f"{result_cache.bytes / 1e6:.1f} MB, {result_cache.hit_rate():.0%} hits")
+            for stage, seconds in dataset.timings.items():
+                st.markdown(f"{stage}: {seconds * 1000:.1f} ms")
+
+        # Admin panel with the process-wide telemetry; open the page with ?admin=1
+        if telemetry.enabled and st.query_params.get("admin") == "1":
+            telemetry_panel()
+
         # Add contact information
         st.sidebar.markdown("---")
         st.sidebar.markdown("📧 For support: support@dsu.edu")
         st.sidebar.markdown("🔄 Last updated: April 2025")
         st.sidebar.markdown('</div>', unsafe_allow_html=True)  # Close sidebar content
 
-        # Filter data based on search inputs
-        filtered_data = data.copy()
-
-        # Text search across all columns - new feature
-        if text_search:
-            text_filter = filtered_data.astype(str).apply(
-                lambda x: x.str.contains(text_search, case=False)
-            ).any(axis=1)
-            filtered_data = filtered_data[text_filter]
-
-        # Apply other filters
-        if equipment_search != "All":
-            filtered_data = filtered_data[filtered_data.iloc[:, 1].fillna('').str.contains(equipment_search, case=False)]
-
-        if school_department_search != "All":
-            filtered_data = filtered_data[
-                filtered_data.iloc[:, 2].fillna('').str.contains(school_department_search, case=False)]
-
-        if measure_search != "All":
-            filtered_data = filtered_data[filtered_data.iloc[:, 14].fillna('').str.contains(measure_search, case=False)]
+        # Apply the dropdown filters as exact category matches
+        matching_rows = filter_rows(dataset, text_search, fuzzy_search, search_columns, {
+            "equipment": equipment_search,
+            "department": school_department_search,
+            "measure": measure_search,
+        })
+        # The result is only a row position array over the shared frame
+        result_rows = dataset.positions(matching_rows)
+
+        # Identifies this result set for the export and figure caches
+        query_key = normalized_query(text_search, fuzzy_search, search_columns, {
+            "equipment": equipment_search,
+            "department": school_department_search,
+            "measure": measure_search,
+        })
 
         # Create tabs for different views with enhanced styling and icons
         tab1, tab2, tab3, tab4, tab5 = st.tabs([
@@ -291,302 +685,104 @@ with st.spinner("Loading laboratory equipment data..."):
         with tab1:
             st.markdown('<h2 class="sub-header">Filtered Results - Full Table View</h2>', unsafe_allow_html=True)
             
-            if not filtered_data.empty:
+            if len(result_rows):
                 # Add column selection with better UX
                 with st.expander("Select columns to display", expanded=True):
                     cols_to_display = st.multiselect(
                         "Choose columns:",
-                        options=filtered_data.columns.tolist(),
-                        default=filtered_data.columns.tolist()[:5]  # Show first 5 columns by default
+                        options=data.columns.tolist(),
+                        default=data.columns.tolist()[:5]  # Show first 5 columns by default
                     )
 
-                # Display selected columns with horizontal scrolling
+                # Display one page of the selected columns with horizontal scrolling
                 if cols_to_display:
-                    st.dataframe(
-                        filtered_data[cols_to_display],
-                        use_container_width=True,
-                        height=400
-                    )
-
-                    # Add download options with improved UI
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        csv = filtered_data[cols_to_display].to_csv(index=False)
-                        st.download_button(
-                            label="📥 Download as CSV",
-                            data=csv,
-                            file_name="filtered_equipment_data.csv",
-                            mime="text/csv",
-                        )
-                    with col2:
-                        excel_buffer = BytesIO()
-                        filtered_data[cols_to_display].to_excel(excel_buffer, index=False)
-                        excel_data = excel_buffer.getvalue()
-                        st.download_button(
-                            label="📥 Download as Excel",
-                            data=excel_data,
-                            file_name="filtered_equipment_data.xlsx",
-                            mime="application/vnd.ms-excel",
-                        )
+                    paged_dataframe(data, result_rows, cols_to_display, key="table")
+
+                    # Add download options; files are only generated when a button is clicked
+                    for column, (export_format, (suffix, mime)) in zip(st.columns(len(EXPORT_FORMATS)), EXPORT_FORMATS.items()):
+                        with column:
+                            st.download_button(
+                                label=f"📥 Download as {export_format}",
+                                data=lazy_export(dataset.version, query_key, data, result_rows, cols_to_display, export_format),
+                                file_name=f"filtered_equipment_data{suffix}",
+                                mime=mime,
+                                on_click="ignore",
+                            )
                 else:
                     st.info("👆 Please select at least one column to display")
             else:
                 st.warning("🔍 No matching records found. Try adjusting your filters.")
 
         with tab2:
-            st.markdown('<h2 class="sub-header">Column-wise View and Analysis</h2>', unsafe_allow_html=True)
-            
-            if not filtered_data.empty:
-                # Create column selector with improved visualization
-                col1, col2 = st.columns([1, 2])
-                
-                with col1:
-                    selected_column = st.selectbox(
-                        "Select column to analyze:",
-                        options=filtered_data.columns.tolist()
-                    )
-                    
-                    # Display selected column data
-                    col_data = filtered_data[[selected_column]]
-                    st.dataframe(
-                        col_data,
-                        use_container_width=True,
-                        height=300
-                    )
-                
-                with col2:
-                    # Show visualizations based on column type - enhanced feature
-                    if pd.api.types.is_numeric_dtype(filtered_data[selected_column]):
-                        st.write("📊 Data Distribution:")
-                        fig = px.histogram(
-                            filtered_data, 
-                            x=selected_column,
-                            nbins=20,
-                            title=f"Distribution of {selected_column}",
-                            color_discrete_sequence=['#1E88E5']
-                        )
-                        st.plotly_chart(fig, use_container_width=True)
-                        
-                        # Show basic statistics for numeric columns
-                        st.write("📈 Basic Statistics:")
-                        stats = col_data.describe()
-                        st.dataframe(stats)
-                    else:
-                        # For categorical columns, show value counts with visualization
-                        value_counts = filtered_data[selected_column].value_counts().reset_index()
-                        value_counts.columns = [selected_column, 'Count']
-                        
-                        fig = px.bar(
-                            value_counts,
-                            y=selected_column,
-                            x='Count',
-                            title=f"Frequency of {selected_column} Values",
-                            orientation='h',
-                            color_discrete_sequence=['#1E88E5']
-                        )
-                        fig.update_layout(height=min(500, len(value_counts) * 25 + 100))
-                        st.plotly_chart(fig, use_container_width=True)
-                        
-                        # Show unique values count
-                        st.metric("Unique Values", filtered_data[selected_column].nunique())
+            column_view(dataset, result_rows, query_key)
 
         with tab3:
-            st.markdown('<h2 class="sub-header">Department-wise Equipment Distribution</h2>', unsafe_allow_html=True)
-
-            # Count equipment per department with enhanced visualization
-            dept_counts = data.iloc[:, 2].value_counts()
-            
-            # Allow user to limit the number of departments shown
-            with st.expander("Chart Settings"):
-                top_n_depts = st.slider(
-                    "Number of departments to display:", 
-                    min_value=5, 
-                    max_value=len(dept_counts), 
-                    value=min(10, len(dept_counts)),
-                    step=1
-                )
-            
-            # Get top N departments
-            top_depts = dept_counts.nlargest(top_n_depts)
-            
-            # Create horizontal bar chart with improved design
-            fig_dept = px.bar(
-                y=top_depts.index,
-                x=top_depts.values,
-                labels={'x': 'Number of Equipment', 'y': 'Department'},
-                title=f'Equipment Distribution Across Top {top_n_depts} Departments',
-                orientation='h',
-                color=top_depts.values,  # Color by count for better visualization
-                color_continuous_scale='Blues',  # Blue color scale
-                text=top_depts.values  # Display values on bars
-            )
-            fig_dept.update_layout(
-                showlegend=False,
-                height=max(400, top_n_depts * 30),  # Adjust height based on number of departments
-                coloraxis_showscale=False  # Hide color scale
-            )
-            fig_dept.update_traces(texttemplate='%{text}', textposition='outside')
-            st.plotly_chart(fig_dept, use_container_width=True)
-
-            # Department equipment value analysis with interactive features
-            if 'Cost' in data.columns:
-                dept_value = data.groupby(data.iloc[:, 2])['Cost'].sum().sort_values(ascending=True)
-                top_value_depts = dept_value.nlargest(top_n_depts)
-                
-                fig_value = px.bar(
-                    y=top_value_depts.index,
-                    x=top_value_depts.values,
-                    labels={'x': 'Total Equipment Value', 'y': 'Department'},
-                    title=f'Department-wise Equipment Value Distribution (Top {top_n_depts})',
-                    orientation='h',
-                    color=top_value_depts.values,
-                    color_continuous_scale='Greens',
-                    text=[f"₹{x:,.0f}" for x in top_value_depts.values]  # Format currency
-                )
-                fig_value.update_layout(
-                    height=max(400, top_n_depts * 30),
-                    coloraxis_showscale=False
-                )
-                fig_value.update_traces(textposition='outside')
-                st.plotly_chart(fig_value, use_container_width=True)
-                
-                # Add a pie chart for department budget allocation - new visualization
-                with st.expander("Department Budget Allocation", expanded=False):
-                    fig_pie = px.pie(
-                        values=top_value_depts.values,
-                        names=top_value_depts.index,
-                        title=f'Budget Allocation Across Top {top_n_depts} Departments',
-                        hole=0.4,  # Create a donut chart
-                        color_discrete_sequence=px.colors.sequential.Greens_r
-                    )
-                    fig_pie.update_traces(textposition='inside', textinfo='percent+label')
-                    st.plotly_chart(fig_pie, use_container_width=True)
+            department_analytics(dataset)
 
         with tab4:
-            st.markdown('<h2 class="sub-header">Equipment Analytics and Distribution</h2>', unsafe_allow_html=True)
-
-            # Create two columns for layout
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                # Equipment type distribution - horizontal bar chart with enhanced visuals
-                equipment_counts = data.iloc[:, 1].value_counts().head(15)
-                fig_equip = px.bar(
-                    y=equipment_counts.index,
-                    x=equipment_counts.values,
-                    labels={'x': 'Count', 'y': 'Equipment Type'},
-                    title='Top 15 Most Common Equipment Types',
-                    orientation='h',
-                    color=equipment_counts.values,
-                    color_continuous_scale='Purples',
-                    text=equipment_counts.values
-                )
-                fig_equip.update_layout(
-                    height=600,
-                    coloraxis_showscale=False
-                )
-                fig_equip.update_traces(texttemplate='%{text}', textposition='outside')
-                st.plotly_chart(fig_equip, use_container_width=True)
-            
-            with col2:
-                # Measurement purpose distribution with enhanced visualization
-                measure_counts = data.iloc[:, 14].value_counts().head(15)
-                fig_measure = px.bar(
-                    y=measure_counts.index,
-                    x=measure_counts.values,
-                    labels={'x': 'Count', 'y': 'Measurement Purpose'},
-                    title='Top 15 Measurement Purposes',
-                    orientation='h',
-                    color=measure_counts.values,
-                    color_continuous_scale='Oranges',
-                    text=measure_counts.values
-                )
-                fig_measure.update_layout(
-                    height=600,
-                    coloraxis_showscale=False
-                )
-                fig_measure.update_traces(texttemplate='%{text}', textposition='outside')
-                st.plotly_chart(fig_measure, use_container_width=True)
-
-            # Add equipment age analysis if date information is available
-            if 'Purchase Date' in data.columns:
-                st.markdown('<h3 class="sub-header">Equipment Age Analysis</h3>', unsafe_allow_html=True)
-                
-                data['Purchase Date'] = pd.to_datetime(data['Purchase Date'], errors='coerce')
-                data['Age'] = (pd.Timestamp.now() - data['Purchase Date']).dt.days / 365
-                
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    # Age distribution histogram with box plot
-                    fig_age = px.histogram(
-                        data.dropna(subset=['Age']),
-                        x='Age',
-                        nbins=20,
-                        title='Equipment Age Distribution (Years)',
-                        color_discrete_sequence=['#4527A0'],
-                        marginal="box"  # Add a box plot on the margin
-                    )
-                    st.plotly_chart(fig_age, use_container_width=True)
-                
-                with col2:
-                    # Equipment value vs age scatter plot - new visualization
-                    if 'Cost' in data.columns:
-                        fig_value_age = px.scatter(
-                            data.dropna(subset=['Age', 'Cost']),
-                            x='Age',
-                            y='Cost',
-                            title='Equipment Value vs Age',
-                            color='Age',
-                            size='Cost',
-                            hover_name=data.iloc[:, 1],  # Equipment name on hover
-                            color_continuous_scale='Viridis'
-                        )
-                        st.plotly_chart(fig_value_age, use_container_width=True)
-
+            equipment_analytics(dataset)
         # New tab for detailed equipment information
         with tab5:
             st.markdown('<h2 class="sub-header">Equipment Details</h2>', unsafe_allow_html=True)
             
-            if not filtered_data.empty:
-                # Create selection mechanism for individual equipment
-                equipment_list = filtered_data.iloc[:, 1].tolist()
-                selected_equipment = st.selectbox(
+            if len(result_rows):
+                # Narrow the candidates with the keyword index so only a bounded list reaches the browser
+                equipment_column = dataset.columns["equipment"]
+                department_column = dataset.columns["department"]
+                detail_search = st.text_input(
+                    "Find equipment:",
+                    key="detail_search",
+                    help="Type part of a name, department or any other detail to narrow the list below"
+                )
+                candidate_rows = result_rows
+                detail_matches = dataset.keyword_index.search(detail_search) if detail_search else None
+                if detail_matches is not None:
+                    candidate_rows = candidate_rows[np.isin(candidate_rows, detail_matches)]
+
+                option_rows = candidate_rows[:MAX_DETAIL_OPTIONS]
+                option_labels = {
+                    dataset.row_keys.key(position): f"{name} — {department} (#{dataset.row_keys.key(position)})"
+                    for position, name, department in zip(
+                        option_rows,
+                        data[equipment_column].iloc[option_rows],
+                        data[department_column].iloc[option_rows]
+                    )
+                }
+                if len(candidate_rows) > MAX_DETAIL_OPTIONS:
+                    st.caption(f"Showing the first {MAX_DETAIL_OPTIONS:,} of {len(candidate_rows):,} matches; refine the search to narrow the list")
+
+                # A selection left over from an earlier search (or None after one without
+                # matches) would stick to the keyed widget, so fall back to the first option
+                if st.session_state.get("detail_row") not in option_labels:
+                    st.session_state["detail_row"] = next(iter(option_labels), None)
+                selected_key = st.selectbox(
                     "Select equipment to view details:",
-                    options=equipment_list
+                    options=list(option_labels),
+                    format_func=lambda key: option_labels.get(key, key),
+                    key="detail_row"
                 )
-                
-                # Get the row for the selected equipment
-                equipment_data = filtered_data[filtered_data.iloc[:, 1] == selected_equipment].iloc[0]
-                
-                # Display equipment details in a more attractive format
-                st.markdown(f"""
-                <div style="background-color: {'#1E1E1E' if dark_mode else '#f8f9fa'}; padding: 20px; border-radius: 10px; margin-top: 20px;">
-                    <h3 style="color: {'#90CAF9' if dark_mode else '#1E88E5'};">{equipment_data.iloc[1]}</h3>
-                    <table style="width: 100%; border-collapse: collapse;">
-                        <tr>
-                            <td style="padding: 8px; border-bottom: 1px solid {'#444' if dark_mode else '#ddd'}; width: 30%;"><strong>Department:</strong></td>
-                            <td style="padding: 8px; border-bottom: 1px solid {'#444' if dark_mode else '#ddd'};">{equipment_data.iloc[2]}</td>
-                        </tr>
-                        <tr>
-                            <td style="padding: 8px; border-bottom: 1px solid {'#444' if dark_mode else '#ddd'};"><strong>Measurement Purpose:</strong></td>
-                            <td style="padding: 8px; border-bottom: 1px solid {'#444' if dark_mode else '#ddd'};">{equipment_data.iloc[14]}</td>
-                        </tr>
-                """, unsafe_allow_html=True)
-                
-                # Add all other equipment details
-                for i, col_name in enumerate(data.columns):
-                    if i not in [1, 2, 14]:  # Skip already displayed fields
-                        value = equipment_data.iloc[i]
-                        if pd.notna(value):  # Only show non-NA values
-                            st.markdown(f"""
-                            <tr>
-                                <td style="padding: 8px; border-bottom: 1px solid {'#444' if dark_mode else '#ddd'};"><strong>{col_name}:</strong></td>
-                                <td style="padding: 8px; border-bottom: 1px solid {'#444' if dark_mode else '#ddd'};">{value}</td>
-                            </tr>
-                            """, unsafe_allow_html=True)
-                
-                st.markdown("</table></div>", unsafe_allow_html=True)
+
+                # Look the row up by its key and render the card in one pass
+                if selected_key is not None:
+                    equipment_data = data.iloc[dataset.row_keys.position(selected_key)]
+                    st.markdown(equipment_detail_card(equipment_data, dataset.columns, dark_mode), unsafe_allow_html=True)
+
+                    # Comparable equipment anywhere in the university, regardless of the filters above
+                    st.markdown("#### Similar Equipment")
+                    other_departments = st.checkbox("Only show other departments", key="similar_other_departments")
+                    similar = similar_equipment(dataset, dataset.row_keys.position(selected_key), other_departments)
+                    if similar.empty:
+                        st.info("No similar equipment found")
+                    else:
+                        st.dataframe(
+                            similar,
+                            hide_index=True,
+                            use_container_width=True,
+                            column_config={"Similarity": st.column_config.ProgressColumn(
+                                "Similarity", min_value=0.0, max_value=1.0, format="%.2f")}
+                        )
+                else:
+                    st.info("No equipment matches this search")
                 
                 # Add maintenance history section if available
                 if 'Maintenance Date' in data.columns or 'Last Service Date' in data.columns:
@@ -601,18 +797,18 @@ with st.spinner("Loading laboratory equipment data..."):
         col1, col2, col3, col4 = st.columns(4)
 
         with col1:
-            metric_card("Total Equipment", f"{len(filtered_data):,}")
+            metric_card("Total Equipment", f"{len(result_rows):,}")
 
         with col2:
-            metric_card("Departments", f"{filtered_data.iloc[:, 2].nunique():,}")
+            metric_card("Departments", f"{dataset.facet_index.distinct_count('department', matching_rows):,}")
 
         with col3:
-            metric_card("Equipment Types", f"{filtered_data.iloc[:, 1].nunique():,}")
+            metric_card("Equipment Types", f"{dataset.facet_index.distinct_count('equipment', matching_rows):,}")
             
         with col4:
             # Calculate percentage of total equipment
-            if not filtered_data.empty and not data.empty:
-                percentage = (len(filtered_data) / len(data)) * 100
+            if len(result_rows) and not data.empty:
+                percentage = (len(result_rows) / len(data)) * 100
                 metric_card("% of Total", f"{percentage:.1f}%")
             else:
                 metric_card("% of Total", "0%")
@@ -626,9 +822,13 @@ with st.spinner("Loading laboratory equipment data..."):
         </div>
         """, unsafe_allow_html=True)
 
-    except requests.exceptions.RequestException as e:
+    except OSError as e:
+        # Network and HTTP errors from requests are OSErrors too
         st.error(f"Failed to download data from Google Sheets: {e}")
         st.info("Please check your internet connection and try again later.")
+    except SchemaError as e:
+        st.error(f"The sheet layout is not recognised: {e}")
+        st.info("Please contact the IT department for assistance.")
     except pd.errors.EmptyDataError:
         st.error("The downloaded file contains no data.")
     except pd.errors.ParserError:
@@ -636,3 +836,6 @@ with st.spinner("Loading laboratory equipment data..."):
     except Exception as e:
         st.error(f"An unexpected error occurred: {e}")
         st.info("Please contact the IT department for assistance.")
+
+# Record this run's wall time
+telemetry.record("rerun", time.perf_counter() - rerun_started)
@@ -0,0 +1,290 @@
+# JSON API over the equipment search engine, for systems that need to query the
+# inventory without going through the Streamlit front end. Run it with
+#   python dslab_api.py        or        uvicorn dslab_api:app --workers 4
+# With several workers, set DSLAB_SHARED_DATASET=1 so they attach to one shared copy
+# of the dataset and its indexes; python dslab_api.py does so when DSLAB_API_WORKERS > 1.
+
+import contextlib
+import json
+import logging
+import os
+import numpy as np
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.exceptions import HTTPException
+from starlette.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from dslab_engine import (
+    FACET_ROLES,
+    LOAD_ERRORS,
+    SIMILARITY_DEFAULT_TOP,
+    DatasetCache,
+    filter_rows,
+    result_cache,
+    sort_rows,
+    take_rows,
+)
+from dslab_telemetry import telemetry
+
+# Page size limits for JSON responses; NDJSON responses stream every matching row
+API_DEFAULT_LIMIT = 50
+API_MAX_LIMIT = 1000
+NDJSON_CHUNK_ROWS = 1000
+TRUE_VALUES = ("1", "true", "yes", "on")
+# Sorts and JSON pages over more rows than these run in the thread pool. A sort of 200k
+# rows takes 25-55 ms and a 1,000-row page about 6 ms, which would otherwise stall
+# every other request on the worker; smaller ones are cheaper than the thread hop.
+THREADPOOL_SORT_ROWS = 10_000
+THREADPOOL_RECORD_ROWS = 250
+
+# Startup problems go through logging, which uvicorn configures
+logger = logging.getLogger(__name__)
+
+# One cache per worker process over the configured sources, revalidated like the one
+# behind the Streamlit app
+dataset_cache = DatasetCache()
+telemetry.register_gauges("dataset", dataset_cache.gauges)
+
+# Function to time a request handler as an "api: <name>" stage; handlers are left
+# untouched when telemetry is disabled
+def timed(handler):
+    if not telemetry.enabled:
+        return handler
+
+    async def timed_handler(request):
+        with telemetry.stage(f"api: {handler.__name__}"):
+            return await handler(request)
+
+    return timed_handler
+
+# Function to get the current dataset. A fresh dataset is returned straight away;
+# loading and revalidation block on the network, so they run in the thread pool.
+async def current_dataset():
+    if dataset_cache.is_fresh():
+        return dataset_cache.dataset
+    try:
+        return await run_in_threadpool(dataset_cache.get)
+    except LOAD_ERRORS as e:
+        raise HTTPException(503, f"Equipment data is not available: {e}")
+
+# Function to run blocking work in the thread pool when it is `large`, else inline
+async def run_sized(large, work, *args):
+    if large:
+        return await run_in_threadpool(work, *args)
+    return work(*args)
+
+# Function to read a non-negative integer query parameter
+def int_param(request, name, default, maximum=None):
+    value = request.query_params.get(name)
+    if value is None or value == "":
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise HTTPException(400, f"'{name}' must be an integer")
+    if number < 0:
+        raise HTTPException(400, f"'{name}' must not be negative")
+    return min(number, maximum) if maximum is not None else number
+
+# Function to read a comma-separated list of column names, checked against `allowed`
+def columns_param(request, name, allowed):
+    value = request.query_params.get(name, "")
+    columns = [column.strip() for column in value.split(",") if column.strip()]
+    unknown = [column for column in columns if column not in allowed]
+    if unknown:
+        raise HTTPException(400, f"unknown column(s) in '{name}': {', '.join(unknown)}")
+    return columns
+
+# Function to read the dropdown filters; parameters are named after the facet roles
+def facet_selections(request):
+    return {role: request.query_params.get(role, "All") or "All" for role in FACET_ROLES}
+
+# Function to resolve the text search and filters of a request to row positions;
+# None means every row matches
+def matching_rows(request, dataset):
+    fuzzy = request.query_params.get("fuzzy", "").lower() in TRUE_VALUES
+    search_columns = columns_param(request, "columns", dataset.source_columns)
+    return filter_rows(dataset, request.query_params.get("q", ""), fuzzy, search_columns, facet_selections(request))
+
+# Function to turn row positions into records, keyed by row key, as a JSON array or JSON lines
+def records_json(dataset, rows, fields, lines=False):
+    frame = take_rows(dataset.data, rows, fields)
+    frame.insert(0, "_key", dataset.row_keys.keys(rows))
+    if lines:
+        text = frame.to_json(orient="records", lines=True, date_format="iso", force_ascii=False)
+        return text if text.endswith("\n") or not text else text + "\n"
+    return frame.to_json(orient="records", date_format="iso", force_ascii=False)
+
+# GET /health: dataset version and load state
+async def health(request):
+    dataset = await current_dataset()
+    return JSONResponse({
+        "status": "ok",
+        "version": dataset.version,
+        "rows": len(dataset.data),
+        "loaded_at": dataset.loaded_at,
+        "checked_at": dataset_cache.checked_at,
+        "last_error": str(dataset_cache.last_error) if dataset_cache.last_error else None,
+        "result_cache": {
+            "entries": len(result_cache),
+            "bytes": result_cache.bytes,
+            "hit_rate": round(result_cache.hit_rate(), 4),
+        },
+    })
+
+# GET /search: keyword or fuzzy search plus dropdown filters, sorted and paginated.
+# Lookups in the prebuilt indexes run on the event loop; large sorts and pages go to
+# the thread pool. format=ndjson streams every matching row from `offset` as JSON
+# lines, produced in the thread pool by Starlette.
+async def search(request):
+    dataset = await current_dataset()
+    data = dataset.data
+    rows = matching_rows(request, dataset)
+    rows = dataset.positions(rows)
+    fields = columns_param(request, "fields", data.columns) or list(dataset.source_columns)
+
+    sort_column = request.query_params.get("sort")
+    if sort_column:
+        if sort_column not in data.columns:
+            raise HTTPException(400, f"unknown sort column: {sort_column}")
+        descending = request.query_params.get("order", "asc").lower() == "desc"
+        rows = await run_sized(len(rows) > THREADPOOL_SORT_ROWS, sort_rows, data, rows, sort_column, not descending)
+
+    offset = int_param(request, "offset", 0)
+    output_format = request.query_params.get("format", "json").lower()
+    if output_format == "ndjson":
+        limit = int_param(request, "limit", len(rows))
+        page = rows[offset:offset + limit]
+
+        def stream():
+            for start in range(0, len(page), NDJSON_CHUNK_ROWS):
+                yield records_json(dataset, page[start:start + NDJSON_CHUNK_ROWS], fields, lines=True)
+
+        return StreamingResponse(stream(), media_type="application/x-ndjson", headers={
+            "X-Dataset-Version": dataset.version,
+            "X-Total-Count": str(len(rows)),
+        })
+    if output_format != "json":
+        raise HTTPException(400, "'format' must be json or ndjson")
+
+    limit = int_param(request, "limit", API_DEFAULT_LIMIT, API_MAX_LIMIT)
+    page = rows[offset:offset + limit]
+    records = await run_sized(len(page) > THREADPOOL_RECORD_ROWS, records_json, dataset, page, fields)
+    body = (
+        f'{{"version": "{dataset.version}", "total": {len(rows)}, "offset": {offset}, '
+        f'"limit": {limit}, "rows": {records}}}'
+    )
+    return Response(body, media_type="application/json")
+
+# GET /facets: option counts of every dropdown under the search and the other filters
+async def facets(request):
+    dataset = await current_dataset()
+    selections = facet_selections(request)
+    rows = filter_rows(
+        dataset,
+        request.query_params.get("q", ""),
+        request.query_params.get("fuzzy", "").lower() in TRUE_VALUES,
+        columns_param(request, "columns", dataset.source_columns),
+    )
+    counts = dataset.facet_index.option_counts(selections, rows)
+    return JSONResponse({
+        "version": dataset.version,
+        "facets": {
+            role: {option: count for option, count in zip(dataset.facet_index.facets[role].options, counts[role].tolist()) if count > 0}
+            for role in counts
+        },
+    })
+
+# GET /aggregates/{facet}: dataset-wide row counts and cost totals per option
+async def aggregates(request):
+    dataset = await current_dataset()
+    facet = request.path_params["facet"]
+    if facet not in dataset.aggregates.columns:
+        raise HTTPException(404, f"unknown facet: {facet}")
+    top = int_param(request, "top", None)
+    counts = dataset.aggregates.counts(facet)
+    result = {"version": dataset.version, "facet": facet, "counts": {str(option): int(count) for option, count in counts.head(top).items()}}
+    if dataset.aggregates.has_cost:
+        costs = dataset.aggregates.cost_totals(facet)
+        result["cost_totals"] = {str(option): float(total) for option, total in costs.head(top).items()}
+    return JSONResponse(result)
+
+# GET /rows/{key}: one row by its key (asset id when the sheet has one, else a hash of the row)
+async def row(request):
+    dataset = await current_dataset()
+    position = dataset.row_keys.position(request.path_params["key"])
+    if position is None:
+        raise HTTPException(404, f"no equipment with key {request.path_params['key']}")
+    fields = columns_param(request, "fields", dataset.data.columns) or list(dataset.source_columns)
+    records = records_json(dataset, np.array([position]), fields)
+    return Response(f'{{"version": "{dataset.version}", "row": {records[1:-1]}}}', media_type="application/json")
+
+# GET /rows/{key}/similar: the most similar equipment to one row, best first, each with
+# its similarity; other_departments=1 leaves out the row's own department
+async def similar(request):
+    dataset = await current_dataset()
+    position = dataset.row_keys.position(request.path_params["key"])
+    if position is None:
+        raise HTTPException(404, f"no equipment with key {request.path_params['key']}")
+    top = int_param(request, "top", SIMILARITY_DEFAULT_TOP, API_MAX_LIMIT)
+    fields = columns_param(request, "fields", dataset.data.columns) or list(dataset.source_columns)
+    candidates = None
+    if request.query_params.get("other_departments", "").lower() in TRUE_VALUES:
+        codes = dataset.facet_index.facets["department"].codes
+        candidates = codes != codes[position]
+    # The similarity index is built on first use, which takes seconds on a large sheet
+    rows, scores = (await run_in_threadpool(lambda: dataset.similarity_index.similar([position], top, candidates)))[0]
+    records = await run_sized(len(rows) > THREADPOOL_RECORD_ROWS, records_json, dataset, rows, fields)
+    body = (
+        f'{{"version": "{dataset.version}", "key": {json.dumps(dataset.row_keys.key(position))}, '
+        f'"similarity": {json.dumps(scores.astype(float).round(4).tolist())}, "rows": {records}}}'
+    )
+    return Response(body, media_type="application/json")
+
+# GET /metrics: this worker's telemetry in the Prometheus text format
+async def metrics(request):
+    if not telemetry.enabled:
+        raise HTTPException(404, "telemetry is disabled; set DSLAB_TELEMETRY=1")
+    return PlainTextResponse(telemetry.prometheus_text(), media_type="text/plain; version=0.0.4")
+
+# Errors are reported as JSON as well
+async def http_error(request, exc):
+    return JSONResponse({"error": exc.detail}, status_code=exc.status_code)
+
+# Load the dataset when a worker starts, so the first request does not wait for it
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    try:
+        await run_in_threadpool(dataset_cache.get)
+    except LOAD_ERRORS as e:
+        logger.warning("Equipment data could not be loaded at startup: %s", e)
+    yield
+
+app = Starlette(
+    routes=[
+        Route("/health", health),
+        Route("/search", timed(search)),
+        Route("/facets", timed(facets)),
+        Route("/aggregates/{facet}", timed(aggregates)),
+        Route("/rows/{key}", timed(row)),
+        Route("/rows/{key}/similar", timed(similar)),
+        Route("/metrics", metrics),
+    ],
+    exception_handlers={HTTPException: http_error},
+    lifespan=lifespan,
+)
+
+if __name__ == "__main__":
+    import uvicorn
+
+    workers = int(os.environ.get("DSLAB_API_WORKERS", "1"))
+    if workers > 1:
+        # Read by the engine when each worker process imports it
+        os.environ.setdefault("DSLAB_SHARED_DATASET", "1")
+    uvicorn.run(
+        "dslab_api:app",
+        host=os.environ.get("DSLAB_API_HOST", "127.0.0.1"),
+        port=int(os.environ.get("DSLAB_API_PORT", "8000")),
+        workers=workers,
+    )
@@ -0,0 +1,344 @@
+# Benchmarks for the equipment search engine on synthetic inventories that follow the
+# sheet's column layout. Every stage is timed separately and the results are written
+# as JSON, so runs can be compared and regressions caught:
+#
+#   python dslab_bench.py --rows 1000 10000 100000 1000000 -o bench.json
+#   python dslab_bench.py --rows 10000 --compare bench.json
+#
+# Generated workbooks are kept in the work directory and reused by later runs.
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from io import BytesIO
+import numpy as np
+import pandas as pd
+import plotly
+import pyarrow
+
+import dslab_charts as charts
+from dslab_engine import (
+    CACHE_DIR,
+    FACET_ROLES,
+    ResultCache,
+    SharedDatasetStore,
+    build_dataset,
+    filter_rows,
+    normalize_frame,
+    take_rows,
+    write_export,
+)
+
+# Larger sizes (e.g. --rows 1000000) are run on request
+DEFAULT_ROWS = (1_000, 10_000, 100_000)
+# Workbooks are written and parsed up to this many rows; beyond it the xlsx round trip
+# takes minutes and hundreds of MB, so the frame is generated directly
+XLSX_MAX_ROWS = 200_000
+DEFAULT_REPEAT = 5
+# A stage is reported as a regression when its median grows by this factor and by
+# at least this many seconds against the baseline
+REGRESSION_RATIO = 1.25
+REGRESSION_MIN_SECONDS = 0.005
+# Rows changed between the two versions timed by the refresh benchmark
+REFRESH_EDITED_ROWS = 10
+# Rows looked up together by the batched similar-items benchmark
+SIMILAR_BATCH_ROWS = 100
+# Part of the cached workbook names; bump it whenever the synthetic data or the way it
+# is written changes, so workbooks written by an older version are not reused
+WORKBOOK_FORMAT_VERSION = 3
+
+# Number of distinct values per dropdown column, close to the real inventory
+DEPARTMENTS = 40
+EQUIPMENT_TYPES = 600
+MEASURES = 60
+
+INSTRUMENTS = ["Centrifuge", "Spectrophotometer", "Microscope", "pH Meter", "Autoclave", "Oscilloscope",
+               "HPLC System", "Balance", "Incubator", "Fume Hood", "Thermocycler", "Water Bath", "Hot Plate",
+               "Viscometer", "Refractometer", "Colorimeter", "Multimeter", "Function Generator", "Laminar Flow",
+               "Hardness Tester"]
+VARIANTS = ["Digital", "Analytical", "Compound", "Benchtop", "Portable", "High Speed", "Refrigerated", "UV-Vis",
+            "Stereo", "Precision", "Micro", "Automatic", "Dual Channel", "Vertical", "Horizontal", "Mini",
+            "Research Grade", "Industrial", "Student", "Advanced", "Basic", "Fluorescence", "Magnetic", "Rotary",
+            "Programmable", "Semi-Micro", "Gel", "Vacuum", "Ultrasonic", "Infrared"]
+SUBJECTS = ["Physics", "Chemistry", "Biotechnology", "Microbiology", "Pharmacy", "Agriculture", "Civil Engineering",
+            "Mechanical Engineering", "Electrical Engineering", "Electronics", "Computer Science", "Food Technology",
+            "Nursing", "Allied Health", "Biochemistry", "Zoology", "Botany", "Environmental Science",
+            "Nanotechnology", "Genetics"]
+QUANTITIES = ["Absorbance", "Mass", "Temperature", "Voltage", "Current", "Resistance", "Viscosity", "Acidity",
+              "Magnification", "Separation", "Pressure", "Humidity", "Hardness", "Refractive Index", "Colour",
+              "Frequency", "Conductivity", "Density", "Flow Rate", "Sterilization"]
+QUALIFIERS = ["", "Micro ", "Trace "]
+MAKES = ["Remi", "Shimadzu", "Olympus", "Eutech", "Labline", "Tektronix", "Agilent", "Sartorius", "Thermo",
+         "Systronics", "Hanna", "Metrohm", "Labindia", "Bionics", "Rotek"]
+STATUSES = ["Working", "Working", "Working", "Working", "Under Repair", "Condemned"]
+SPECIFICATIONS = ["bench top unit", "floor standing", "portable handheld", "with data logger", "230V AC",
+                  "with PC interface", "wall mounted", "battery operated"]
+
+# Function to draw `rows` values from `options` with a Zipf-like skew, so a few
+# values are common and most are rare, as in the real inventory. The options are
+# shuffled first: lists built group by group would otherwise give one group all the weight
+def skewed_choice(rng, options, rows, exponent=1.1):
+    options = [options[i] for i in rng.permutation(len(options))]
+    weights = 1.0 / np.arange(1, len(options) + 1) ** exponent
+    codes = rng.choice(len(options), size=rows, p=weights / weights.sum())
+    return pd.Categorical.from_codes(codes, categories=options).astype(object)
+
+# Function to generate a synthetic inventory with the sheet's column layout: equipment,
+# department and measurement purpose at their positions, then cost, purchase date and asset id
+def synthetic_inventory(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    equipment = [f"{variant} {instrument}" for instrument in INSTRUMENTS for variant in VARIANTS][:EQUIPMENT_TYPES]
+    departments = [f"School of {subject}" for subject in SUBJECTS] + [f"Department of {subject}" for subject in SUBJECTS]
+    measures = [f"{qualifier}{quantity}" for qualifier in QUALIFIERS for quantity in QUANTITIES]
+    cost = np.round(rng.lognormal(mean=np.log(60_000), sigma=1.3, size=rows), -1)
+    # A few costs are typed in as formatted text, as people do in the sheet
+    formatted = rng.random(rows) < 0.05
+    cost = pd.Series(cost, dtype=object)
+    cost[formatted] = [f"₹{value:,.0f}" for value in cost[formatted]]
+    purchase_date = pd.Timestamp("1995-01-01") + pd.to_timedelta(rng.integers(0, 30 * 365, rows), unit="D")
+    purchase_date = pd.Series(purchase_date).mask(rng.random(rows) < 0.03)
+    return pd.DataFrame({
+        "S.No": np.arange(1, rows + 1),
+        "Equipment Name": skewed_choice(rng, equipment, rows),
+        "School/Department": skewed_choice(rng, departments[:DEPARTMENTS], rows, exponent=0.6),
+        "Make": rng.choice(MAKES, rows),
+        "Model": [f"M-{number}" for number in rng.integers(100, 999, rows)],
+        "Serial No": [f"SN{number:08d}" for number in rng.permutation(rows)],
+        "Quantity": rng.integers(1, 6, rows),
+        "Lab Name": [f"Lab {number}" for number in rng.integers(1, 200, rows)],
+        "Room No": [f"{block}-{number}" for block, number in zip(rng.choice(list("ABCDEFG"), rows), rng.integers(101, 520, rows))],
+        "Supplier": rng.choice(MAKES, rows),
+        "Status": rng.choice(STATUSES, rows),
+        "Warranty (Years)": rng.choice([1, 2, 3, 5], rows),
+        "Specification": rng.choice(SPECIFICATIONS, rows),
+        "In-charge": [f"Staff {number}" for number in rng.integers(1, 400, rows)],
+        "Measurement Purpose": skewed_choice(rng, measures[:MEASURES], rows, exponent=0.9),
+        "Cost": cost,
+        "Purchase Date": purchase_date,
+        "Asset ID": [f"DSU-{number:07d}" for number in range(1, rows + 1)],
+    })
+
+# Function to write the workbook for one size once and return its path
+def synthetic_workbook(rows, seed, directory):
+    path = os.path.join(directory, f"inventory-{rows}-{seed}-v{WORKBOOK_FORMAT_VERSION}.xlsx")
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        with open(path + ".tmp", "wb") as f:
+            write_export(synthetic_inventory(rows, seed), "Excel", f)
+        os.replace(path + ".tmp", path)
+    return path
+
+# Function to time `work` `repeat` times; `setup` runs untimed before each call
+def measure(work, repeat, setup=None):
+    seconds = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        work()
+        seconds.append(time.perf_counter() - started)
+    seconds = np.array(seconds)
+    return {
+        "median": float(np.median(seconds)),
+        "min": float(seconds.min()),
+        "p95": float(np.percentile(seconds, 95)),
+        "repeat": repeat,
+    }
+
+# Function to pick search terms from the data: the most common equipment word, a rare
+# one, a prefix of the common one, a two-term query and one with no match
+def search_queries(dataset):
+    counts = dataset.aggregates.counts("equipment")
+    common = counts.index[0].split()[-1].lower()
+    rare = counts.index[-1].split()[0].lower()
+    return {
+        "common term": common,
+        "rare term": rare,
+        "prefix": common[:3],
+        "two terms": f"{rare} {common}",
+        "no match": "zzqx",
+    }
+
+# Function to run every benchmark on one inventory size and return the results by stage
+def bench_size(rows, seed, repeat, workdir, use_xlsx=True):
+    results = {}
+
+    if use_xlsx and rows <= XLSX_MAX_ROWS:
+        path = synthetic_workbook(rows, seed, workdir)
+        with open(path, "rb") as f:
+            content = f.read()
+        results["xlsx parse"] = measure(lambda: normalize_frame(pd.read_excel(BytesIO(content))), 1)
+        data = normalize_frame(pd.read_excel(BytesIO(content)))
+    else:
+        data = normalize_frame(synthetic_inventory(rows, seed))
+
+    timings = {}
+    dataset = build_dataset(f"bench-{rows}", data, timings)
+    # Built on first use in the app; timed here along with the load stages
+    dataset.similarity_index
+    for stage, seconds in timings.items():
+        results[stage.lower()] = {"median": seconds, "min": seconds, "p95": seconds, "repeat": 1}
+
+    # A sheet edit touching a handful of rows, applied to the previous version
+    edited = data.copy()
+    edited_rows = np.random.default_rng(seed).choice(len(edited), min(REFRESH_EDITED_ROWS, len(edited)), replace=False)
+    edited.iloc[edited_rows, 1] = [f"Edited Equipment {i}" for i in range(len(edited_rows))]
+    edited = edited.drop(index=edited.index[edited_rows[:1]]).reset_index(drop=True)
+    results["refresh: patch edited rows"] = measure(
+        lambda: build_dataset(f"bench-{rows}-edited", edited, {}, previous=dataset), 1 if rows >= 100_000 else repeat)
+
+    # Publishing the dataset for the other worker processes, and attaching to it as one of them
+    store = SharedDatasetStore([("bench", str(rows))], cache_dir=workdir)
+    results["shared dataset: publish"] = measure(lambda: store.publish(dataset, [], time.time()), 1)
+    manifest = store.current()
+    results["shared dataset: attach"] = measure(lambda: store.attach(manifest), repeat)
+
+    # Term lookups are memoized per index, so the caches are cleared before each timed call
+    keyword_index, fuzzy_index = dataset.keyword_index, dataset.fuzzy_index
+    for name, query in search_queries(dataset).items():
+        results[f"keyword search: {name}"] = measure(
+            lambda: keyword_index.search(query), repeat, keyword_index._match.cache_clear)
+    results["fuzzy search: misspelt"] = measure(
+        lambda: fuzzy_index.search("centrifudge spectrophotometre"), repeat, fuzzy_index._expand.cache_clear)
+
+    similarity_index = dataset.similarity_index
+    batch = np.arange(min(SIMILAR_BATCH_ROWS, rows))
+    results["similar items: one row"] = measure(lambda: similarity_index.similar([0]), repeat)
+    results[f"similar items: batch of {len(batch)}"] = measure(lambda: similarity_index.similar(batch), repeat)
+
+    facet_index = dataset.facet_index
+    department = dataset.aggregates.counts("department").index[0]
+    measure_option = dataset.aggregates.counts("measure").index[0]
+    one_filter = {"department": department}
+    two_filters = {"department": department, "measure": measure_option}
+    no_filter = {role: "All" for role in FACET_ROLES}
+    results["filter: one dropdown"] = measure(lambda: facet_index.select_rows(one_filter), repeat)
+    results["filter: two dropdowns"] = measure(lambda: facet_index.select_rows(two_filters), repeat)
+    results["filter: option counts"] = measure(lambda: facet_index.option_counts(two_filters), repeat)
+    results["filter: option counts, no filter"] = measure(lambda: facet_index.option_counts(no_filter), repeat)
+
+    # The same search and dropdowns again, answered from the result cache
+    result_cache = ResultCache()
+    filter_rows(dataset, "digital microscope", selections=two_filters, cache=result_cache)
+    results["filter: repeated query from result cache"] = measure(
+        lambda: filter_rows(dataset, "digital microscope", selections=two_filters, cache=result_cache), repeat)
+
+    aggregates = dataset.aggregates
+
+    def department_tab():
+        top_depts = aggregates.counts("department").nlargest(10)
+        aggregates.cost_totals("department").head(10)
+        aggregates.crosstab(top_depts.index, aggregates.counts("equipment").head(15).index)
+
+    def equipment_tab():
+        aggregates.counts("equipment").head(15)
+        aggregates.counts("measure").head(15)
+
+    results["aggregates: department tab"] = measure(department_tab, repeat)
+    results["aggregates: equipment tab"] = measure(equipment_tab, repeat)
+
+    # Exports of the full table and of one department's rows, the typical download
+    department_rows = facet_index.select_rows(one_filter)
+    export_repeat = 1 if rows >= 100_000 else repeat
+    for label, selected in (("all rows", None), ("one department", department_rows)):
+        for export_format in ("CSV", "Excel"):
+            results[f"export {export_format}: {label}"] = measure(
+                lambda: write_export(dataset.data, export_format, BytesIO(), rows=selected), export_repeat)
+
+    # Figures are built and serialized, as st.plotly_chart does
+    data = dataset.data
+    columns = dataset.columns
+    top_depts = aggregates.counts("department").nlargest(10)
+    top_value_depts = aggregates.cost_totals("department").head(10)
+    figures = {
+        "department counts": lambda: charts.department_counts_chart(top_depts),
+        "department values": lambda: charts.department_values_chart(top_value_depts, 10),
+        "department budget": lambda: charts.department_budget_chart(top_value_depts, 10),
+        "equipment counts": lambda: charts.top_counts_chart(
+            aggregates.counts("equipment").head(15), "Equipment Type", "Top 15 Most Common Equipment Types", "Purples"),
+        "age histogram": lambda: charts.age_histogram(data),
+        "value vs age": lambda: charts.value_vs_age_chart(data, columns["cost"], columns["equipment"]),
+        "column histogram": lambda: charts.column_histogram(take_rows(data, department_rows, [columns["cost"]]), columns["cost"]),
+        "column frequency": lambda: charts.column_frequency_chart(
+            take_rows(data, department_rows, [columns["equipment"]]), columns["equipment"]),
+    }
+    figure_repeat = 1 if rows >= 100_000 else repeat
+    for name, build in figures.items():
+        results[f"figure: {name}"] = measure(lambda: build().to_json(), figure_repeat)
+
+    return results
+
+# Function to describe the environment a run was made in
+def run_metadata(seed):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "started_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "seed": seed,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "pyarrow": pyarrow.__version__,
+        "plotly": plotly.__version__,
+    }
+
+# Function to list the stages whose median got slower than in `baseline`
+def regressions(baseline, current):
+    slower = []
+    for size, stages in current["results"].items():
+        for stage, timing in stages.items():
+            previous = baseline["results"].get(size, {}).get(stage)
+            if previous is None:
+                continue
+            if (timing["median"] > previous["median"] * REGRESSION_RATIO
+                    and timing["median"] - previous["median"] > REGRESSION_MIN_SECONDS):
+                slower.append((size, stage, previous["median"], timing["median"]))
+    return slower
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the equipment search engine on synthetic inventories.")
+    parser.add_argument("--rows", type=int, nargs="+", default=list(DEFAULT_ROWS), help="inventory sizes to run")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="timed calls per fast stage")
+    parser.add_argument("--seed", type=int, default=0, help="random seed of the generated inventories")
+    parser.add_argument("--workdir", default=os.path.join(CACHE_DIR, "bench"), help="where generated workbooks are kept")
+    parser.add_argument("--no-xlsx", action="store_true", help=f"skip writing and parsing workbooks (always skipped above {XLSX_MAX_ROWS:,} rows)")
+    parser.add_argument("-o", "--output", help="JSON file to write the results to (default: stdout)")
+    parser.add_argument("--compare", help="earlier results to check for regressions; exits 1 when any are found")
+    args = parser.parse_args(argv)
+
+    report = {"meta": run_metadata(args.seed), "results": {}}
+    for rows in args.rows:
+        print(f"Benchmarking {rows:,} rows...", file=sys.stderr)
+        report["results"][str(rows)] = bench_size(rows, args.seed, args.repeat, args.workdir, use_xlsx=not args.no_xlsx)
+        for stage, timing in report["results"][str(rows)].items():
+            print(f"  {stage:<40} {timing['median'] * 1000:>12.2f} ms", file=sys.stderr)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        slower = regressions(baseline, report)
+        for size, stage, before, after in slower:
+            print(f"REGRESSION {int(size):,} rows, {stage}: {before * 1000:.2f} ms -> {after * 1000:.2f} ms", file=sys.stderr)
+        if slower:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
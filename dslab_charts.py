@@ -0,0 +1,239 @@
+# Plotly figures of the analytics tabs, built from a dataset's frame and aggregates.
+# Kept free of Streamlit so the figures can be built and timed outside the app.
+# plotly takes a noticeable share of start-up to import, so it is loaded when the
+# first figure is built rather than with this module.
+#
+# Distributions are binned here with NumPy and only the bins are sent to the browser,
+# so the size of a figure does not grow with the number of rows.
+
+import numpy as np
+import pandas as pd
+
+HISTOGRAM_BINS = 20
+# The value vs age chart draws SVG markers up to the first count, WebGL markers up to
+# the second, and a binned density heatmap above that
+SCATTER_SVG_MAX_POINTS = 1_000
+SCATTER_WEBGL_MAX_POINTS = 5_000
+DENSITY_BINS = 40
+# Bars shown by the frequency chart of one column, most frequent first
+FREQUENCY_MAX_BARS = 50
+
+# Function to import plotly.express on first use
+def plotly_express():
+    import plotly.express as px
+    return px
+
+# Function to import plotly.graph_objects on first use
+def plotly_graph_objects():
+    import plotly.graph_objects as go
+    return go
+
+# Function to get the finite values of a numeric column as a float array
+def finite_values(values):
+    values = pd.to_numeric(values, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+    return values[np.isfinite(values)]
+
+# Function to draw counts binned by np.histogram as histogram bars
+def binned_histogram_trace(counts, edges, name, color):
+    go = plotly_graph_objects()
+    return go.Bar(
+        x=(edges[:-1] + edges[1:]) / 2,
+        y=counts,
+        width=np.diff(edges),
+        customdata=np.column_stack([edges[:-1], edges[1:]]),
+        hovertemplate=f"{name}: %{{customdata[0]:,.4g}} – %{{customdata[1]:,.4g}}<br>Count: %{{y:,}}<extra></extra>",
+        marker_color=color,
+        name=name
+    )
+
+# Function to plot the distribution of a numeric column
+def column_histogram(frame, column):
+    go = plotly_graph_objects()
+    counts, edges = np.histogram(finite_values(frame[column]), bins=HISTOGRAM_BINS)
+    fig = go.Figure(binned_histogram_trace(counts, edges, column, '#1E88E5'))
+    fig.update_layout(
+        title=f"Distribution of {column}",
+        xaxis_title=column,
+        yaxis_title="count",
+        bargap=0
+    )
+    return fig
+
+# Function to plot the value frequencies of a categorical column, limited to the
+# most frequent values
+def column_frequency_chart(frame, column):
+    px = plotly_express()
+    value_counts = frame[column].value_counts()
+    value_counts = value_counts[value_counts > 0]
+    title = f"Frequency of {column} Values"
+    if len(value_counts) > FREQUENCY_MAX_BARS:
+        title += f" (top {FREQUENCY_MAX_BARS} of {len(value_counts):,})"
+        value_counts = value_counts.head(FREQUENCY_MAX_BARS)
+    value_counts = value_counts.reset_index()
+    value_counts.columns = [column, 'Count']
+
+    fig = px.bar(
+        value_counts,
+        y=column,
+        x='Count',
+        title=title,
+        orientation='h',
+        color_discrete_sequence=['#1E88E5']
+    )
+    fig.update_layout(height=min(500, len(value_counts) * 25 + 100))
+    return fig
+
+# Function to plot equipment counts of the top departments
+def department_counts_chart(top_depts):
+    px = plotly_express()
+    top_n_depts = len(top_depts)
+    fig_dept = px.bar(
+        y=top_depts.index,
+        x=top_depts.values,
+        labels={'x': 'Number of Equipment', 'y': 'Department'},
+        title=f'Equipment Distribution Across Top {top_n_depts} Departments',
+        orientation='h',
+        color=top_depts.values,  # Color by count for better visualization
+        color_continuous_scale='Blues',  # Blue color scale
+        text=top_depts.values  # Display values on bars
+    )
+    fig_dept.update_layout(
+        showlegend=False,
+        height=max(400, top_n_depts * 30),  # Adjust height based on number of departments
+        coloraxis_showscale=False  # Hide color scale
+    )
+    fig_dept.update_traces(texttemplate='%{text}', textposition='outside')
+    return fig_dept
+
+# Function to plot the total equipment value of the top departments
+def department_values_chart(top_value_depts, top_n_depts):
+    px = plotly_express()
+    fig_value = px.bar(
+        y=top_value_depts.index,
+        x=top_value_depts.values,
+        labels={'x': 'Total Equipment Value', 'y': 'Department'},
+        title=f'Department-wise Equipment Value Distribution (Top {top_n_depts})',
+        orientation='h',
+        color=top_value_depts.values,
+        color_continuous_scale='Greens',
+        text=[f"₹{x:,.0f}" for x in top_value_depts.values]  # Format currency
+    )
+    fig_value.update_layout(
+        height=max(400, top_n_depts * 30),
+        coloraxis_showscale=False
+    )
+    fig_value.update_traces(textposition='outside')
+    return fig_value
+
+# Function to plot the budget share of the top departments as a donut chart
+def department_budget_chart(top_value_depts, top_n_depts):
+    px = plotly_express()
+    fig_pie = px.pie(
+        values=top_value_depts.values,
+        names=top_value_depts.index,
+        title=f'Budget Allocation Across Top {top_n_depts} Departments',
+        hole=0.4,  # Create a donut chart
+        color_discrete_sequence=px.colors.sequential.Greens_r
+    )
+    fig_pie.update_traces(textposition='inside', textinfo='percent+label')
+    return fig_pie
+
+# Function to plot the most common values of one facet as a horizontal bar chart
+def top_counts_chart(counts, label, title, color_scale):
+    px = plotly_express()
+    fig = px.bar(
+        y=counts.index,
+        x=counts.values,
+        labels={'x': 'Count', 'y': label},
+        title=title,
+        orientation='h',
+        color=counts.values,
+        color_continuous_scale=color_scale,
+        text=counts.values
+    )
+    fig.update_layout(
+        height=600,
+        coloraxis_showscale=False
+    )
+    fig.update_traces(texttemplate='%{text}', textposition='outside')
+    return fig
+
+# Function to plot the equipment age distribution with a box plot on the margin. The
+# box is drawn from precomputed quartiles and Tukey fences, without outlier points.
+def age_histogram(data):
+    go = plotly_graph_objects()
+    from plotly.subplots import make_subplots
+
+    ages = finite_values(data['Age'])
+    counts, edges = np.histogram(ages, bins=HISTOGRAM_BINS)
+    fig = make_subplots(rows=2, cols=1, shared_xaxes=True, row_heights=[0.2, 0.8], vertical_spacing=0.03)
+    if len(ages):
+        q1, median, q3 = np.percentile(ages, [25, 50, 75])
+        inside = ages[(ages >= q1 - 1.5 * (q3 - q1)) & (ages <= q3 + 1.5 * (q3 - q1))]
+        fig.add_trace(go.Box(
+            q1=[q1], median=[median], q3=[q3],
+            lowerfence=[inside.min()], upperfence=[inside.max()],
+            y=['Age'], orientation='h', marker_color='#4527A0', name='Age', showlegend=False
+        ), row=1, col=1)
+    fig.add_trace(binned_histogram_trace(counts, edges, 'Age', '#4527A0'), row=2, col=1)
+    fig.update_yaxes(showticklabels=False, row=1, col=1)
+    fig.update_layout(
+        title='Equipment Age Distribution (Years)',
+        showlegend=False,
+        bargap=0
+    )
+    fig.update_xaxes(title_text='Age', row=2, col=1)
+    fig.update_yaxes(title_text='count', row=2, col=1)
+    return fig
+
+# Function to plot equipment value against age: one marker per item while there are
+# few enough of them (WebGL above SCATTER_SVG_MAX_POINTS), otherwise a heatmap of item
+# counts over age and value bins
+def value_vs_age_chart(data, cost_column, equipment_column):
+    points = data.dropna(subset=['Age', cost_column])
+    if len(points) > SCATTER_WEBGL_MAX_POINTS:
+        return value_vs_age_density(points['Age'], points[cost_column], cost_column)
+    px = plotly_express()
+    return px.scatter(
+        points,
+        x='Age',
+        y=cost_column,
+        title='Equipment Value vs Age',
+        color='Age',
+        size=cost_column,
+        hover_name=equipment_column,  # Equipment name on hover
+        color_continuous_scale='Viridis',
+        render_mode='svg' if len(points) <= SCATTER_SVG_MAX_POINTS else 'webgl'
+    )
+
+# Function to plot item counts binned by age and value. Values usually span several
+# orders of magnitude, so they are binned on a log scale when all are positive.
+def value_vs_age_density(ages, costs, cost_column):
+    go = plotly_graph_objects()
+    ages = ages.to_numpy(dtype=np.float64)
+    costs = costs.to_numpy(dtype=np.float64)
+    log_scale = bool(costs.min() > 0 and costs.max() > costs.min())
+    age_edges = np.histogram_bin_edges(ages, bins=DENSITY_BINS)
+    if log_scale:
+        cost_edges = np.logspace(np.log10(costs.min()), np.log10(costs.max()), DENSITY_BINS + 1)
+        # Rounding in the log round trip can leave the extremes outside the outer bins
+        cost_edges[0], cost_edges[-1] = costs.min(), costs.max()
+    else:
+        cost_edges = np.histogram_bin_edges(costs, bins=DENSITY_BINS)
+    counts, _, _ = np.histogram2d(costs, ages, bins=[cost_edges, age_edges])
+    fig = go.Figure(go.Heatmap(
+        x=age_edges,
+        y=cost_edges,
+        # Empty cells are left transparent
+        z=np.where(counts > 0, counts, np.nan),
+        colorscale='Viridis',
+        colorbar={'title': 'Items'},
+        hovertemplate='Age: %{x:.1f} years<br>Value: %{y:,.0f}<br>Items: %{z:,}<extra></extra>'
+    ))
+    fig.update_layout(
+        title=f'Equipment Value vs Age ({len(ages):,} items)',
+        xaxis_title='Age',
+        yaxis_title=cost_column,
+        yaxis_type='log' if log_scale else 'linear'
+    )
+    return fig
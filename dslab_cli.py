@@ -0,0 +1,230 @@
+# Command-line batch queries against the equipment search engine. Loads the dataset
+# through the same cache and snapshot as the app, runs one query per input line and
+# streams the matches (or per-query summaries) out as CSV, JSON Lines or Parquet.
+#
+#   python dslab_cli.py names.txt --group-by department -o holdings.csv
+#   cat queries.jsonl | python dslab_cli.py --format jsonl --fields "Equipment Name,Cost"
+#
+# Input lines are either plain search text or JSON objects with "q" and optional
+# "fuzzy", "columns", "equipment", "department" and "measure" keys.
+
+import argparse
+import json
+import os
+import sys
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from dslab_engine import (
+    FACET_ROLES,
+    DatasetCache,
+    filter_rows,
+    take_rows,
+)
+from dslab_telemetry import telemetry
+
+OUTPUT_FORMATS = ("csv", "jsonl", "parquet")
+# Matches are converted and written this many rows at a time
+BATCH_CHUNK_ROWS = 10_000
+
+# Writes result frames to a binary file object as they arrive, so a batch never
+# holds more than one chunk of output in memory
+class BatchWriter:
+    def __init__(self, fileobj, output_format):
+        self.fileobj = fileobj
+        self.output_format = output_format
+        self._parquet = None
+        self._empty = None
+        self._header_written = False
+
+    def write(self, frame):
+        if self.output_format == "csv":
+            self.fileobj.write(frame.to_csv(index=False, header=not self._header_written).encode("utf-8"))
+            self._header_written = True
+        elif self.output_format == "jsonl":
+            if len(frame):
+                text = frame.to_json(orient="records", lines=True, date_format="iso", force_ascii=False)
+                self.fileobj.write((text if text.endswith("\n") else text + "\n").encode("utf-8"))
+        elif len(frame) or self._parquet is None:
+            # The file schema comes from the first non-empty frame
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if not len(frame):
+                self._empty = table
+                return
+            if self._parquet is None:
+                self._parquet = pq.ParquetWriter(self.fileobj, table.schema)
+            self._parquet.write_table(table.cast(self._parquet.schema))
+
+    def close(self):
+        if self._parquet is None and self._empty is not None:
+            self._parquet = pq.ParquetWriter(self.fileobj, self._empty.schema)
+            self._parquet.write_table(self._empty)
+        if self._parquet is not None:
+            self._parquet.close()
+        self.fileobj.flush()
+
+# Function to parse one input line into a query; blank lines and # comments are skipped
+def parse_query(line):
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
+    if line.startswith("{"):
+        query = json.loads(line)
+        if not isinstance(query, dict):
+            raise ValueError(f"query must be a JSON object: {line}")
+        if not isinstance(query.get("fuzzy", False), bool):
+            raise ValueError(f'"fuzzy" must be true or false: {line}')
+        columns = query.get("columns", [])
+        if not isinstance(columns, list) or not all(isinstance(column, str) for column in columns):
+            raise ValueError(f'"columns" must be a list of column names: {line}')
+        return query
+    return {"q": line}
+
+# Function to parse and check every input line before any output is written, so a bad
+# line stops the batch with its line number instead of leaving a partial result;
+# returns the queries in order
+def parse_queries(dataset, lines):
+    queries = []
+    for number, line in enumerate(lines, start=1):
+        try:
+            query = parse_query(line)
+        except ValueError as e:
+            raise ValueError(f"line {number}: {e}") from e
+        if query is None:
+            continue
+        unknown = [column for column in query.get("columns", []) if column not in dataset.source_columns]
+        if unknown:
+            raise ValueError(f"line {number}: unknown column(s): {', '.join(unknown)}")
+        queries.append(query)
+    return queries
+
+# Function to resolve one query to row positions; None means every row matches
+def query_rows(dataset, query, fuzzy=False, columns=None, selections=None):
+    selections = {role: query.get(role, (selections or {}).get(role, "All")) for role in FACET_ROLES}
+    return filter_rows(
+        dataset,
+        str(query.get("q", "")),
+        query.get("fuzzy", fuzzy),
+        query.get("columns", columns or []),
+        selections,
+    )
+
+# Function to produce the output frames of one query: matching rows in chunks, or
+# one row per group with its row count and total cost; `limit` caps the output rows,
+# so groups are counted over every match
+def query_results(dataset, number, query, rows, fields, group_by=None, limit=None):
+    data = dataset.data
+    rows = dataset.positions(rows)
+    label = {"query_no": number, "query": str(query.get("q", ""))}
+    if group_by is not None:
+        group_column = dataset.columns[group_by]
+        matches = take_rows(data, rows, [group_column] + ([dataset.aggregates.cost_column] if dataset.aggregates.has_cost else []))
+        grouped = matches.groupby(group_column, observed=True, sort=False)
+        summary = pd.DataFrame({"rows": grouped.size()})
+        if dataset.aggregates.has_cost:
+            summary["total_cost"] = grouped[dataset.aggregates.cost_column].sum()
+        summary = summary.sort_values("rows", ascending=False, kind="stable").reset_index()
+        if limit is not None:
+            summary = summary.iloc[:limit]
+        summary[group_column] = summary[group_column].astype(str)
+        if not len(rows):
+            # An explicit zero row, so bulk lookups show which queries found nothing
+            summary = pd.DataFrame({column: pd.Series([0], dtype=summary[column].dtype) for column in summary.columns})
+            summary[group_column] = ""
+        yield summary.assign(**label)[list(label) + list(summary.columns)]
+        return
+    if limit is not None:
+        rows = rows[:limit]
+    # An empty result still yields a frame, so the output always has its columns
+    for start in range(0, max(len(rows), 1), BATCH_CHUNK_ROWS):
+        chunk_rows = rows[start:start + BATCH_CHUNK_ROWS]
+        frame = take_rows(data, chunk_rows, fields).reset_index(drop=True)
+        frame.insert(0, "_key", dataset.row_keys.keys(chunk_rows))
+        yield frame.assign(**label)[list(label) + list(frame.columns)]
+
+# Function to run parsed queries and stream the results to `writer`; returns the number
+# of queries and of output rows
+def run_batch(dataset, queries, writer, fields, group_by=None, limit=None, fuzzy=False, columns=None, selections=None):
+    output_rows = 0
+    for number, query in enumerate(queries, start=1):
+        rows = query_rows(dataset, query, fuzzy, columns, selections)
+        for frame in query_results(dataset, number, query, rows, fields, group_by, limit):
+            writer.write(frame)
+            output_rows += len(frame)
+    return len(queries), output_rows
+
+# Function to parse a count argument that may not be negative
+def non_negative_int(value):
+    number = int(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"must be 0 or more: {value}")
+    return number
+
+# Function to split a comma-separated argument
+def comma_list(value):
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run batch queries against the laboratory equipment inventory.")
+    parser.add_argument("queries", nargs="?", default="-", help="file with one query per line ('-' for stdin)")
+    parser.add_argument("-o", "--output", default="-", help="output file ('-' for stdout)")
+    parser.add_argument("-f", "--format", choices=OUTPUT_FORMATS, help="output format (default: from the output file name, else csv)")
+    parser.add_argument("--fields", type=comma_list, help="comma-separated columns to output (default: all sheet columns)")
+    parser.add_argument("--columns", type=comma_list, help="comma-separated columns to search in (default: all)")
+    parser.add_argument("--fuzzy", action="store_true", help="rank matches and tolerate misspellings")
+    parser.add_argument("--group-by", choices=FACET_ROLES, help="output one row per group with row count and total cost")
+    parser.add_argument("--limit", type=non_negative_int, help="maximum output rows per query (groups with --group-by)")
+    for role in FACET_ROLES:
+        parser.add_argument(f"--{role}", default="All", help=f"only rows with this {role}")
+    parser.add_argument("--refresh", action="store_true", help="revalidate the sheet instead of trusting a fresh snapshot")
+    args = parser.parse_args(argv)
+
+    output_format = args.format
+    if output_format is None:
+        suffix = args.output.rsplit(".", 1)[-1].lower() if "." in args.output else ""
+        output_format = {"csv": "csv", "jsonl": "jsonl", "ndjson": "jsonl", "parquet": "parquet"}.get(suffix, "csv")
+
+    def report(stage, fraction, detail=""):
+        if fraction == 0.0:
+            print(f"{stage}... {detail}".strip(), file=sys.stderr)
+
+    dataset = DatasetCache().get(force=args.refresh, progress=report)
+    fields = args.fields or list(dataset.source_columns)
+    unknown = [column for column in fields + (args.columns or []) if column not in dataset.data.columns]
+    if unknown:
+        parser.error(f"unknown column(s): {', '.join(unknown)}")
+
+    lines = sys.stdin if args.queries == "-" else open(args.queries, encoding="utf-8")
+    try:
+        queries = parse_queries(dataset, lines)
+    except ValueError as e:
+        parser.exit(2, f"{parser.prog}: error: {e}\n")
+    finally:
+        if lines is not sys.stdin:
+            lines.close()
+
+    output = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+    writer = BatchWriter(output, output_format)
+    try:
+        queries, output_rows = run_batch(
+            dataset, queries, writer, fields,
+            group_by=args.group_by,
+            limit=args.limit,
+            fuzzy=args.fuzzy,
+            columns=args.columns,
+            selections={role: getattr(args, role) for role in FACET_ROLES},
+        )
+        writer.close()
+    except BrokenPipeError:
+        # The reader went away (e.g. piped into head); silence the final flush and stop
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
+    finally:
+        if output is not sys.stdout.buffer:
+            output.close()
+    print(f"{queries:,} queries, {output_rows:,} rows written (dataset {dataset.version})", file=sys.stderr)
+    telemetry.flush(force=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1830 @@
+# Data loading, caching, search indexes and exports for the equipment search app.
+# Kept free of Streamlit so the same engine can back other front ends. Libraries that
+# only some code paths need (requests, scipy, the Excel and Parquet writers) are
+# imported where they are used, so importing the engine stays cheap.
+
+import pandas as pd
+from io import BytesIO
+import numpy as np
+import pyarrow as pa
+import pyarrow.feather as feather
+import time
+import bisect
+import collections
+import contextlib
+import copy
+import functools
+import gzip
+import hashlib
+import importlib.util
+import json
+import os
+import pickle
+import re
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from dslab_telemetry import telemetry
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# The engine's interface for front ends; everything else is an implementation detail
+__all__ = [
+    "CACHE_DIR",
+    "CACHE_TTL_SECONDS",
+    "EXPORT_FORMATS",
+    "FACET_ROLES",
+    "LOAD_ERRORS",
+    "LOAD_STAGES",
+    "SHEET_URL",
+    "SIMILARITY_DEFAULT_TOP",
+    "Dataset",
+    "DatasetCache",
+    "ResultCache",
+    "SchemaError",
+    "SharedDatasetStore",
+    "SourceCache",
+    "build_dataset",
+    "configured_sources",
+    "filter_rows",
+    "normalize_frame",
+    "normalized_query",
+    "result_cache",
+    "search_rows",
+    "sort_rows",
+    "take_rows",
+    "write_export",
+]
+
+# Prefer the faster streaming xlsx writer when it is installed
+EXCEL_ENGINE = "xlsxwriter" if importlib.util.find_spec("xlsxwriter") is not None else "openpyxl"
+
+# Errors of fetching or parsing a source; the exceptions of requests derive from OSError
+LOAD_ERRORS = (OSError, ValueError)
+
+# Google Sheets link and dataset cache settings (overridable via environment)
+SHEET_URL = os.environ.get(
+    "DSLAB_SHEET_URL",
+    "https://docs.google.com/spreadsheets/d/13TE6wJbMV9iDaQaBIKoQOG9rHavqQZKq/export?format=xlsx"
+)
+CACHE_TTL_SECONDS = int(os.environ.get("DSLAB_CACHE_TTL", "600"))
+CACHE_DIR = os.environ.get("DSLAB_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "dsLabSearch"))
+# Memory budget of the result cache shared by all sessions of a process
+RESULT_CACHE_BYTES = int(float(os.environ.get("DSLAB_RESULT_CACHE_MB", "64")) * 1024 * 1024)
+# Worker processes on one host can share a single published copy of the dataset and
+# its indexes, memory-mapped read-only, instead of each building their own
+SHARED_DATASET = os.environ.get("DSLAB_SHARED_DATASET", "").lower() in ("1", "true", "yes", "on")
+RETRY_AFTER_SECONDS = 30
+REQUEST_TIMEOUT_SECONDS = 30
+DOWNLOAD_CHUNK_BYTES = 64 * 1024
+
+# Several workbooks can be merged into one dataset; each row records its source
+SOURCE_COLUMN = "Source"
+SOURCE_ENTRY_PATTERN = re.compile(r"^([^=/\\:]+)=(.+)$")
+SOURCE_WORKERS = 8
+SOURCE_WAIT_SECONDS = 10
+WORKBOOK_SUFFIXES = (".xlsx", ".xlsm", ".xls")
+
+# Share of the progress bar taken by each load stage
+LOAD_STAGES = {
+    "Attaching shared dataset": (0.0, 1.0),
+    "Loading snapshot": (0.0, 0.5),
+    "Downloading": (0.0, 0.5),
+    "Merging sources": (0.75, 0.75),
+    "Parsing": (0.5, 0.75),
+    "Applying schema": (0.75, 0.8),
+    "Diffing rows": (0.8, 0.82),
+    "Building search index": (0.82, 0.9),
+    "Patching search index": (0.82, 0.9),
+    "Building fuzzy index": (0.9, 0.93),
+    "Patching fuzzy index": (0.9, 0.93),
+    "Building filter index": (0.93, 0.95),
+    "Building aggregates": (0.95, 0.97),
+    "Patching aggregates": (0.95, 0.97),
+    "Saving snapshot": (0.97, 1.0),
+    "Publishing shared dataset": (0.97, 1.0),
+}
+
+# A refresh patches the previous dataset when at most this share of rows changed;
+# beyond that a full rebuild is cheaper
+PATCH_MAX_CHANGED_RATIO = 0.3
+# Patched cost totals are rounded to this many decimals
+COST_DECIMALS = 2
+
+# Keyword search splits text into lower-cased runs of letters and digits in any script.
+# Combining marks are not word characters to the re module, so the diacritics block and
+# the vowel signs of the Indic scripts are added to keep words such as Tamil ones whole.
+TOKEN_PATTERN = re.compile(r"(?:[^\W_]|[\u0300-\u036f\u0900-\u0963\u0966-\u0dff])+")
+
+# Function to split text into search tokens
+def tokenize(text):
+    return TOKEN_PATTERN.findall(str(text).lower())
+
+# Declared sheet layout. Core columns are located by position and optional ones by
+# header; each is converted to its declared type once, when the dataset is built.
+SCHEMA = {
+    "equipment": {"position": 1, "type": "category", "required": True},
+    "department": {"position": 2, "type": "category", "required": True},
+    "measure": {"position": 14, "type": "category", "required": True},
+    "cost": {"name": "Cost", "type": "number"},
+    "purchase_date": {"name": "Purchase Date", "type": "datetime"},
+    "asset_id": {"name": "Asset ID", "type": "key"},
+    "description": {"name": "Description", "type": "text"},
+}
+# Other text columns are stored as categoricals below this distinct-values ratio
+CATEGORY_MAX_RATIO = 0.5
+# Number cells may carry a currency marker ("Rs. 1,000", "₹ 500", "1000/-") and
+# thousands separators; anything else that is not a plain number is left empty
+CURRENCY_PATTERN = r"(?i)^\s*(?:rs\.?|inr|₹|\$|usd)\s*|\s*(?:/-|rs\.?|inr)\s*$"
+THOUSANDS_PATTERN = r"(?<=\d),(?=\d)"
+NUMBER_PATTERN = r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?"
+
+# Dropdown filters cover equipment name, school/department and measurement purpose
+FACET_ROLES = ("equipment", "department", "measure")
+
+# Ranked search covers equipment name, school/department and measurement purpose
+FUZZY_ROLES = ("equipment", "department", "measure")
+BM25_K1 = 1.2
+BM25_B = 0.75
+FUZZY_MIN_SIMILARITY = 0.5
+FUZZY_MAX_EXPANSIONS = 20
+
+# "Similar equipment" compares name, measurement purpose and description by their
+# character trigrams, so "Spectrophotometer" and "UV-Vis Spectrophotometry" still meet
+SIMILARITY_ROLES = ("equipment", "measure", "description")
+SIMILARITY_DEFAULT_TOP = 10
+
+# Function to split a token into padded character trigrams
+def trigrams(token):
+    padded = f" {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+# Function to normalize a parsed sheet so it can be stored as an Arrow snapshot
+def normalize_frame(data):
+    data = data.reset_index(drop=True)
+    columns, seen = [], {}
+    for column in data.columns:
+        name = str(column)
+        seen[name] = seen.get(name, 0) + 1
+        columns.append(name if seen[name] == 1 else f"{name}.{seen[name] - 1}")
+    data.columns = columns
+    # Arrow needs one type per column, so mixed text/number columns become text
+    for column in data.columns:
+        if data[column].dtype == object and pd.api.types.infer_dtype(data[column], skipna=True) in ("mixed", "mixed-integer"):
+            data[column] = data[column].map(lambda value: value if pd.isna(value) else str(value))
+    return data
+
+# Local Feather (Arrow IPC) snapshot of the last downloaded workbook for fast cold starts.
+# Snapshots are named after the content hash, so an unchanged sheet is never rewritten.
+class SnapshotStore:
+    def __init__(self, url, cache_dir=CACHE_DIR):
+        self.directory = os.path.join(cache_dir, hashlib.sha256(url.encode()).hexdigest()[:12])
+        self.manifest_path = os.path.join(self.directory, "manifest.json")
+
+    def _snapshot_path(self, version):
+        return os.path.join(self.directory, f"snapshot-{version}.feather")
+
+    def load(self):
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+            data = feather.read_table(self._snapshot_path(manifest["version"]), memory_map=True).to_pandas()
+        except (OSError, ValueError, KeyError):
+            return None, {}
+        return data, manifest
+
+    def save(self, version, data, etag=None, last_modified=None):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._snapshot_path(version)
+        if not os.path.exists(path):
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            feather.write_feather(data, tmp_path, compression="uncompressed")
+            os.replace(tmp_path, path)
+        manifest = {"version": version, "etag": etag, "last_modified": last_modified}
+        tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+        # Drop snapshots of older versions
+        for name in os.listdir(self.directory):
+            if name.startswith("snapshot-") and name.endswith(".feather") and name != os.path.basename(path):
+                os.remove(os.path.join(self.directory, name))
+
+# Raised when a sheet does not match the declared schema
+class SchemaError(ValueError):
+    pass
+
+# Function to find the header of every schema role in a sheet
+def resolve_columns(data, schema=SCHEMA):
+    columns = {}
+    for role, spec in schema.items():
+        if "position" in spec:
+            columns[role] = data.columns[spec["position"]] if spec["position"] < len(data.columns) else None
+            expected = f"column {spec['position'] + 1}"
+        else:
+            columns[role] = spec["name"] if spec["name"] in data.columns else None
+            expected = f"a '{spec['name']}' column"
+        if columns[role] is None and spec.get("required"):
+            raise SchemaError(f"no {role.replace('_', ' ')} column found (expected {expected})")
+    return columns
+
+# Function to parse a text column of numbers; cells that are not a number once the
+# currency marker and thousands separators are stripped become NaN
+def parse_numbers(values):
+    cleaned = values.astype(str).str.replace(CURRENCY_PATTERN, "", regex=True).str.replace(THOUSANDS_PATTERN, "", regex=True).str.strip()
+    valid = cleaned.str.fullmatch(NUMBER_PATTERN).fillna(False).astype(bool)
+    return pd.to_numeric(cleaned.where(valid), errors="coerce").astype("float64")
+
+# Function to convert a sheet to the declared column types, store low-cardinality text
+# as categoricals and derive Age and Purchase Year; returns the typed frame and the
+# role -> header mapping
+def apply_schema(data, schema=SCHEMA):
+    columns = resolve_columns(data, schema)
+    data = data.copy(deep=False)
+    for role, spec in schema.items():
+        column = columns[role]
+        if column is None:
+            continue
+        values = data[column]
+        if spec["type"] == "number" and not pd.api.types.is_numeric_dtype(values):
+            data[column] = parse_numbers(values)
+        elif spec["type"] == "datetime" and not pd.api.types.is_datetime64_any_dtype(values):
+            data[column] = pd.to_datetime(values, errors="coerce")
+        elif spec["type"] == "category" and not isinstance(values.dtype, pd.CategoricalDtype):
+            data[column] = pd.Categorical(values, categories=sorted(values.dropna().unique()))
+
+    typed = set(filter(None, columns.values()))
+    for column in data.columns:
+        values = data[column]
+        if column in typed or isinstance(values.dtype, pd.CategoricalDtype):
+            continue
+        if pd.api.types.is_integer_dtype(values):
+            data[column] = pd.to_numeric(values, downcast="integer")
+        elif (pd.api.types.is_object_dtype(values) or pd.api.types.is_string_dtype(values)) and len(values) \
+                and values.nunique() / len(values) < CATEGORY_MAX_RATIO:
+            data[column] = values.astype("category")
+
+    # Derived fields, unless the sheet already has columns with these names
+    if columns["purchase_date"] is not None:
+        purchase_dates = data[columns["purchase_date"]]
+        if "Age" not in data.columns:
+            data["Age"] = ((pd.Timestamp.now() - purchase_dates).dt.days / 365).astype("float32")
+        if "Purchase Year" not in data.columns:
+            data["Purchase Year"] = purchase_dates.dt.year.astype("Int16")
+    return data, columns
+
+# Stable primary key for rows: the asset id column when it is present and unique,
+# otherwise a hash of the row's cells, with "-2", "-3", ... on repeats of an identical
+# row. Hash keys stay valid while other rows are inserted or deleted upstream; an
+# edited row gets a new key. Keys are looked up as strings in O(1).
+class RowKeyIndex:
+    def __init__(self, data, key_column=None, row_hashes=None):
+        self.column = None
+        if key_column is not None:
+            keys = data[key_column]
+            if keys.notna().all() and keys.astype(str).is_unique:
+                self.column = key_column
+                self._keys = keys.astype(str).to_numpy()
+        if self.column is None:
+            if row_hashes is None:
+                row_hashes = pd.util.hash_pandas_object(data, index=False).to_numpy()
+            hashes = pd.Series(row_hashes)
+            keys = hashes.map("{:016x}".format).astype(object)
+            repeat = hashes.groupby(hashes).cumcount()
+            if repeat.any():
+                keys = keys.where(repeat == 0, keys + "-" + (repeat + 1).astype(str))
+            self._keys = keys.to_numpy()
+        self._positions = {key: position for position, key in enumerate(self._keys)}
+
+    def key(self, position):
+        return self._keys[position]
+
+    # Returns the keys of many rows at once
+    def keys(self, positions):
+        return self._keys[positions]
+
+    # Returns the row position for a key, or None when there is no such row
+    def position(self, key):
+        return self._positions.get(str(key))
+
+# One parsed version of the workbook, identified by a hash of the downloaded bytes.
+# `timings` holds the seconds spent in each load stage that produced it.
+# The frame is shared by every session and never modified; queries are represented by
+# arrays of row positions over it and only the rows being shown or exported are gathered.
+class Dataset:
+    def __init__(self, version, data, timings=None):
+        self.version = version
+        self.data = data
+        self.timings = timings if timings is not None else {}
+        self.loaded_at = time.time()
+        self.all_rows = np.arange(len(data))
+        self.all_rows.flags.writeable = False
+        self._similarity_index = None
+        self._lock = threading.Lock()
+
+    # Only the details tab needs the similarity index, so it is built on first use
+    @property
+    def similarity_index(self):
+        with self._lock:
+            if self._similarity_index is None:
+                self._similarity_index = run_stage(self.timings, None, "Building similarity index", lambda: SimilarityIndex(
+                    self.data, [self.columns[role] for role in SIMILARITY_ROLES]))
+        return self._similarity_index
+
+    # Returns the row positions of a query result, where None stands for every row
+    def positions(self, rows):
+        return self.all_rows if rows is None else rows
+
+    # Returns the plain values and the arrays describing the search structures, so
+    # another process can attach to them instead of building its own
+    def state(self):
+        values = {"columns": self.columns, "source_columns": self.source_columns}
+        arrays = {"row_hashes": self.row_hashes}
+        for name in SHARED_STRUCTURES:
+            values[name], structure_arrays = getattr(self, name).state()
+            arrays.update({f"{name}.{key}": array for key, array in structure_arrays.items()})
+        return values, arrays
+
+    # Returns a dataset over a published frame and published index arrays. Only the
+    # row key lookup is rebuilt; the similarity index is built on first use as usual.
+    @classmethod
+    def attached(cls, version, data, values, arrays, aggregates, timings=None):
+        dataset = cls(version, data, timings)
+        dataset.columns = values["columns"]
+        dataset.source_columns = values["source_columns"]
+        dataset.row_hashes = arrays["row_hashes"]
+        dataset.row_keys = RowKeyIndex(data, dataset.columns["asset_id"], dataset.row_hashes)
+        for name, structure in SHARED_STRUCTURES.items():
+            prefix = f"{name}."
+            structure_arrays = {key[len(prefix):]: array for key, array in arrays.items() if key.startswith(prefix)}
+            setattr(dataset, name, structure.attached(data, values[name], structure_arrays))
+        dataset.aggregates = aggregates
+        return dataset
+
+# Function to gather the given rows, and optionally only the given columns, of a frame
+def take_rows(data, rows, columns=None):
+    if columns is None:
+        return data.iloc[rows]
+    return data.iloc[rows, data.columns.get_indexer(list(columns))]
+
+# Function to tokenize a column once per distinct value and expand the tokens to
+# (token id, row position) pairs; `distinct` drops repeated tokens within a cell
+def column_tokens(values, token_ids, distinct=True):
+    positions = np.flatnonzero(values.notna().to_numpy())
+    codes, uniques = pd.factorize(values.iloc[positions])
+    value_tokens = [
+        [token_ids.setdefault(token, len(token_ids)) for token in (set(tokenize(value)) if distinct else tokenize(value))]
+        for value in uniques
+    ]
+    counts = np.array([len(tokens) for tokens in value_tokens], dtype=np.int64)
+    flat = np.fromiter((token for tokens in value_tokens for token in tokens), dtype=np.int64, count=counts.sum())
+    starts = np.cumsum(counts) - counts
+    row_counts = counts[codes]
+    offsets = np.arange(row_counts.sum()) - np.repeat(np.cumsum(row_counts) - row_counts, row_counts)
+    return flat[np.repeat(starts[codes], row_counts) + offsets], np.repeat(positions, row_counts)
+
+# Function to turn per-token posting counts into CSR offsets, so the entries of token i
+# are [indptr[i], indptr[i + 1])
+def count_offsets(counts):
+    indptr = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    return indptr
+
+# Function to turn the sorted token ids of CSR postings into their offsets
+def csr_indptr(tokens, token_count):
+    return count_offsets(np.bincount(tokens, minlength=token_count))
+
+# Function to build CSR postings from (token rank, row) pairs sorted by token and row
+def csr_postings(tokens, rows, token_count):
+    return csr_indptr(tokens, token_count), rows.astype(np.int32)
+
+# Function to binary-search many sorted slices of one array at once: returns, for every
+# target, the first position in [lo, hi) whose value is not below the target
+def segment_searchsorted(values, lo, hi, targets):
+    lo, hi = lo.copy(), hi.copy()
+    active = lo < hi
+    while active.any():
+        mid = (lo + hi) // 2
+        below = np.zeros(len(mid), dtype=bool)
+        below[active] = values[mid[active]] < targets[active]
+        lo = np.where(active & below, mid + 1, lo)
+        hi = np.where(active & ~below, mid, hi)
+        active = lo < hi
+    return lo
+
+# Function to tell whether the rows kept by a patch stay in their old order
+def keeps_order(remap):
+    kept_positions = remap[remap >= 0]
+    return bool(np.all(kept_positions[1:] > kept_positions[:-1]))
+
+# Function to move CSR postings (indptr, rows, *payloads) to a patched vocabulary and
+# table, and add the postings of the added rows, given sorted as (token rank, row,
+# *payloads). While the kept rows stay in order the moved postings remain sorted and
+# each added posting is placed by a binary search within its token; otherwise all
+# postings are re-sorted
+def patch_postings(postings, old_rank, token_count, remap, added, in_order):
+    indptr, rows, payloads = postings[0], remap.astype(np.int32)[postings[1]], postings[2:]
+    added_tokens, added_rows, added_payloads = added[0], added[1], added[2:]
+    dropped = np.flatnonzero(rows < 0)
+    counts = np.zeros(token_count, dtype=np.int64)
+    counts[old_rank] = np.diff(indptr) - np.bincount(
+        np.searchsorted(indptr, dropped, side="right") - 1, minlength=len(old_rank))
+    if len(dropped):
+        rows, payloads = np.delete(rows, dropped), [np.delete(payload, dropped) for payload in payloads]
+    if not in_order:
+        tokens = np.concatenate([np.repeat(np.arange(token_count), counts), added_tokens])
+        rows = np.concatenate([rows, added_rows])
+        order = np.lexsort((rows, tokens))
+        payloads = [np.concatenate([payload, added_payload])[order] for payload, added_payload in zip(payloads, added_payloads)]
+        return (csr_indptr(tokens, token_count), rows[order].astype(np.int32), *payloads)
+    indptr = count_offsets(counts)
+    at = segment_searchsorted(rows, indptr[added_tokens], indptr[added_tokens + 1], added_rows)
+    indptr += np.searchsorted(added_tokens, np.arange(token_count + 1))
+    payloads = [np.insert(payload, at, added_payload) for payload, added_payload in zip(payloads, added_payloads)]
+    return (indptr, np.insert(rows, at, added_rows.astype(np.int32)), *payloads)
+
+# Function to drop tokens from CSR offsets; `live` marks the tokens to keep
+def compacted_indptr(indptr, live):
+    return count_offsets(np.diff(indptr)[live])
+
+# Read-only list of strings packed into two arrays, the UTF-8 bytes and the offset of
+# every string in them, so a vocabulary can be published as .npy files and memory-mapped
+# by every worker like the postings. Items are decoded on access, which suits binary
+# searches; iterating decodes everything at once.
+class PackedStrings(collections.abc.Sequence):
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    @classmethod
+    def packed(cls, strings):
+        encoded = [string.encode("utf-8") for string in strings]
+        offsets = count_offsets(np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded)))
+        return cls(offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self.tolist()[i]
+        i = range(len(self))[i]
+        return self.data[self.offsets[i]:self.offsets[i + 1]].tobytes().decode("utf-8")
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def tolist(self):
+        blob = self.data.tobytes()
+        bounds = self.offsets.tolist()
+        return [blob[start:stop].decode("utf-8") for start, stop in zip(bounds[:-1], bounds[1:])]
+
+# Function to sort a token vocabulary, returning it with a token id -> rank lookup
+def sorted_vocabulary(token_ids):
+    vocabulary = sorted(token_ids)
+    rank = np.empty(len(vocabulary), dtype=np.int64)
+    rank[[token_ids[token] for token in vocabulary]] = np.arange(len(vocabulary))
+    return vocabulary, rank
+
+# Function to merge the tokens of added rows into a sorted vocabulary. Returns the merged
+# vocabulary, the new rank of every old token and a token id -> rank lookup
+def merged_vocabulary(old_vocabulary, token_ids):
+    delta = sorted(token_ids)
+    at = np.array([bisect.bisect_left(old_vocabulary, token) for token in delta], dtype=np.int64)
+    known = np.array([i < len(old_vocabulary) and old_vocabulary[i] == token for i, token in zip(at, delta)], dtype=bool)
+    inserted_at = at[~known]
+    shift = np.cumsum(np.bincount(inserted_at, minlength=len(old_vocabulary) + 1))[:len(old_vocabulary)]
+    old_rank = np.arange(len(old_vocabulary)) + shift
+    delta_rank = np.empty(len(delta), dtype=np.int64)
+    delta_rank[known] = old_rank[at[known]]
+    delta_rank[~known] = inserted_at + np.arange(len(inserted_at))
+    vocabulary = np.empty(len(old_vocabulary) + len(inserted_at), dtype=object)
+    vocabulary[old_rank] = list(old_vocabulary)
+    vocabulary[delta_rank[~known]] = [token for token, is_known in zip(delta, known) if not is_known]
+    rank = np.empty(len(delta), dtype=np.int64)
+    rank[[token_ids[token] for token in delta]] = delta_rank
+    return vocabulary, old_rank, rank
+
+# Inverted index from search tokens to row positions, over all columns and per column.
+# Tokens are kept in one sorted vocabulary and postings are stored CSR-style, so the
+# rows of every token sharing a prefix form one contiguous slice. patch() derives the
+# index of an edited table by tokenizing only the rows that changed.
+class KeywordIndex:
+    def __init__(self, data):
+        self.columns = list(data.columns)
+        self.row_count = len(data)
+        token_ids = {}
+        column_pairs = [column_tokens(data[column], token_ids) for column in self.columns]
+        vocabulary, rank = sorted_vocabulary(token_ids)
+        column_pairs = [(rank[tokens], rows) for tokens, rows in column_pairs]
+        token_count = len(vocabulary)
+        self._index(
+            vocabulary,
+            {
+                column: csr_postings(*self._sorted_pairs(tokens, rows), token_count)
+                for column, (tokens, rows) in zip(self.columns, column_pairs)
+            },
+            csr_postings(*self._sorted_pairs(*self._concat_pairs(column_pairs)), token_count),
+        )
+
+    # Stores the vocabulary and the postings, over all columns and per column
+    def _index(self, vocabulary, by_column, all_postings):
+        self.vocabulary = vocabulary
+        self._by_column = by_column
+        self._all = all_postings
+        self._match = functools.lru_cache(maxsize=1024)(self._match_prefix)
+
+    # Returns the index of a new version of the table. `remap` holds the new position of
+    # every old row, or -1 when the row was deleted or edited; `added` lists the new
+    # positions whose rows have to be tokenized. Only those rows are tokenized; the old
+    # postings are moved to their new ranks and rows.
+    def patch(self, data, remap, added):
+        token_ids = {}
+        added = np.asarray(added, dtype=np.int64)
+        added_pairs = [column_tokens(data[column].iloc[added], token_ids) for column in self.columns]
+        vocabulary, old_rank, rank = merged_vocabulary(self.vocabulary, token_ids)
+        added_pairs = [(rank[tokens], added[rows]) for tokens, rows in added_pairs]
+        in_order = keeps_order(remap)
+        token_count = len(vocabulary)
+        by_column = {
+            column: patch_postings(self._by_column[column], old_rank, token_count, remap, self._sorted_pairs(*pairs), in_order)
+            for column, pairs in zip(self.columns, added_pairs)
+        }
+        all_postings = patch_postings(
+            self._all, old_rank, token_count, remap, self._sorted_pairs(*self._concat_pairs(added_pairs)), in_order)
+
+        # Drop tokens that no longer occur in any row
+        live = np.diff(all_postings[0]) > 0
+        if not live.all():
+            by_column = {column: (compacted_indptr(indptr, live), rows) for column, (indptr, rows) in by_column.items()}
+            all_postings = (compacted_indptr(all_postings[0], live), all_postings[1])
+            vocabulary = vocabulary[live]
+
+        index = KeywordIndex.__new__(KeywordIndex)
+        index.columns = self.columns
+        index.row_count = len(data)
+        index._index(vocabulary.tolist(), by_column, all_postings)
+        return index
+
+    @staticmethod
+    def _concat_pairs(pairs):
+        empty = np.empty(0, dtype=np.int64)
+        return (np.concatenate([tokens for tokens, _ in pairs] or [empty]),
+                np.concatenate([rows for _, rows in pairs] or [empty]))
+
+    # Sorts (token rank, row) pairs and drops repeats
+    @staticmethod
+    def _sorted_pairs(tokens, rows):
+        order = np.lexsort((rows, tokens))
+        tokens, rows = tokens[order], rows[order]
+        keep = np.ones(len(rows), dtype=bool)
+        keep[1:] = (tokens[1:] != tokens[:-1]) | (rows[1:] != rows[:-1])
+        return tokens[keep], rows[keep]
+
+    # Returns the plain values and the arrays of the index, for publishing it
+    def state(self):
+        vocabulary = PackedStrings.packed(self.vocabulary)
+        arrays = {"vocabulary_offsets": vocabulary.offsets, "vocabulary_data": vocabulary.data,
+                  "all_indptr": self._all[0], "all_rows": self._all[1]}
+        for number, column in enumerate(self.columns):
+            arrays[f"{number}_indptr"], arrays[f"{number}_rows"] = self._by_column[column]
+        return {"columns": self.columns}, arrays
+
+    # Returns an index over published arrays
+    @classmethod
+    def attached(cls, data, values, arrays):
+        index = cls.__new__(cls)
+        index.columns = values["columns"]
+        index.row_count = len(data)
+        index.vocabulary = PackedStrings(arrays["vocabulary_offsets"], arrays["vocabulary_data"])
+        index._by_column = {
+            column: (arrays[f"{number}_indptr"], arrays[f"{number}_rows"]) for number, column in enumerate(index.columns)
+        }
+        index._all = (arrays["all_indptr"], arrays["all_rows"])
+        index._match = functools.lru_cache(maxsize=1024)(index._match_prefix)
+        return index
+
+    def _match_prefix(self, prefix, columns):
+        start = bisect.bisect_left(self.vocabulary, prefix)
+        stop = bisect.bisect_left(self.vocabulary, prefix + "\uffff", start)
+        postings = [self._all] if columns is None else [self._by_column[column] for column in columns]
+        parts = [rows[indptr[start]:indptr[stop]] for indptr, rows in postings]
+        rows = np.concatenate(parts) if parts else np.empty(0, dtype=np.int32)
+        if stop - start > 1 or len(parts) > 1:
+            rows = np.unique(rows)
+        return rows
+
+    # Returns the sorted row positions matching every query term as a prefix, or None
+    # when the query is blank; a query without any letters or digits matches nothing
+    def search(self, query, columns=None):
+        terms = tokenize(query)
+        if not terms:
+            return None if not str(query).strip() else np.empty(0, dtype=np.int32)
+        columns = None if not columns else tuple(column for column in columns if column in self._by_column)
+        matches = sorted((self._match(term, columns) for term in set(terms)), key=len)
+        result = matches[0]
+        for rows in matches[1:]:
+            if len(result) == 0:
+                break
+            result = np.intersect1d(result, rows, assume_unique=True)
+        return result
+
+# BM25-ranked search over a few descriptive columns. Query terms are expanded to
+# vocabulary terms that share a prefix or enough character trigrams, so misspelt
+# words still find their rows. Per-posting BM25 weights are precomputed at build time.
+class FuzzyIndex:
+    def __init__(self, data, columns):
+        self.columns = [column for column in columns if column is not None]
+        self.row_count = len(data)
+        token_ids = {}
+        column_pairs = [column_tokens(data[column], token_ids, distinct=False) for column in self.columns]
+        vocabulary, rank = sorted_vocabulary(token_ids)
+        tokens = np.concatenate([rank[tokens] for tokens, _ in column_pairs] or [np.empty(0, dtype=np.int64)])
+        rows = np.concatenate([rows for _, rows in column_pairs] or [np.empty(0, dtype=np.int64)])
+        tokens, rows, term_frequency = self._counted_pairs(tokens, rows)
+        doc_lengths = np.bincount(rows, weights=term_frequency, minlength=self.row_count)
+        self._index(vocabulary, csr_indptr(tokens, len(vocabulary)), rows.astype(np.int32), term_frequency, doc_lengths)
+
+    # Sorts (term rank, row) pairs and folds repeats into a term frequency per posting
+    @staticmethod
+    def _counted_pairs(tokens, rows):
+        order = np.lexsort((rows, tokens))
+        tokens, rows = tokens[order], rows[order]
+        starts = np.flatnonzero(np.r_[True, (tokens[1:] != tokens[:-1]) | (rows[1:] != rows[:-1])][:len(rows)])
+        term_frequency = np.diff(np.r_[starts, len(rows)]).astype(np.float32)
+        return tokens[starts], rows[starts], term_frequency
+
+    # Stores the vocabulary and the postings with their term frequencies, and derives
+    # the BM25 weight of every posting and the trigram index over the vocabulary
+    def _index(self, vocabulary, indptr, rows, term_frequency, doc_lengths):
+        self.vocabulary = vocabulary
+        self._indptr, self._rows = indptr, rows
+        self._term_frequency, self._doc_lengths = term_frequency, doc_lengths
+        average_length = doc_lengths.mean() if self.row_count and doc_lengths.any() else 1.0
+        document_frequency = np.diff(indptr)
+        idf = np.log(1 + (self.row_count - document_frequency + 0.5) / (document_frequency + 0.5))
+        frequency = term_frequency.astype(np.float64)
+        length_norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_lengths[rows] / average_length)
+        self._weights = (np.repeat(idf, document_frequency) * frequency * (BM25_K1 + 1) / (frequency + length_norm)).astype(np.float32)
+
+        # Trigram index over the vocabulary for typo tolerance
+        gram_terms = {}
+        self._gram_counts = np.empty(len(self.vocabulary), dtype=np.int64)
+        for term_id, term in enumerate(self.vocabulary):
+            grams = trigrams(term)
+            self._gram_counts[term_id] = len(grams)
+            for gram in grams:
+                gram_terms.setdefault(gram, []).append(term_id)
+        self._gram_terms = {gram: np.array(ids, dtype=np.int64) for gram, ids in gram_terms.items()}
+        self._expand = functools.lru_cache(maxsize=1024)(self._expand_term)
+
+    # Returns the index of a new version of the table, tokenizing only the added rows as
+    # KeywordIndex.patch() does. The BM25 weights depend on the row count and the average
+    # row length, so they are recomputed from the moved term frequencies
+    def patch(self, data, remap, added):
+        token_ids = {}
+        added = np.asarray(added, dtype=np.int64)
+        column_pairs = [column_tokens(data[column].iloc[added], token_ids, distinct=False) for column in self.columns]
+        vocabulary, old_rank, rank = merged_vocabulary(self.vocabulary, token_ids)
+        tokens = np.concatenate([rank[tokens] for tokens, _ in column_pairs] or [np.empty(0, dtype=np.int64)])
+        rows = np.concatenate([added[rows] for _, rows in column_pairs] or [np.empty(0, dtype=np.int64)])
+        added_postings = self._counted_pairs(tokens, rows)
+        indptr, rows, term_frequency = patch_postings(
+            (self._indptr, self._rows, self._term_frequency), old_rank, len(vocabulary), remap, added_postings, keeps_order(remap))
+        doc_lengths = np.bincount(added_postings[1], weights=added_postings[2], minlength=len(data))
+        kept = remap >= 0
+        doc_lengths[remap[kept]] = self._doc_lengths[kept]
+
+        # Drop terms that no longer occur in any row
+        live = np.diff(indptr) > 0
+        if not live.all():
+            indptr, vocabulary = compacted_indptr(indptr, live), vocabulary[live]
+
+        index = FuzzyIndex.__new__(FuzzyIndex)
+        index.columns = self.columns
+        index.row_count = len(data)
+        index._index(vocabulary.tolist(), indptr, rows, term_frequency, doc_lengths)
+        return index
+
+    # Returns the plain values and the arrays of the index, for publishing it; the
+    # trigram lookup is stored CSR-style
+    def state(self):
+        grams = list(self._gram_terms)
+        term_ids = [self._gram_terms[gram] for gram in grams]
+        counts = np.array([len(ids) for ids in term_ids], dtype=np.int64)
+        vocabulary = PackedStrings.packed(self.vocabulary)
+        arrays = {
+            "vocabulary_offsets": vocabulary.offsets,
+            "vocabulary_data": vocabulary.data,
+            "indptr": self._indptr,
+            "rows": self._rows,
+            "weights": self._weights,
+            "term_frequency": self._term_frequency,
+            "doc_lengths": self._doc_lengths,
+            "gram_counts": self._gram_counts,
+            "gram_indptr": np.r_[0, np.cumsum(counts)],
+            "gram_terms": np.concatenate(term_ids or [np.empty(0, dtype=np.int64)]),
+        }
+        return {"columns": self.columns, "grams": grams}, arrays
+
+    # Returns an index over published arrays
+    @classmethod
+    def attached(cls, data, values, arrays):
+        index = cls.__new__(cls)
+        index.columns = values["columns"]
+        index.row_count = len(data)
+        index.vocabulary = PackedStrings(arrays["vocabulary_offsets"], arrays["vocabulary_data"])
+        index._indptr = arrays["indptr"]
+        index._rows = arrays["rows"]
+        index._weights = arrays["weights"]
+        index._term_frequency = arrays["term_frequency"]
+        index._doc_lengths = arrays["doc_lengths"]
+        index._gram_counts = arrays["gram_counts"]
+        gram_indptr, gram_terms = arrays["gram_indptr"], arrays["gram_terms"]
+        index._gram_terms = {gram: gram_terms[gram_indptr[i]:gram_indptr[i + 1]] for i, gram in enumerate(values["grams"])}
+        index._expand = functools.lru_cache(maxsize=1024)(index._expand_term)
+        return index
+
+    # Returns (term id, similarity) pairs for vocabulary terms close to a query term
+    def _expand_term(self, term):
+        similarity = {}
+        start = bisect.bisect_left(self.vocabulary, term)
+        stop = bisect.bisect_left(self.vocabulary, term + "\uffff", start)
+        for term_id in range(start, min(stop, start + FUZZY_MAX_EXPANSIONS)):
+            similarity[term_id] = 1.0 if self.vocabulary[term_id] == term else 0.9
+        grams = trigrams(term)
+        candidates = [self._gram_terms[gram] for gram in grams if gram in self._gram_terms]
+        if candidates:
+            term_ids, shared = np.unique(np.concatenate(candidates), return_counts=True)
+            dice = 2 * shared / (len(grams) + self._gram_counts[term_ids])
+            close = dice >= FUZZY_MIN_SIMILARITY
+            for term_id, score in zip(term_ids[close], dice[close]):
+                similarity[term_id] = max(similarity.get(term_id, 0.0), float(score))
+        best = sorted(similarity.items(), key=lambda item: -item[1])[:FUZZY_MAX_EXPANSIONS]
+        return tuple(best)
+
+    # Returns matching row positions ordered by descending relevance; None when the
+    # query is blank
+    def search(self, query):
+        terms = set(tokenize(query))
+        if not terms:
+            return None if not str(query).strip() else np.empty(0, dtype=np.int64)
+        scores = np.zeros(self.row_count, dtype=np.float32)
+        for term in terms:
+            # A query term counts once per row, through its best matching vocabulary term
+            term_scores = np.zeros(self.row_count, dtype=np.float32)
+            for term_id, similarity in self._expand(term):
+                start, stop = self._indptr[term_id], self._indptr[term_id + 1]
+                rows = self._rows[start:stop]
+                term_scores[rows] = np.maximum(term_scores[rows], similarity * self._weights[start:stop])
+            scores += term_scores
+        matches = np.flatnonzero(scores > 0)
+        return matches[np.argsort(-scores[matches], kind="stable")]
+
+# TF-IDF vectors of character trigrams per row, stored as a sparse row matrix with
+# unit-length rows, so the cosine similarity of two rows is their dot product.
+# Trigrams are counted once per distinct cell value and the counts are gathered per
+# row with sparse row indexing, so long repetitive columns stay cheap to vectorize.
+class SimilarityIndex:
+    def __init__(self, data, columns):
+        import scipy.sparse as sparse
+
+        self.columns = [column for column in columns if column is not None]
+        self.row_count = len(data)
+        gram_ids = {}
+        counts = sparse.csr_matrix((self.row_count, 0), dtype=np.float32)
+        for column in self.columns:
+            values = data[column]
+            codes, uniques = pd.factorize(values)
+            indptr, indices, weights = [0], [], []
+            for value in uniques:
+                grams = {}
+                for token in tokenize(value):
+                    for gram in trigrams(token):
+                        gram_id = gram_ids.setdefault(gram, len(gram_ids))
+                        grams[gram_id] = grams.get(gram_id, 0) + 1
+                indices += grams.keys()
+                weights += grams.values()
+                indptr.append(len(indices))
+            # Missing cells get an empty row
+            indptr.append(len(indices))
+            value_grams = sparse.csr_matrix(
+                (np.array(weights, dtype=np.float32), np.array(indices, dtype=np.int64), np.array(indptr)),
+                shape=(len(uniques) + 1, len(gram_ids)))
+            counts.resize((self.row_count, len(gram_ids)))
+            counts = counts + value_grams[np.where(codes < 0, len(uniques), codes)]
+
+        # Sublinear term frequency times smoothed inverse document frequency, then unit rows
+        counts.sum_duplicates()
+        document_frequency = np.bincount(counts.indices, minlength=len(gram_ids))
+        idf = (np.log((1 + self.row_count) / (1 + document_frequency)) + 1).astype(np.float32)
+        counts.data = (1 + np.log(counts.data)) * idf[counts.indices]
+        norms = np.sqrt(np.asarray(counts.multiply(counts).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        self._vectors = sparse.csr_matrix(sparse.diags((1 / norms).astype(np.float32)) @ counts)
+        # Trigram -> rows, so a query only touches the rows sharing a trigram with it
+        self._postings = self._vectors.T.tocsr()
+
+    # Returns the `top` most similar other rows for each of `positions`, as a list of
+    # (row positions, similarities) pairs ordered by descending similarity; `candidates`
+    # is an optional boolean mask of the rows that may be returned. The queries are
+    # answered together with one sparse matrix product.
+    def similar(self, positions, top=SIMILARITY_DEFAULT_TOP, candidates=None):
+        positions = np.asarray(positions, dtype=np.int64)
+        top = max(top, 1)
+        scores = (self._vectors[positions] @ self._postings).tocsr()
+        results = []
+        for i, position in enumerate(positions):
+            start, stop = scores.indptr[i], scores.indptr[i + 1]
+            rows, values = scores.indices[start:stop], scores.data[start:stop]
+            keep = rows != position
+            if candidates is not None:
+                keep &= candidates[rows]
+            rows, values = rows[keep], values[keep]
+            if len(rows) > top:
+                best = np.argpartition(-values, top - 1)[:top]
+                rows, values = rows[best], values[best]
+            # Ties go to the earlier row
+            order = np.lexsort((rows, -values))
+            results.append((rows[order], values[order]))
+        return results
+
+# Row positions per category of one categorical filter column, grouped CSR-style
+class Facet:
+    def __init__(self, column, values):
+        self.column = column
+        self.options = list(values.cat.categories)
+        self.codes = values.cat.codes.to_numpy()
+        self._lookup = {option: code for code, option in enumerate(self.options)}
+        # Counting sort of the rows by code; rows without a value (code -1) come first.
+        # NumPy sorts integers of up to 16 bits stably with a radix sort, so this is linear
+        self._indptr = np.cumsum(np.bincount(self.codes.astype(np.int64) + 1, minlength=len(self.options) + 1))
+        self._rows = np.argsort(self.codes, kind="stable").astype(np.int32)
+
+    def code(self, option):
+        return self._lookup.get(option)
+
+    def rows(self, code):
+        return self._rows[self._indptr[code]:self._indptr[code + 1]]
+
+    def count(self, code):
+        return self._indptr[code + 1] - self._indptr[code]
+
+# Exact-match filtering over the dropdown columns. Selections are resolved to category
+# codes, the rarest selection supplies the candidate rows and the others are checked
+# against their code arrays, so a combination of filters never scans the full table.
+class FacetIndex:
+    def __init__(self, data, columns):
+        self.facets = {name: Facet(column, data[column]) for name, column in columns.items() if column is not None}
+
+    # Returns the plain values and the arrays of the index, for publishing it
+    def state(self):
+        arrays = {}
+        for name, facet in self.facets.items():
+            arrays.update({f"{name}_codes": facet.codes, f"{name}_indptr": facet._indptr, f"{name}_rows": facet._rows})
+        return {"columns": {name: facet.column for name, facet in self.facets.items()}}, arrays
+
+    # Returns an index over published arrays; the options come from the frame's categories
+    @classmethod
+    def attached(cls, data, values, arrays):
+        index = cls.__new__(cls)
+        index.facets = {}
+        for name, column in values["columns"].items():
+            facet = Facet.__new__(Facet)
+            facet.column = column
+            facet.options = list(data[column].cat.categories)
+            facet.codes = arrays[f"{name}_codes"]
+            facet._lookup = {option: code for code, option in enumerate(facet.options)}
+            facet._indptr = arrays[f"{name}_indptr"]
+            facet._rows = arrays[f"{name}_rows"]
+            index.facets[name] = facet
+        return index
+
+    # Returns row positions matching every selection ("All" means unfiltered), keeping
+    # the order of `rows` when given; None means no filter applies
+    def select_rows(self, selections, rows=None):
+        active = []
+        for name, option in selections.items():
+            if option == "All" or name not in self.facets:
+                continue
+            facet = self.facets[name]
+            code = facet.code(option)
+            if code is None:
+                return np.empty(0, dtype=np.int32)
+            active.append((facet, code))
+        if not active:
+            return rows
+        if rows is None:
+            active.sort(key=lambda item: item[0].count(item[1]))
+            facet, code = active.pop(0)
+            rows = facet.rows(code)
+        for facet, code in active:
+            rows = rows[facet.codes[rows] == code]
+        return rows
+
+    # Returns the number of options of one facet that occur in `rows` (all rows when None)
+    def distinct_count(self, name, rows=None):
+        facet = self.facets[name]
+        if rows is None:
+            return int(np.count_nonzero(np.diff(facet._indptr)))
+        codes = facet.codes[rows]
+        return int(np.count_nonzero(np.bincount(codes[codes >= 0], minlength=len(facet.options))))
+
+    # Returns per-facet option counts, each facet counted under all the other
+    # selections only, so a dropdown lists what is still reachable from it
+    def option_counts(self, selections, rows=None):
+        counts = {}
+        for name, facet in self.facets.items():
+            facet_rows = self.select_rows({other: option for other, option in selections.items() if other != name}, rows)
+            if facet_rows is None:
+                counts[name] = np.diff(facet._indptr)
+            else:
+                codes = facet.codes[facet_rows]
+                counts[name] = np.bincount(codes[codes >= 0], minlength=len(facet.options))
+        return counts
+
+# Dataset-wide counts and cost totals per department, equipment type and measurement
+# purpose, plus a department x equipment cross-tab. Built once per dataset version;
+# apply_delta() patches them with added and removed rows instead of recounting.
+class Aggregates:
+    def __init__(self, data, columns):
+        self.columns = {role: columns[role] for role in FACET_ROLES if columns.get(role) is not None}
+        self.cost_column = columns.get("cost")
+        self.has_cost = self.cost_column is not None
+        self._counts, self._costs, self._crosstab = self._summarize(data)
+
+    def _summarize(self, frame):
+        counts, costs = {}, {}
+        cost = frame[self.cost_column] if self.has_cost else None
+        for name, column in self.columns.items():
+            counts[name] = frame[column].value_counts()
+            if cost is not None:
+                costs[name] = cost.groupby(frame[column], observed=True).sum()
+        crosstab = None
+        if "department" in self.columns and "equipment" in self.columns:
+            crosstab = frame.groupby([self.columns["department"], self.columns["equipment"]], observed=True).size()
+        return counts, costs, crosstab
+
+    # Counts per option of one facet, largest first
+    def counts(self, name):
+        counts = self._counts[name]
+        return counts[counts > 0].sort_values(ascending=False, kind="stable")
+
+    # Total cost per option of one facet, largest first
+    def cost_totals(self, name):
+        return self._costs[name].sort_values(ascending=False, kind="stable")
+
+    # Department x equipment counts for the given departments and equipment types
+    def crosstab(self, departments, equipment):
+        table = self._crosstab.unstack(fill_value=0) if self._crosstab is not None else pd.DataFrame()
+        return table.reindex(index=list(departments), columns=list(equipment), fill_value=0)
+
+    # Returns a copy with the delta applied, leaving this instance untouched
+    def patched(self, removed, added):
+        aggregates = copy.copy(self)
+        aggregates._counts = dict(self._counts)
+        aggregates._costs = dict(self._costs)
+        aggregates.apply_delta(removed, added)
+        return aggregates
+
+    # Adds the summaries of `added` rows and subtracts those of `removed` rows. Counts
+    # stay integers; cost totals are rounded to COST_DECIMALS so subtraction leaves no
+    # residue, and an option keeps its total, even a zero one, while it still has rows.
+    def apply_delta(self, removed, added):
+        removed_counts, removed_costs, removed_crosstab = self._summarize(removed)
+        added_counts, added_costs, added_crosstab = self._summarize(added)
+        for name in self._counts:
+            self._counts[name] = self._combine_counts(self._counts[name], removed_counts[name], added_counts[name])
+            if self.has_cost:
+                costs = self._combine(self._costs[name], removed_costs[name], added_costs[name]).round(COST_DECIMALS)
+                self._costs[name] = costs[costs.index.isin(self._counts[name].index)]
+        if self._crosstab is not None:
+            self._crosstab = self._combine_counts(self._crosstab, removed_crosstab, added_crosstab)
+
+    @classmethod
+    def _combine_counts(cls, current, minus, plus):
+        combined = cls._combine(current, minus, plus).round().astype(np.int64)
+        return combined[combined != 0]
+
+    @staticmethod
+    def _combine(current, minus, plus):
+        # Categorical indexes from different versions cannot be aligned directly
+        if not isinstance(current.index, pd.MultiIndex):
+            current, minus, plus = (series.set_axis(series.index.astype(object)) for series in (current, minus, plus))
+        return current.sub(minus, fill_value=0).add(plus, fill_value=0)
+
+# Search structures of a dataset that are published for other processes by name; the
+# aggregates are small and published as one pickle
+SHARED_STRUCTURES = {
+    "keyword_index": KeywordIndex,
+    "fuzzy_index": FuzzyIndex,
+    "facet_index": FacetIndex,
+}
+
+# Function to time a load stage and report its progress
+def run_stage(timings, progress, stage, work):
+    if progress is not None:
+        progress(stage, 0.0)
+    started = time.perf_counter()
+    result = work()
+    timings[stage] = time.perf_counter() - started
+    telemetry.record(f"load: {stage.lower()}", timings[stage])
+    if progress is not None:
+        progress(stage, 1.0)
+    return result
+
+# Function to group dtypes that hash and tokenize alike; text may come back as object,
+# string or category depending on how many distinct values a version has
+def dtype_family(dtype):
+    if isinstance(dtype, pd.CategoricalDtype) or pd.api.types.is_object_dtype(dtype) or pd.api.types.is_string_dtype(dtype):
+        return "text"
+    return str(dtype)
+
+# Function to check whether two datasets share a layout, so one can be patched into the other
+def same_layout(previous, dataset):
+    return (
+        previous.source_columns == dataset.source_columns
+        and previous.columns == dataset.columns
+        and all(dtype_family(previous.data[column].dtype) == dtype_family(dataset.data[column].dtype)
+                for column in dataset.source_columns)
+    )
+
+# Function to compare a new dataset with the previous version row by row. Rows are
+# matched by row key when both versions have one, otherwise by content. Returns the
+# new position of every old row (-1 when it was deleted or edited), the positions of
+# new and edited rows in the new version, and the old positions of deleted and edited rows.
+def diff_rows(previous, dataset):
+    old_hashes, new_hashes = previous.row_hashes, dataset.row_hashes
+    key_column = dataset.row_keys.column
+    if key_column is not None and previous.row_keys.column == key_column:
+        remap = pd.Index(dataset.row_keys._keys).get_indexer(previous.row_keys._keys)
+        matched = remap >= 0
+        edited = np.flatnonzero(matched)[old_hashes[matched] != new_hashes[remap[matched]]]
+        remap[edited] = -1
+    else:
+        # Identical rows are paired up in order of occurrence
+        def hash_pairs(hashes):
+            occurrence = pd.Series(hashes).groupby(hashes).cumcount().to_numpy()
+            return pd.MultiIndex.from_arrays([hashes, occurrence])
+        remap = hash_pairs(new_hashes).get_indexer(hash_pairs(old_hashes))
+    kept = np.zeros(len(dataset.data), dtype=bool)
+    kept[remap[remap >= 0]] = True
+    return remap, np.flatnonzero(~kept), np.flatnonzero(remap < 0)
+
+# Function to build a dataset together with its search structures, once per version.
+# Given the `previous` version, only the inserted, edited and deleted rows are applied
+# to its search index and aggregates; the remaining structures are vectorized and
+# rebuilt in full.
+def build_dataset(version, data, timings, progress=None, previous=None):
+    source_columns = list(data.columns)
+    data, columns = run_stage(timings, progress, "Applying schema", lambda: apply_schema(data))
+    dataset = Dataset(version, data, timings)
+    dataset.columns = columns
+    dataset.source_columns = source_columns
+    dataset.row_hashes = pd.util.hash_pandas_object(data[source_columns], index=False).to_numpy()
+    dataset.row_keys = RowKeyIndex(data, columns["asset_id"], dataset.row_hashes)
+
+    diff = None
+    if previous is not None and same_layout(previous, dataset):
+        diff = run_stage(timings, progress, "Diffing rows", lambda: diff_rows(previous, dataset))
+        remap, added, removed = diff
+        if len(added) + len(removed) > PATCH_MAX_CHANGED_RATIO * max(len(data), 1):
+            diff = None
+
+    if diff is None:
+        dataset.keyword_index = run_stage(timings, progress, "Building search index",
+                                          lambda: KeywordIndex(data[source_columns]))
+        dataset.fuzzy_index = run_stage(timings, progress, "Building fuzzy index",
+                                        lambda: FuzzyIndex(data, [columns[role] for role in FUZZY_ROLES]))
+    else:
+        telemetry.count("dataset_patched")
+        dataset.keyword_index = run_stage(timings, progress, "Patching search index",
+                                          lambda: previous.keyword_index.patch(data[source_columns], remap, added))
+        dataset.fuzzy_index = run_stage(timings, progress, "Patching fuzzy index",
+                                        lambda: previous.fuzzy_index.patch(data, remap, added))
+    dataset.facet_index = run_stage(timings, progress, "Building filter index",
+                                    lambda: FacetIndex(data, {role: columns[role] for role in FACET_ROLES}))
+    if diff is None:
+        dataset.aggregates = run_stage(timings, progress, "Building aggregates", lambda: Aggregates(data, columns))
+    else:
+        dataset.aggregates = run_stage(timings, progress, "Patching aggregates", lambda: previous.aggregates.patched(
+            previous.data.iloc[removed], data.iloc[added]))
+    return dataset
+
+# Dataset and search structures published once for every worker process on this host.
+# Each version gets its own directory holding the frame as an uncompressed Feather file,
+# the index arrays as .npy files and the aggregates as a pickle; current.json names the
+# published version and is replaced atomically, so a worker sees either the old or the
+# new version. Workers attach by memory-mapping the files read-only, so the page cache
+# holds one copy for all of them; this covers the frame, the postings and the packed
+# vocabularies. The aggregates and the fuzzy trigram lookup are small Python objects
+# that every worker loads for itself, and each worker rebuilds its row key lookup. The
+# version before the current one is kept for workers still attaching to it; older ones
+# are removed.
+class SharedDatasetStore:
+    def __init__(self, sources, cache_dir=CACHE_DIR):
+        key = json.dumps([list(source) for source in sources])
+        self.directory = os.path.join(cache_dir, f"shared-{hashlib.sha256(key.encode()).hexdigest()[:12]}")
+        self.manifest_path = os.path.join(self.directory, "current.json")
+        self.lock_path = os.path.join(self.directory, "lock")
+
+    # Holds the store's lock across processes, so one worker refreshes and publishes
+    # while the others wait for it and then attach
+    @contextlib.contextmanager
+    def lock(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.lock_path, "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    # Returns the manifest of the published version, or None when nothing is published
+    def current(self):
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_manifest(self, manifest):
+        tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    # Publishes a dataset together with the state of its sources
+    def publish(self, dataset, sources, checked_at):
+        previous = self.current()
+        name = f"dataset-{dataset.version}-{os.getpid()}-{time.time_ns()}"
+        path = os.path.join(self.directory, name)
+        tmp_path = f"{path}.tmp"
+        os.makedirs(tmp_path)
+        values, arrays = dataset.state()
+        feather.write_feather(dataset.data, os.path.join(tmp_path, "data.feather"), compression="uncompressed")
+        for key, array in arrays.items():
+            np.save(os.path.join(tmp_path, f"{key}.npy"), array)
+        with open(os.path.join(tmp_path, "dataset.json"), "w") as f:
+            json.dump(values, f)
+        with open(os.path.join(tmp_path, "aggregates.pickle"), "wb") as f:
+            pickle.dump(dataset.aggregates, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        self._write_manifest({
+            "version": dataset.version,
+            "directory": name,
+            "loaded_at": dataset.loaded_at,
+            "checked_at": checked_at,
+            "sources": sources,
+        })
+        # Attached workers keep their memory maps of removed files
+        keep = {name, previous["directory"] if previous else None}
+        for entry in os.listdir(self.directory):
+            if entry.startswith("dataset-") and entry not in keep:
+                shutil.rmtree(os.path.join(self.directory, entry), ignore_errors=True)
+
+    # Records that the published version was revalidated
+    def touch(self, checked_at, sources):
+        manifest = self.current()
+        if manifest is not None:
+            manifest["checked_at"] = max(manifest["checked_at"], checked_at)
+            manifest["sources"] = sources
+            self._write_manifest(manifest)
+
+    # Returns the published dataset, with its frame and index arrays memory-mapped read-only
+    def attach(self, manifest, timings=None):
+        path = os.path.join(self.directory, manifest["directory"])
+        data = feather.read_table(os.path.join(path, "data.feather"), memory_map=True).to_pandas(split_blocks=True)
+        with open(os.path.join(path, "dataset.json")) as f:
+            values = json.load(f)
+        arrays = {
+            entry[:-len(".npy")]: np.asarray(np.load(os.path.join(path, entry), mmap_mode="r"))
+            for entry in os.listdir(path) if entry.endswith(".npy")
+        }
+        with open(os.path.join(path, "aggregates.pickle"), "rb") as f:
+            aggregates = pickle.load(f)
+        dataset = Dataset.attached(manifest["version"], data, values, arrays, aggregates, timings)
+        dataset.loaded_at = manifest["loaded_at"]
+        return dataset
+
+# Function to read the configured inventory sources as (name, location) pairs.
+# DSLAB_SOURCES holds "name=location" entries separated by semicolons or newlines,
+# or names a file with one entry per line; a location is an http(s) URL or a local
+# workbook path, so a single workbook can be given on its own. Without it the single
+# Google Sheet above is used.
+def configured_sources(spec=None):
+    spec = os.environ.get("DSLAB_SOURCES", "") if spec is None else spec
+    if spec and os.path.isfile(spec) and not spec.lower().endswith(WORKBOOK_SUFFIXES):
+        with open(spec, encoding="utf-8") as f:
+            spec = f.read()
+    entries = [entry.strip() for entry in re.split(r"[;\n]", spec) if entry.strip() and not entry.strip().startswith("#")]
+    sources = []
+    for number, entry in enumerate(entries or [SHEET_URL], start=1):
+        named = SOURCE_ENTRY_PATTERN.match(entry)
+        sources.append((named.group(1).strip(), named.group(2).strip()) if named else (f"Source {number}", entry))
+    return sources
+
+# Function to parse downloaded workbook bytes into a normalized frame
+def parse_workbook(content):
+    return normalize_frame(pd.read_excel(BytesIO(content)))
+
+# Function to merge the frames of several sources into one, with the schema's
+# positional columns renamed to the first source's headers and a Source column
+def merge_sources(frames):
+    if len(frames) == 1:
+        return frames[0][1]
+    template = resolve_columns(frames[0][1])
+    conformed = []
+    for name, frame in frames:
+        columns = resolve_columns(frame)
+        renames = {
+            columns[role]: template[role]
+            for role, spec in SCHEMA.items()
+            if "position" in spec and columns[role] != template[role]
+        }
+        conformed.append(frame.rename(columns=renames).assign(**{SOURCE_COLUMN: name}))
+    merged = pd.concat(conformed, ignore_index=True, sort=False)
+    # Keep the first source's layout so the positional columns stay in place
+    merged = merged[[column for column in merged.columns if column != SOURCE_COLUMN] + [SOURCE_COLUMN]]
+    return normalize_frame(merged)
+
+# One inventory workbook with its own snapshot, validators and refresh schedule.
+# A failed refresh keeps the last good frame and is retried shortly.
+class SourceCache:
+    def __init__(self, name, location, ttl=CACHE_TTL_SECONDS, snapshots=None):
+        self.name = name
+        self.location = location
+        self.ttl = ttl
+        self.snapshots = snapshots if snapshots is not None else SnapshotStore(location)
+        self.data = None
+        self.version = None
+        self.checked_at = 0.0
+        self.last_error = None
+        self._etag = None
+        self._last_modified = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def is_fresh(self):
+        return self.version is not None and time.time() < self._expires_at
+
+    def is_remote(self):
+        return "://" in self.location
+
+    def load_snapshot(self, timings, progress=None):
+        data, manifest = run_stage(timings, progress, "Loading snapshot", self.snapshots.load)
+        if data is None:
+            return False
+        self.data = data
+        self.version = manifest["version"]
+        self._etag = manifest.get("etag")
+        self._last_modified = manifest.get("last_modified")
+        return True
+
+    # Returns what another worker needs to adopt this source's version
+    def shared_state(self):
+        return {
+            "version": self.version,
+            "etag": self._etag,
+            "last_modified": self._last_modified,
+            "error": None if self.last_error is None else str(self.last_error),
+        }
+
+    # Takes over the version, validators and refresh schedule published by another
+    # worker. The frame is only read back from the snapshot when a rebuild needs it.
+    def adopt(self, state, checked_at):
+        with self._lock:
+            if state["version"] != self.version:
+                self.data = None
+            self.version = state["version"]
+            self._etag = state["etag"]
+            self._last_modified = state["last_modified"]
+            self.last_error = state["error"]
+            self.checked_at = checked_at
+            self._expires_at = checked_at + (self.ttl if state["error"] is None else min(self.ttl, RETRY_AFTER_SECONDS))
+
+    # Reads the frame of an adopted version back from the snapshot. Without a snapshot
+    # of that version the source is left to be downloaded in full on its next refresh.
+    def restore(self, timings, progress=None):
+        if self.data is not None or self.version is None:
+            return
+        version = self.version
+        if not self.load_snapshot(timings, progress) or self.version != version:
+            self.data = self.version = self._etag = self._last_modified = None
+            self._expires_at = 0.0
+
+    # Fetches the workbook unless it is fresh; returns True when its content changed
+    def refresh(self, timings, progress=None, force=False):
+        with self._lock:
+            if not force and self.is_fresh():
+                return False
+            try:
+                changed = self._revalidate(timings, progress)
+            except LOAD_ERRORS as e:
+                telemetry.count("refresh_error")
+                self.last_error = e
+                self.checked_at = time.time()
+                self._expires_at = self.checked_at + min(self.ttl, RETRY_AFTER_SECONDS)
+                if self.version is None:
+                    raise
+                return False
+            self.last_error = None
+            self.checked_at = time.time()
+            self._expires_at = self.checked_at + self.ttl
+            return changed
+
+    def _revalidate(self, timings, progress=None):
+        fetched = run_stage(timings, progress, "Downloading", lambda: self._fetch(progress))
+        if fetched is None:
+            telemetry.count("sheet_not_modified")
+            return False
+        # The new validators are only kept once the content is known to be good, so a
+        # broken upload is fetched and reported again on the next revalidation
+        content, etag, last_modified = fetched
+        version = hashlib.sha256(content).hexdigest()[:16]
+        # Only re-parse when the content actually changed
+        if version == self.version:
+            telemetry.count("sheet_unchanged")
+            self._etag, self._last_modified = etag, last_modified
+            return False
+        telemetry.count("sheet_reloaded")
+        try:
+            data = run_stage(timings, progress, "Parsing", lambda: parse_workbook(content))
+        except Exception as e:
+            # A corrupt or truncated workbook fails in the zip and XML readers with their own
+            # exception types; it is reported as a load error so the last good copy is kept
+            raise ValueError(f"the workbook could not be parsed: {e}") from e
+        # Reject a sheet that does not match the schema before it replaces the last good one
+        resolve_columns(data)
+        self.data, self.version = data, version
+        self._etag, self._last_modified = etag, last_modified
+        try:
+            run_stage(timings, progress, "Saving snapshot",
+                      lambda: self.snapshots.save(version, data, etag, last_modified))
+        except (OSError, ValueError, TypeError):
+            # The snapshot only speeds up cold starts; serving data matters more
+            pass
+        return True
+
+    # Returns the workbook bytes with their ETag and Last-Modified validators, or None
+    # when they are known to be unchanged; a local file's ETag is its mtime and size
+    def _fetch(self, progress=None):
+        if not self.is_remote():
+            stat = os.stat(self.location)
+            signature = f"{stat.st_mtime_ns}-{stat.st_size}"
+            if self.version is not None and signature == self._etag:
+                return None
+            with open(self.location, "rb") as f:
+                return f.read(), signature, None
+        headers = {}
+        if self.version is not None:
+            if self._etag:
+                headers["If-None-Match"] = self._etag
+            if self._last_modified:
+                headers["If-Modified-Since"] = self._last_modified
+        return self._download(headers, progress)
+
+    # Streams the workbook with its validators, returning None when the server reports
+    # it unchanged
+    def _download(self, headers, progress=None):
+        import requests
+
+        with requests.get(self.location, headers=headers, timeout=REQUEST_TIMEOUT_SECONDS, stream=True) as response:
+            if response.status_code == 304:
+                return None
+            response.raise_for_status()
+            total = int(response.headers.get("Content-Length") or 0)
+            buffer = BytesIO()
+            for chunk in response.iter_content(DOWNLOAD_CHUNK_BYTES):
+                buffer.write(chunk)
+                if progress is not None and total:
+                    progress("Downloading", min(buffer.tell() / total, 1.0), f"{buffer.tell() / 1e6:.1f} of {total / 1e6:.1f} MB")
+            return buffer.getvalue(), response.headers.get("ETag"), response.headers.get("Last-Modified")
+
+# Process-wide dataset cache shared by all sessions, merging one or more sources.
+# Reads within the TTL are served from memory; once it passes, the data is still
+# served while a background thread revalidates only the stale sources, concurrently
+# and each with its own ETag/Last-Modified, snapshot and last good copy, and the
+# merged dataset is only rebuilt when one of them changed. A source that is
+# still loading after SOURCE_WAIT_SECONDS keeps its previous data for this refresh
+# and is merged in once it arrives. A fresh process starts from the on-disk
+# snapshots and revalidates them in the background. With `shared` the worker processes
+# of a host take turns to revalidate: whoever holds the store's lock refreshes and
+# publishes, and the others attach to the published dataset instead of building one.
+class DatasetCache:
+    def __init__(self, sources=None, ttl=CACHE_TTL_SECONDS, shared=SHARED_DATASET):
+        if sources is None:
+            sources = configured_sources()
+        elif isinstance(sources, str):
+            sources = [("Source 1", sources)]
+        self.sources = [SourceCache(name, location, ttl) for name, location in sources]
+        self.shared = SharedDatasetStore(sources) if shared else None
+        self.ttl = ttl
+        self.dataset = None
+        self.checked_at = 0.0
+        self._changed_late = False
+        self._snapshot_checked = False
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=min(SOURCE_WORKERS, len(self.sources)), thread_name_prefix="source")
+
+    # The refresh errors of the sources still served from their last good copy
+    @property
+    def last_error(self):
+        failing = [source for source in self.sources if source.last_error is not None]
+        if len(self.sources) == 1 or not failing:
+            return failing[0].last_error if failing else None
+        return "; ".join(f"{source.name}: {source.last_error}" for source in failing)
+
+    def is_fresh(self):
+        return self.dataset is not None and not self._changed_late and all(source.is_fresh() for source in self.sources)
+
+    def get(self, force=False, progress=None):
+        # Stale data is served while a background refresh runs; only a cold start or a
+        # forced refresh waits for the sources
+        if not force and self.dataset is not None:
+            if self.is_fresh():
+                telemetry.count("dataset_cache_hit")
+            else:
+                telemetry.count("dataset_cache_stale")
+                self.refresh_in_background()
+            return self.dataset
+        telemetry.count("dataset_cache_miss")
+        return self._revalidate(force, progress)
+
+    # Revalidates the stale sources, or every source when `force`, and returns the
+    # dataset. In shared mode a dataset another worker published within the TTL is
+    # attached instead, unless `force`.
+    def _revalidate(self, force=False, progress=None):
+        requested_at = time.time()
+        with self._lock:
+            # Another session may have refreshed the data while we were waiting
+            if self.checked_at >= requested_at or (not force and self.is_fresh()):
+                return self.dataset
+            if self.shared is None:
+                self._load(force, progress)
+                return self.dataset
+            with self.shared.lock():
+                if not self._attach_shared(requested_at, force, progress):
+                    self._load(force, progress)
+                    self._publish_shared(progress)
+            return self.dataset
+
+    # Starts from the snapshots on a cold start, otherwise refreshes the stale sources
+    def _load(self, force=False, progress=None):
+        if self.dataset is None and not self._snapshot_checked:
+            self._snapshot_checked = True
+            if self._load_snapshots(progress):
+                telemetry.count("snapshot_loaded")
+                self.refresh_in_background()
+                return
+        self._refresh(force, progress)
+        self.checked_at = time.time()
+
+    # Attaches to the dataset another worker published. Returns True when it serves
+    # this request as is: it was revalidated within the TTL (or since `requested_at`),
+    # or this worker had no data yet and revalidates it in the background.
+    def _attach_shared(self, requested_at, force, progress=None):
+        manifest = self.shared.current()
+        if manifest is None:
+            return False
+        cold = self.dataset is None
+        if not cold and self.dataset.version != manifest["version"]:
+            # This worker built a newer version than the published one
+            if manifest["loaded_at"] <= self.dataset.loaded_at:
+                return False
+        if cold or self.dataset.version != manifest["version"]:
+            timings = {}
+            try:
+                dataset = run_stage(timings, progress, "Attaching shared dataset",
+                                    lambda: self.shared.attach(manifest, timings))
+            except (OSError, ValueError, KeyError, pickle.UnpicklingError):
+                return False
+            telemetry.count("shared_dataset_attached")
+            self.dataset = dataset
+            self._snapshot_checked = True
+        for source, state in zip(self.sources, manifest["sources"]):
+            source.adopt(state, manifest["checked_at"])
+        if manifest["checked_at"] >= requested_at or (not force and time.time() < manifest["checked_at"] + self.ttl):
+            self.checked_at = manifest["checked_at"]
+            return True
+        if cold:
+            self.refresh_in_background()
+            return True
+        return False
+
+    # Publishes a new dataset for the other workers, or records that the published
+    # one was revalidated
+    def _publish_shared(self, progress=None):
+        if self.dataset is None:
+            return
+        manifest = self.shared.current()
+        sources = [source.shared_state() for source in self.sources]
+        try:
+            if manifest is not None and manifest["version"] == self.dataset.version:
+                self.shared.touch(self.checked_at, sources)
+                return
+            run_stage(self.dataset.timings, progress, "Publishing shared dataset",
+                      lambda: self.shared.publish(self.dataset, sources, self.checked_at))
+            telemetry.count("shared_dataset_published")
+        except (OSError, ValueError, TypeError, pickle.PicklingError):
+            # Sharing only saves the other workers work; serving data matters more
+            pass
+
+    # Dataset size, source health and search cache statistics, read when metrics are exported
+    def gauges(self):
+        dataset = self.dataset
+        if dataset is None:
+            return {}
+        keyword_cache = dataset.keyword_index._match.cache_info()
+        fuzzy_cache = dataset.fuzzy_index._expand.cache_info()
+        return {
+            "dataset_rows": len(dataset.data),
+            "dataset_age_seconds": time.time() - dataset.loaded_at,
+            "dataset_memory_bytes": int(dataset.data.memory_usage(deep=False).sum()),
+            "sources": len(self.sources),
+            "sources_failing": sum(source.last_error is not None for source in self.sources),
+            "keyword_term_cache_hits": keyword_cache.hits,
+            "keyword_term_cache_misses": keyword_cache.misses,
+            "fuzzy_expansion_cache_hits": fuzzy_cache.hits,
+            "fuzzy_expansion_cache_misses": fuzzy_cache.misses,
+        }
+
+    def refresh_in_background(self):
+        if self._refreshing:
+            return
+        self._refreshing = True
+
+        def refresh():
+            try:
+                self._revalidate()
+            except LOAD_ERRORS:
+                # Errors are kept per source and shown with the data already loaded
+                pass
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=refresh, name="dataset-refresh", daemon=True).start()
+
+    # Starts from the snapshots of whichever sources have one; the background refresh
+    # then fetches the rest
+    def _load_snapshots(self, progress=None):
+        timings = {}
+        loaded = [source.load_snapshot(timings, progress) for source in self.sources]
+        if not any(loaded):
+            return False
+        self._rebuild(timings, progress)
+        return True
+
+    # Refreshes the stale sources, one inline or several concurrently, and rebuilds the
+    # dataset when any of them changed; raises only when no source has data at all
+    def _refresh(self, force=False, progress=None):
+        timings = {}
+        stale = [source for source in self.sources if force or not source.is_fresh()]
+        changed = self._changed_late
+        self._changed_late = False
+        if len(self.sources) == 1:
+            changed = self.sources[0].refresh(timings, progress, force) or changed
+        elif stale:
+            changed = self._refresh_concurrently(stale, timings, force, progress) or changed
+        if changed or self.dataset is None:
+            self._rebuild(timings, progress)
+
+    def _refresh_concurrently(self, stale, timings, force, progress=None):
+        source_timings = {source.name: {} for source in stale}
+        futures = {self._pool.submit(source.refresh, source_timings[source.name], None, force): source for source in stale}
+        # A cold start waits for every source; a refresh only waits so long for slow ones
+        done, pending = wait(futures, timeout=None if self.dataset is None else SOURCE_WAIT_SECONDS)
+        changed, errors = False, []
+        for future in done:
+            try:
+                changed = future.result() or changed
+            except LOAD_ERRORS as e:
+                errors.append(e)
+        for future in pending:
+            future.add_done_callback(self._source_finished_late)
+        for name, stages in source_timings.items():
+            timings.update({f"{stage} ({name})": seconds for stage, seconds in stages.items()})
+        if progress is not None:
+            progress("Downloading", 1.0, f"{len(done)} of {len(stale)} sources")
+        if errors and all(source.version is None for source in self.sources):
+            raise errors[0]
+        return changed
+
+    def _source_finished_late(self, future):
+        if not future.cancelled() and future.exception() is None and future.result():
+            self._changed_late = True
+
+    def _rebuild(self, timings, progress=None):
+        for source in self.sources:
+            source.restore(timings, progress)
+        loaded = [source for source in self.sources if source.data is not None]
+        if len(loaded) == 1 and len(self.sources) == 1:
+            version = loaded[0].version
+        else:
+            version = hashlib.sha256("\n".join(f"{source.name}:{source.version}" for source in loaded).encode()).hexdigest()[:16]
+        if self.dataset is not None and self.dataset.version == version:
+            return
+        data = run_stage(timings, progress, "Merging sources", lambda: merge_sources([(source.name, source.data) for source in loaded]))
+        self.dataset = build_dataset(version, data, timings, progress, previous=self.dataset)
+
+# Function to run a text search: ranked in fuzzy mode, otherwise every term must
+# match within `columns` (all columns when empty); None means no text filter applies
+def search_rows(dataset, text, fuzzy=False, columns=None):
+    if not text:
+        return None
+    with telemetry.stage("fuzzy search" if fuzzy else "search", rows_in=len(dataset.data)) as stage:
+        if fuzzy:
+            rows = dataset.fuzzy_index.search(text)
+        else:
+            rows = dataset.keyword_index.search(text, columns=columns)
+        stage.rows_out = None if rows is None else len(rows)
+    return rows
+
+# Function to measure a cached value: arrays by their buffer, frames by their columns,
+# numbers as one word and anything else (bytes, str) by its length
+def value_bytes(value):
+    if value is None:
+        return 0
+    if isinstance(value, (int, float, np.number)):
+        return 8
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(np.sum(value.memory_usage(index=True, deep=False)))
+    return len(value)
+
+# Result row positions of recent queries, shared by every session in the process and
+# evicted least recently used first once their arrays outgrow `max_bytes`. Keys start
+# with the dataset version, so a refreshed dataset never sees results of an older one;
+# those are dropped as soon as a newer version is queried. Other values derived from a
+# query, such as export bytes, are cached the same way under their own `name`.
+class ResultCache:
+    # Bookkeeping per entry on top of the row array: key tuple, dict slot and array header
+    ENTRY_OVERHEAD_BYTES = 512
+
+    def __init__(self, max_bytes=RESULT_CACHE_BYTES, name="result_cache"):
+        self.max_bytes = max_bytes
+        self.name = name
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = collections.OrderedDict()
+        self._versions = set()
+        self._lock = threading.Lock()
+
+    # Returns (True, rows) for a cached result and (False, None) otherwise
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                telemetry.count(f"{self.name}_hit")
+                return True, self._entries[key][0]
+            self.misses += 1
+        telemetry.count(f"{self.name}_miss")
+        return False, None
+
+    # Stores a row array, None, or another value with a size: bytes or a frame
+    def put(self, key, rows):
+        size = self.ENTRY_OVERHEAD_BYTES + value_bytes(rows)
+        if size > self.max_bytes:
+            return
+        if isinstance(rows, np.ndarray):
+            # Shared between sessions, so nobody may modify it in place
+            rows.flags.writeable = False
+        with self._lock:
+            version = key[0]
+            if version not in self._versions:
+                self._drop_other_versions(version)
+            if key in self._entries:
+                self.bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (rows, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.bytes -= evicted
+                self.evictions += 1
+
+    def _drop_other_versions(self, version):
+        for key in [key for key in self._entries if key[0] != version]:
+            self.bytes -= self._entries.pop(key)[1]
+        self._versions = {version}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions = set()
+            self.bytes = 0
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def gauges(self):
+        return {
+            f"{self.name}_entries": len(self),
+            f"{self.name}_bytes": self.bytes,
+            f"{self.name}_hits": self.hits,
+            f"{self.name}_misses": self.misses,
+            f"{self.name}_evictions": self.evictions,
+        }
+
+# Process-wide result cache used by filter_rows
+result_cache = ResultCache()
+telemetry.register_gauges("results", result_cache.gauges)
+
+# Function to reduce a query to the parts that decide its result: the distinct search
+# terms in any order, the searched columns (ignored by the ranked search) and the
+# dropdowns that are not set to "All". Text without any terms is kept as it is, since
+# it matches nothing rather than everything.
+def normalized_query(text, fuzzy=False, columns=None, selections=None):
+    text = (text or "").strip()
+    terms = tuple(sorted(set(tokenize(text)))) or ((text,) if text else ())
+    fuzzy = bool(fuzzy) and bool(terms)
+    columns = () if fuzzy or not terms else tuple(sorted(set(columns or ())))
+    selections = tuple(sorted((role, option) for role, option in (selections or {}).items() if option != "All"))
+    return terms, fuzzy, columns, selections
+
+# Function to resolve a text search plus dropdown selections to row positions through
+# the shared result cache; None means every row matches. The text search alone is
+# cached as well, since the dropdown option counts are taken over it.
+def filter_rows(dataset, text, fuzzy=False, columns=None, selections=None, cache=result_cache):
+    terms, fuzzy, columns, selections = normalized_query(text, fuzzy, columns, selections)
+    key = (dataset.version, terms, fuzzy, columns, selections)
+    found, rows = cache.get(key)
+    if found:
+        return rows
+    if selections:
+        rows = filter_rows(dataset, text, fuzzy, columns, cache=cache)
+        with telemetry.stage("filter", rows_in=len(dataset.data) if rows is None else len(rows)) as stage:
+            rows = dataset.facet_index.select_rows(dict(selections), rows)
+            stage.rows_out = len(dataset.data) if rows is None else len(rows)
+    else:
+        rows = search_rows(dataset, " ".join(terms), fuzzy, list(columns))
+    cache.put(key, rows)
+    return rows
+
+# Export formats: file name suffix and mime type
+EXPORT_FORMATS = {
+    "CSV": (".csv", "text/csv"),
+    "Excel": (".xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "CSV (gzip)": (".csv.gz", "application/gzip"),
+    "Parquet": (".parquet", "application/vnd.apache.parquet"),
+}
+EXPORT_CHUNK_ROWS = 50_000
+# Function to write an export to a binary file object, one chunk of rows at a time.
+# `rows` and `columns` select part of `frame`; each chunk is gathered only when it is
+# written, so exporting a query result never holds a copy of the whole selection.
+def write_export(frame, export_format, fileobj, chunk_rows=EXPORT_CHUNK_ROWS, rows=None, columns=None):
+    total = len(frame) if rows is None else len(rows)
+    with telemetry.stage(f"export: {export_format}", rows_in=total) as stage:
+        # The Parquet schema comes from the whole columns: a chunk without values would
+        # otherwise give a column the null type and the later chunks would not fit it
+        schema = None
+        if export_format == "Parquet":
+            selected = frame if columns is None else frame.iloc[:, frame.columns.get_indexer(list(columns))]
+            schema = pa.Schema.from_pandas(selected, preserve_index=False)
+        _write_export(export_chunks(frame, rows, columns, chunk_rows), export_format, fileobj, schema)
+        stage.rows_out = total
+
+# Function to yield the selected rows and columns of a frame in chunks; an empty
+# selection yields one empty chunk, so the export still has its header
+def export_chunks(frame, rows, columns, chunk_rows):
+    rows = np.arange(len(frame)) if rows is None else rows
+    for start in range(0, max(len(rows), 1), chunk_rows):
+        yield take_rows(frame, rows[start:start + chunk_rows], columns)
+
+def _write_export(chunks, export_format, fileobj, schema=None):
+    if export_format == "Excel":
+        # pandas writes cells column by column, which xlsxwriter's constant_memory mode
+        # cannot take: it only keeps the current row and drops cells of earlier rows
+        with pd.ExcelWriter(fileobj, engine=EXCEL_ENGINE) as writer:
+            row = 0
+            for chunk in chunks:
+                chunk.to_excel(writer, index=False, header=row == 0, startrow=row if row == 0 else row + 1)
+                row += len(chunk)
+    elif export_format == "Parquet":
+        import pyarrow.parquet as pq
+
+        with pq.ParquetWriter(fileobj, schema) as writer:
+            for chunk in chunks:
+                writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+    else:
+        target = gzip.GzipFile(fileobj=fileobj, mode="wb", compresslevel=6) if export_format == "CSV (gzip)" else fileobj
+        for i, chunk in enumerate(chunks):
+            target.write(chunk.to_csv(index=False, header=i == 0).encode("utf-8"))
+        if target is not fileobj:
+            target.close()
+
+# Function to order row positions by a column, keeping the current order for ties
+def sort_rows(data, rows, column, ascending=True):
+    values = data[column].iloc[rows].reset_index(drop=True)
+    order = values.sort_values(ascending=ascending, na_position="last", kind="stable").index.to_numpy()
+    return rows[order]
@@ -0,0 +1,165 @@
+# Opt-in performance telemetry: wall time and row counts per stage, event counters
+# and peak memory, exported as Prometheus text. Enabled with DSLAB_TELEMETRY=1;
+# DSLAB_METRICS_FILE additionally keeps a copy of the metrics in a local file.
+# When disabled every call returns straight away, so the hot paths pay one check.
+
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+TELEMETRY_ENABLED = os.environ.get("DSLAB_TELEMETRY", "").lower() in ("1", "true", "yes", "on")
+METRICS_FILE = os.environ.get("DSLAB_METRICS_FILE")
+METRICS_FLUSH_SECONDS = 10
+
+# Function to read the peak resident memory of this process in bytes, if the platform reports it
+def peak_memory_bytes():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+# Accumulated timings of one stage
+class StageStats:
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.last_seconds = 0.0
+        self.rows_in = 0
+        self.rows_out = 0
+
+# One timed stage; set `rows_out` inside the with-block to record the result size
+class StageTimer:
+    def __init__(self, telemetry, name, rows_in):
+        self.telemetry = telemetry
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.telemetry.record(self.name, time.perf_counter() - self.started, self.rows_in, self.rows_out)
+        return False
+
+# Stand-in handed out while telemetry is disabled
+class NullTimer:
+    rows_out = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+NULL_TIMER = NullTimer()
+
+class Telemetry:
+    def __init__(self, enabled=TELEMETRY_ENABLED, metrics_file=METRICS_FILE):
+        self.enabled = enabled
+        self.metrics_file = metrics_file
+        self.started_at = time.time()
+        self.stages = {}
+        self.counters = {}
+        self._gauges = {}
+        self._flushed_at = 0.0
+        self._lock = threading.Lock()
+
+    # Returns a context manager timing the enclosed block as stage `name`
+    def stage(self, name, rows_in=None):
+        if not self.enabled:
+            return NULL_TIMER
+        return StageTimer(self, name, rows_in)
+
+    def record(self, name, seconds, rows_in=None, rows_out=None):
+        if not self.enabled:
+            return
+        with self._lock:
+            stats = self.stages.get(name)
+            if stats is None:
+                stats = self.stages[name] = StageStats()
+            stats.calls += 1
+            stats.seconds += seconds
+            stats.last_seconds = seconds
+            stats.max_seconds = max(stats.max_seconds, seconds)
+            stats.rows_in += rows_in or 0
+            stats.rows_out += rows_out or 0
+        self.flush()
+
+    def count(self, name, amount=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    # Registers a function returning {name: value} that is only read when metrics are exported
+    def register_gauges(self, source, read):
+        self._gauges[source] = read
+
+    def gauges(self):
+        values = {"peak_memory_bytes": peak_memory_bytes(), "uptime_seconds": time.time() - self.started_at}
+        for read in list(self._gauges.values()):
+            values.update(read())
+        return {name: value for name, value in values.items() if value is not None}
+
+    # Returns the metrics in the Prometheus text exposition format
+    def prometheus_text(self):
+        with self._lock:
+            stages = [(name, vars(stats).copy()) for name, stats in sorted(self.stages.items())]
+            counters = sorted(self.counters.items())
+        lines = []
+        for metric, field, kind, help_text in (
+            ("dslab_stage_calls_total", "calls", "counter", "Times each stage ran"),
+            ("dslab_stage_seconds_total", "seconds", "counter", "Wall time spent in each stage"),
+            ("dslab_stage_seconds_max", "max_seconds", "gauge", "Slowest run of each stage"),
+            ("dslab_stage_seconds_last", "last_seconds", "gauge", "Latest run of each stage"),
+            ("dslab_stage_rows_in_total", "rows_in", "counter", "Rows going into each stage"),
+            ("dslab_stage_rows_out_total", "rows_out", "counter", "Rows coming out of each stage"),
+        ):
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}"]
+            lines += [f'{metric}{{stage="{escape_label(name)}"}} {format_value(stats[field])}' for name, stats in stages]
+        lines += ["# HELP dslab_events_total Cache hits, misses and other events", "# TYPE dslab_events_total counter"]
+        lines += [f'dslab_events_total{{event="{escape_label(name)}"}} {format_value(value)}' for name, value in counters]
+        for name, value in sorted(self.gauges().items()):
+            lines += [f"# TYPE dslab_{name} gauge", f"dslab_{name} {format_value(value)}"]
+        return "\n".join(lines) + "\n"
+
+    # Writes the metrics file, at most once every METRICS_FLUSH_SECONDS unless forced
+    def flush(self, force=False):
+        if not self.metrics_file or (not force and time.time() - self._flushed_at < METRICS_FLUSH_SECONDS):
+            return
+        self._flushed_at = time.time()
+        directory = os.path.dirname(os.path.abspath(self.metrics_file))
+        try:
+            with tempfile.NamedTemporaryFile("w", dir=directory, delete=False, suffix=".tmp") as f:
+                f.write(self.prometheus_text())
+            # Readable by a metrics collector running as another user
+            os.chmod(f.name, 0o644)
+            os.replace(f.name, self.metrics_file)
+        except OSError:
+            # Metrics must never break the app
+            pass
+
+# Function to format a sample value without losing the precision of large counts
+def format_value(value):
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+# Function to escape a Prometheus label value
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+# Process-wide telemetry shared by the app, the API and the engine
+telemetry = Telemetry()
@@ -0,0 +1,76 @@
+import json
+
+import pytest
+from starlette.testclient import TestClient
+
+import dslab_api
+from dslab_bench import synthetic_inventory
+from dslab_engine import DatasetCache, SnapshotStore
+
+# Function to build an unshared dataset cache over one local workbook
+def workbook_cache(tmp_path, path):
+    cache = DatasetCache(sources=[("Main", str(path))], shared=False)
+    cache.sources[0].snapshots = SnapshotStore(str(path), cache_dir=str(tmp_path / "cache"))
+    return cache
+
+@pytest.fixture(scope="module")
+def inventory(tmp_path_factory):
+    tmp_path = tmp_path_factory.mktemp("api")
+    path = tmp_path / "inventory.xlsx"
+    synthetic_inventory(300).to_excel(path, index=False)
+    cache = workbook_cache(tmp_path, path)
+    cache.get()
+    return cache
+
+@pytest.fixture
+def client(inventory, monkeypatch):
+    monkeypatch.setattr(dslab_api, "dataset_cache", inventory)
+    return TestClient(dslab_api.app)
+
+def test_search_pages_through_every_match(client, inventory):
+    everything = client.get("/search", params={"q": "school", "limit": 1000}).json()
+    assert everything["total"] == len(everything["rows"]) > 10
+    first = client.get("/search", params={"q": "school", "limit": 4}).json()
+    second = client.get("/search", params={"q": "school", "limit": 4, "offset": 4}).json()
+    assert (first["limit"], second["offset"]) == (4, 4)
+    assert [row["_key"] for row in first["rows"] + second["rows"]] == [row["_key"] for row in everything["rows"][:8]]
+    assert first["version"] == inventory.dataset.version
+
+def test_search_sorts_and_selects_fields(client):
+    body = client.get("/search", params={"sort": "Serial No", "order": "desc", "fields": "Serial No", "limit": 5}).json()
+    serials = [row["Serial No"] for row in body["rows"]]
+    assert serials == sorted(serials, reverse=True)
+    assert set(body["rows"][0]) == {"_key", "Serial No"}
+
+def test_ndjson_streams_every_match(client):
+    response = client.get("/search", params={"q": "meter", "format": "ndjson"})
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert len(lines) == int(response.headers["X-Total-Count"])
+
+@pytest.mark.parametrize("params", [
+    {"limit": "ten"},
+    {"offset": "-1"},
+    {"sort": "Colour"},
+    {"columns": "Colour"},
+    {"format": "xml"},
+])
+def test_bad_parameters_are_rejected(client, params):
+    response = client.get("/search", params=params)
+    assert response.status_code == 400
+    assert "error" in response.json()
+
+def test_rows_by_key(client):
+    key = client.get("/search", params={"limit": 1}).json()["rows"][0]["_key"]
+    assert client.get(f"/rows/{key}").json()["row"]["_key"] == key
+    similar = client.get(f"/rows/{key}/similar", params={"top": 3}).json()
+    assert similar["key"] == key and len(similar["rows"]) == len(similar["similarity"]) <= 3
+    assert client.get("/rows/no-such-key").status_code == 404
+    assert client.get("/rows/no-such-key/similar").status_code == 404
+    assert client.get("/aggregates/colour").status_code == 404
+
+def test_unavailable_data_is_503(tmp_path, monkeypatch):
+    monkeypatch.setattr(dslab_api, "dataset_cache", workbook_cache(tmp_path, tmp_path / "missing.xlsx"))
+    response = TestClient(dslab_api.app).get("/search", params={"q": "meter"})
+    assert response.status_code == 503
+    assert "not available" in response.json()["error"]
@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+
+from dslab_charts import (
+    DENSITY_BINS,
+    FREQUENCY_MAX_BARS,
+    HISTOGRAM_BINS,
+    SCATTER_SVG_MAX_POINTS,
+    SCATTER_WEBGL_MAX_POINTS,
+    age_histogram,
+    column_frequency_chart,
+    column_histogram,
+    value_vs_age_chart,
+)
+
+# Function to build a frame of ages and log-normal costs, like the inventory's
+def aged_items(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "Age": rng.uniform(0, 30, rows),
+        "Cost": rng.lognormal(10, 2, rows),
+        "Name": [f"Item {n}" for n in range(rows)],
+    })
+
+def test_histogram_sends_only_the_bins():
+    values = pd.Series([1.0, 2.0, 2.5, np.nan, np.inf, -np.inf] + [3.0] * 10_000)
+    fig = column_histogram(pd.DataFrame({"Cost": values}), "Cost")
+    bars = fig.data[0]
+    assert len(bars.x) == len(bars.y) == HISTOGRAM_BINS
+    # Missing and infinite values are left out of the counts
+    assert sum(bars.y) == 10_003
+    assert bars.customdata[0][0] == 1.0 and bars.customdata[-1][1] == 3.0
+
+def test_figure_payload_does_not_grow_with_the_rows():
+    small, large = aged_items(1_000), aged_items(100_000)
+    assert len(age_histogram(large).to_json()) < 1.2 * len(age_histogram(small).to_json())
+
+def test_age_histogram_box_uses_quartiles_and_fences():
+    ages = pd.Series(np.r_[np.arange(1.0, 21.0), 200.0])
+    box = age_histogram(pd.DataFrame({"Age": ages})).data[0]
+    assert (box.q1[0], box.median[0], box.q3[0]) == (6.0, 11.0, 16.0)
+    # The outlier lies beyond the upper fence
+    assert (box.lowerfence[0], box.upperfence[0]) == (1.0, 20.0)
+
+def test_age_histogram_of_no_ages_has_no_box():
+    fig = age_histogram(pd.DataFrame({"Age": [np.nan, np.nan]}))
+    assert [trace.type for trace in fig.data] == ["bar"]
+    assert sum(fig.data[0].y) == 0
+
+def test_value_vs_age_switches_from_markers_to_a_density():
+    svg = value_vs_age_chart(aged_items(SCATTER_SVG_MAX_POINTS), "Cost", "Name")
+    webgl = value_vs_age_chart(aged_items(SCATTER_WEBGL_MAX_POINTS), "Cost", "Name")
+    assert (svg.data[0].type, webgl.data[0].type) == ("scatter", "scattergl")
+
+    # Items without a cost are not drawn and do not count towards the switch
+    items = aged_items(SCATTER_WEBGL_MAX_POINTS + 10)
+    items.loc[:9, "Cost"] = np.nan
+    assert value_vs_age_chart(items, "Cost", "Name").data[0].type == "scattergl"
+    items = aged_items(SCATTER_WEBGL_MAX_POINTS + 11)
+    items.loc[:9, "Cost"] = np.nan
+    density = value_vs_age_chart(items, "Cost", "Name")
+    heatmap = density.data[0]
+    assert heatmap.type == "heatmap" and density.layout.yaxis.type == "log"
+    assert np.shape(heatmap.z) == (DENSITY_BINS, DENSITY_BINS)
+    assert np.nansum(heatmap.z) == len(items) - 10
+
+def test_density_without_positive_costs_is_linear():
+    items = aged_items(SCATTER_WEBGL_MAX_POINTS + 1)
+    items["Cost"] -= items["Cost"].median()
+    assert value_vs_age_chart(items, "Cost", "Name").layout.yaxis.type == "linear"
+
+def test_frequency_chart_keeps_the_most_frequent_values():
+    values = [f"Make {n}" for n in range(FREQUENCY_MAX_BARS + 20) for _ in range(n + 1)]
+    fig = column_frequency_chart(pd.DataFrame({"Make": values}), "Make")
+    assert len(fig.data[0].y) == FREQUENCY_MAX_BARS
+    assert fig.data[0].y[0] == f"Make {FREQUENCY_MAX_BARS + 19}"
+    assert f"top {FREQUENCY_MAX_BARS} of {FREQUENCY_MAX_BARS + 20}" in fig.layout.title.text
@@ -0,0 +1,49 @@
+import pandas as pd
+import pytest
+
+from dslab_bench import synthetic_inventory
+from dslab_cli import main, parse_queries, parse_query, run_batch
+from dslab_engine import build_dataset, normalize_frame
+
+# Collects the written frames instead of encoding them
+class FrameWriter:
+    def __init__(self):
+        self.frames = []
+
+    def write(self, frame):
+        self.frames.append(frame)
+
+def test_limit_caps_groups_not_matches():
+    dataset = build_dataset("v1", normalize_frame(synthetic_inventory(500)), {})
+    fields = list(dataset.source_columns)
+    grouped, limited = FrameWriter(), FrameWriter()
+    run_batch(dataset, [{}], grouped, fields, group_by="department")
+    run_batch(dataset, [{}], limited, fields, group_by="department", limit=3)
+    everything, top = pd.concat(grouped.frames), pd.concat(limited.frames)
+    assert len(top) == 3
+    assert top["rows"].tolist() == everything["rows"].tolist()[:3]
+    assert everything["rows"].sum() == len(dataset.data)
+
+@pytest.mark.parametrize("line", ['{"q": "meter", "fuzzy": "false"}', '{"q": "meter", "columns": "Make"}'])
+def test_invalid_query_options_are_rejected(line):
+    with pytest.raises(ValueError):
+        parse_query(line)
+
+def test_bad_line_is_reported_with_its_number():
+    dataset = build_dataset("v1", normalize_frame(synthetic_inventory(50)), {})
+    with pytest.raises(ValueError, match="line 3"):
+        parse_queries(dataset, ["meter", "", '{"q": "meter"'])
+    with pytest.raises(ValueError, match="line 1: unknown column"):
+        parse_queries(dataset, ['{"q": "meter", "columns": ["Colour"]}'])
+    assert parse_queries(dataset, ["# comment", '{"q": "meter", "columns": ["Make"]}']) == [{"q": "meter", "columns": ["Make"]}]
+
+def test_query_without_matches_gives_a_zero_group_row():
+    dataset = build_dataset("v1", normalize_frame(synthetic_inventory(50)), {})
+    writer = FrameWriter()
+    run_batch(dataset, [{"q": "zzqx"}], writer, list(dataset.source_columns), group_by="equipment")
+    summary = pd.concat(writer.frames)
+    assert summary["rows"].tolist() == [0] and summary["query"].tolist() == ["zzqx"]
+
+def test_negative_limit_is_rejected():
+    with pytest.raises(SystemExit):
+        main(["--limit", "-1"])
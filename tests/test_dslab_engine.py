@@ -0,0 +1,484 @@
+import os
+import time
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from dslab_bench import synthetic_inventory
+from dslab_engine import (
+    EXPORT_FORMATS,
+    LOAD_STAGES,
+    DatasetCache,
+    KeywordIndex,
+    ResultCache,
+    SimilarityIndex,
+    SnapshotStore,
+    SourceCache,
+    apply_schema,
+    build_dataset,
+    configured_sources,
+    filter_rows,
+    normalize_frame,
+    sort_rows,
+    tokenize,
+    write_export,
+)
+
+# Function to write a small synthetic inventory workbook
+def write_workbook(path, rows=200, seed=0):
+    synthetic_inventory(rows, seed).to_excel(path, index=False)
+
+# Function to cut a workbook in half, as an interrupted upload would
+def truncate(path):
+    content = path.read_bytes()
+    path.write_bytes(content[:len(content) // 2])
+
+# Function to build an unshared dataset cache over local workbooks, with the
+# snapshots kept under `cache_dir`
+def local_cache(cache_dir, *paths):
+    cache = DatasetCache(sources=[(f"Source {n}", str(path)) for n, path in enumerate(paths, start=1)], shared=False)
+    for source in cache.sources:
+        source.snapshots = SnapshotStore(source.location, cache_dir=str(cache_dir))
+    return cache
+
+def test_truncated_workbook_keeps_last_good_copy(tmp_path):
+    path = tmp_path / "inventory.xlsx"
+    write_workbook(path)
+    cache = local_cache(tmp_path / "cache", path)
+    dataset = cache.get()
+
+    truncate(path)
+    assert cache.get(force=True) is dataset
+    assert isinstance(cache.last_error, ValueError)
+    # The broken file is not taken as unchanged on the next revalidation
+    assert cache.get(force=True) is dataset
+    assert isinstance(cache.last_error, ValueError)
+
+    write_workbook(path, seed=1)
+    assert cache.get(force=True) is not dataset
+    assert cache.last_error is None
+
+def test_truncated_workbook_without_a_good_copy_is_a_load_error(tmp_path):
+    path = tmp_path / "inventory.xlsx"
+    write_workbook(path)
+    truncate(path)
+    with pytest.raises(ValueError):
+        local_cache(tmp_path / "cache", path).get()
+
+def test_broken_source_does_not_block_the_others(tmp_path):
+    paths = [tmp_path / "d.xlsx", tmp_path / "e.xlsx"]
+    for seed, path in enumerate(paths):
+        write_workbook(path, seed=seed)
+    cache = local_cache(tmp_path / "cache", *paths)
+    rows = len(cache.get().data)
+
+    truncate(paths[1])
+    assert len(cache.get(force=True).data) == rows
+    assert "Source 2" in cache.last_error
+
+def test_workbook_path_is_a_single_source(tmp_path):
+    path = tmp_path / "inventory.xlsx"
+    write_workbook(path)
+    assert configured_sources(str(path)) == [("Source 1", str(path))]
+
+def test_source_list_file(tmp_path):
+    listing = tmp_path / "sources.txt"
+    listing.write_text("# inventories\nMain=/data/main.xlsx\nhttps://example.org/annex.xlsx\n", encoding="utf-8")
+    assert configured_sources(str(listing)) == [("Main", "/data/main.xlsx"), ("Source 2", "https://example.org/annex.xlsx")]
+
+# Function to build a dataset over a synthetic inventory, with one row given a non-ASCII name
+def unicode_dataset():
+    frame = normalize_frame(synthetic_inventory(300))
+    frame.loc[0, "Equipment Name"] = "Balance µg"
+    frame.loc[1, "Equipment Name"] = "தமிழ் Centrifuge"
+    return build_dataset("unicode", frame, {})
+
+def test_non_ascii_terms_are_searchable():
+    dataset = unicode_dataset()
+    assert tokenize("தமிழ் நாடு") == ["தமிழ்", "நாடு"]
+    assert dataset.keyword_index.search("µg").tolist() == [0]
+    assert dataset.keyword_index.search("தமிழ்").tolist() == [1]
+
+def test_query_without_terms_matches_nothing():
+    dataset = unicode_dataset()
+    for query in ("₹", "-"):
+        assert len(dataset.keyword_index.search(query)) == 0
+        assert len(dataset.fuzzy_index.search(query)) == 0
+        assert len(filter_rows(dataset, query, cache=ResultCache())) == 0
+    assert filter_rows(dataset, "  ", cache=ResultCache()) is None
+
+def test_stale_dataset_is_served_while_refreshing_in_background(tmp_path):
+    path = tmp_path / "inventory.xlsx"
+    write_workbook(path, seed=0)
+    cache = local_cache(tmp_path / "cache", path)
+    cache.sources[0].ttl = 0
+    dataset = cache.get()
+
+    write_workbook(path, seed=1)
+    assert cache.get() is dataset
+    deadline = time.time() + 30
+    while cache.dataset is dataset and time.time() < deadline:
+        time.sleep(0.05)
+    assert cache.dataset.version != dataset.version
+
+def test_background_refresh_only_fetches_stale_sources(tmp_path, monkeypatch):
+    paths = [tmp_path / "d.xlsx", tmp_path / "e.xlsx"]
+    for seed, path in enumerate(paths):
+        write_workbook(path, seed=seed)
+    cache = local_cache(tmp_path / "cache", *paths)
+    cache.get()
+    fetched = []
+    fetch = SourceCache._fetch
+    monkeypatch.setattr(SourceCache, "_fetch", lambda source, progress=None: fetched.append(source.name) or fetch(source, progress))
+    cache.sources[0].ttl = 0
+    cache.sources[0]._expires_at = 0.0
+
+    cache.get()
+    deadline = time.time() + 30
+    while cache._refreshing and time.time() < deadline:
+        time.sleep(0.05)
+    assert fetched == ["Source 1"]
+
+# Function to edit, delete and add a few rows of an inventory, including making every
+# cost of one equipment type zero
+def edited_inventory(frame):
+    edited = frame.copy()
+    edited.loc[[3, 30, 300], "Equipment Name"] = ["Quantum Flux Analyser", "Digital Centrifuge", "Quantum Flux Analyser"]
+    rare = edited["Equipment Name"].value_counts().index[-1]
+    edited.loc[edited["Equipment Name"] == rare, "Cost"] = "0"
+    edited = edited.drop(index=[5, 6, 400])
+    added = frame.iloc[[10, 11]].assign(**{"Asset ID": ["DSU-NEW-1", "DSU-NEW-2"], "Make": "Newmake"})
+    return normalize_frame(pd.concat([edited, added], ignore_index=True))
+
+@pytest.mark.parametrize("shuffled", [False, True])
+def test_patched_dataset_equals_rebuild(shuffled):
+    frame = normalize_frame(synthetic_inventory(500))
+    previous = build_dataset("v1", frame, {})
+    edited = edited_inventory(frame)
+    if shuffled:
+        edited = edited.sample(frac=1, random_state=0).reset_index(drop=True)
+    timings = {}
+    patched = build_dataset("v2", edited, timings, previous=previous)
+    rebuilt = build_dataset("v2", edited, {})
+    assert {"Patching search index", "Patching fuzzy index", "Patching aggregates"} <= set(timings)
+
+    for name in ("keyword_index", "fuzzy_index"):
+        patched_index, rebuilt_index = getattr(patched, name), getattr(rebuilt, name)
+        assert patched_index.vocabulary == rebuilt_index.vocabulary
+        for query in ("quantum", "digital centrifuge", "newmake", "school", "sn000"):
+            assert patched_index.search(query).tolist() == rebuilt_index.search(query).tolist()
+    assert np.array_equal(patched.fuzzy_index._weights, rebuilt.fuzzy_index._weights)
+    for name in ("equipment", "department"):
+        patched_facet, rebuilt_facet = patched.facet_index.facets[name], rebuilt.facet_index.facets[name]
+        assert np.array_equal(patched_facet._indptr, rebuilt_facet._indptr)
+        assert np.array_equal(patched_facet._rows, rebuilt_facet._rows)
+    for query in ("quantum", "newmake"):
+        assert patched.keyword_index.search(query, columns=["Equipment Name", "Make"]).tolist() == \
+            rebuilt.keyword_index.search(query, columns=["Equipment Name", "Make"]).tolist()
+
+    for name in ("equipment", "department", "measure"):
+        patched_counts, rebuilt_counts = patched.aggregates.counts(name), rebuilt.aggregates.counts(name)
+        assert patched_counts.dtype == rebuilt_counts.dtype == np.int64
+        assert patched_counts.to_dict() == rebuilt_counts.to_dict()
+        patched_costs, rebuilt_costs = patched.aggregates.cost_totals(name), rebuilt.aggregates.cost_totals(name)
+        assert sorted(patched_costs.index) == sorted(rebuilt_costs.index)
+        assert patched_costs.to_dict() == pytest.approx(rebuilt_costs.to_dict(), abs=0.01)
+    departments = rebuilt.aggregates.counts("department").index
+    equipment = rebuilt.aggregates.counts("equipment").index
+    patched_table = patched.aggregates.crosstab(departments, equipment)
+    rebuilt_table = rebuilt.aggregates.crosstab(departments, equipment)
+    assert (patched_table.dtypes == np.int64).all()
+    assert patched_table.to_numpy().tolist() == rebuilt_table.to_numpy().tolist()
+
+@pytest.mark.parametrize("text, expected", [
+    ("Rs. 1,000", 1000.0),
+    ("₹2,50,000.00", 250000.0),
+    ("$ 12.5", 12.5),
+    ("1000/-", 1000.0),
+    ("INR 7", 7.0),
+    (" 42 ", 42.0),
+    ("-3", -3.0),
+    ("1.5 lakh", None),
+    ("about 200", None),
+    ("", None),
+    (None, None),
+])
+def test_cost_cells_are_parsed_strictly(text, expected):
+    frame = synthetic_inventory(3)
+    frame["Cost"] = pd.Series(["10", text, "20"], dtype=object)
+    data, columns = apply_schema(normalize_frame(frame))
+    costs = data[columns["cost"]]
+    assert costs.dtype == np.float64
+    assert costs[0] == 10.0 and costs[2] == 20.0
+    assert (pd.isna(costs[1]) if expected is None else costs[1] == expected)
+
+def test_numeric_cost_column_is_kept():
+    frame = synthetic_inventory(3)
+    frame["Cost"] = [1.5, None, 3.0]
+    data, columns = apply_schema(frame)
+    assert data[columns["cost"]].tolist()[::2] == [1.5, 3.0]
+
+def test_row_keys_without_asset_ids_survive_upstream_inserts_and_deletes():
+    frame = normalize_frame(synthetic_inventory(50).drop(columns="Asset ID"))
+    frame = normalize_frame(pd.concat([frame, frame.iloc[[7]]], ignore_index=True))
+    dataset = build_dataset("v1", frame, {})
+    keys = dataset.row_keys.keys(np.arange(len(frame)))
+    assert len(set(keys)) == len(keys)
+    assert keys[-1] == f"{keys[7]}-2"
+
+    edited = normalize_frame(pd.concat([frame.iloc[[20]], frame.drop(index=[3, 4])], ignore_index=True))
+    changed = build_dataset("v2", edited, {})
+    for position in (7, 30, len(frame) - 1):
+        moved = changed.row_keys.position(keys[position])
+        assert changed.data.iloc[moved].equals(dataset.data.iloc[position])
+    assert changed.row_keys.position(keys[3]) is None
+    assert changed.row_keys.position("no such key") is None
+
+# Function to read an export back into a frame
+def read_export(content, export_format):
+    if export_format == "Excel":
+        return pd.read_excel(BytesIO(content))
+    if export_format == "Parquet":
+        return pd.read_parquet(BytesIO(content))
+    return pd.read_csv(BytesIO(content), compression="gzip" if export_format == "CSV (gzip)" else None)
+
+@pytest.mark.parametrize("export_format", list(EXPORT_FORMATS))
+def test_export_round_trip(export_format):
+    frame = pd.DataFrame({
+        "Name": ["Centrifuge", "Microscope", None, None, "Balance", "pH Meter", "Oven"],
+        "Cost": [1200.5, None, None, None, 80.0, 15.25, 300.0],
+        "Room": pd.Series(["A-101", "B-2", None, None, "C-3", None, "D-4"], dtype=object),
+    })
+    # Chunks of two rows, the first of which has no values at all
+    rows = np.array([2, 3, 6, 1, 0, 4, 5])
+    buffer = BytesIO()
+    write_export(frame, export_format, buffer, chunk_rows=2, rows=rows, columns=["Name", "Cost", "Room"])
+    expected = frame.iloc[rows].reset_index(drop=True)
+    result = read_export(buffer.getvalue(), export_format)
+    assert len(result) == len(expected)
+    for column in expected.columns:
+        assert result[column].isna().tolist() == expected[column].isna().tolist()
+        assert result[column].dropna().tolist() == expected[column].dropna().tolist()
+
+@pytest.mark.parametrize("export_format", list(EXPORT_FORMATS))
+def test_empty_export_keeps_its_header(export_format):
+    buffer = BytesIO()
+    write_export(pd.DataFrame({"Name": ["x"], "Cost": [1.0]}), export_format, buffer, rows=np.array([], dtype=np.int64))
+    assert list(read_export(buffer.getvalue(), export_format).columns) == ["Name", "Cost"]
+
+def test_result_cache_bounds_other_values_by_size():
+    cache = ResultCache(max_bytes=3 * (ResultCache.ENTRY_OVERHEAD_BYTES + 1000), name="export_cache")
+    for number in range(4):
+        cache.put(("v1", number), bytes(1000))
+    assert len(cache) == 3 and cache.get(("v1", 0)) == (False, None)
+    assert cache.get(("v1", 3))[1] == bytes(1000)
+    cache.put(("v1", "huge"), bytes(cache.max_bytes))
+    assert cache.get(("v1", "huge")) == (False, None)
+    # Counts and summary frames are cached alongside
+    cache.put(("v1", "unique"), 17)
+    cache.put(("v1", "stats"), pd.Series([1.0, 2.0]).describe())
+    assert cache.get(("v1", "unique")) == (True, 17) and cache.get(("v1", "stats"))[0]
+
+# Function to build a result cache with room for `entries` arrays of `rows` positions
+def sized_result_cache(entries, rows=100):
+    return ResultCache(max_bytes=entries * (ResultCache.ENTRY_OVERHEAD_BYTES + rows * 8))
+
+def test_result_cache_evicts_the_least_recently_used():
+    cache = sized_result_cache(3)
+    for number in range(3):
+        cache.put(("v1", number), np.arange(100, dtype=np.int64))
+    assert cache.get(("v1", 0))[0]
+    cache.put(("v1", 3), np.arange(100, dtype=np.int64))
+    assert [cache.get(("v1", number))[0] for number in range(4)] == [True, False, True, True]
+    assert cache.bytes <= cache.max_bytes and cache.evictions == 1
+    with pytest.raises(ValueError):
+        cache.get(("v1", 3))[1][0] = 1
+
+def test_result_cache_drops_other_versions():
+    cache = sized_result_cache(10)
+    cache.put(("v1", "meter"), np.arange(100, dtype=np.int64))
+    cache.put(("v1", "all"), None)
+    assert cache.get(("v1", "all")) == (True, None)
+    cache.put(("v2", "meter"), np.arange(10, dtype=np.int64))
+    assert len(cache) == 1 and cache.get(("v1", "meter")) == (False, None)
+    assert cache.bytes == ResultCache.ENTRY_OVERHEAD_BYTES + 80
+
+def test_filter_rows_answers_repeated_queries_from_the_cache():
+    dataset = build_dataset("v1", normalize_frame(synthetic_inventory(300)), {})
+    cache = sized_result_cache(10, rows=300)
+    first = filter_rows(dataset, "school  chem", cache=cache)
+    # The same terms in another order and spacing are the same query
+    again = filter_rows(dataset, "Chem school", cache=cache)
+    assert again is first and (cache.hits, cache.misses) == (1, 1)
+    assert first.tolist() == dataset.keyword_index.search("school chem").tolist()
+
+@pytest.fixture
+def similarity_index():
+    frame = pd.DataFrame({
+        "Name": ["Digital Multimeter", "Digital Multimeter", "Analog Multimeter", "Centrifuge", None, "Digital Oscilloscope"],
+        "Use": ["Voltage", "Voltage", "Voltage", "Separation", None, "Voltage"],
+    })
+    return SimilarityIndex(frame, ["Name", None, "Use"])
+
+def test_similar_rows_are_ranked_by_shared_trigrams(similarity_index):
+    (rows, scores), (_, centrifuge), (blank, _) = similarity_index.similar([0, 3, 4], top=3)
+    # The identical row first, then the other multimeter, never the row itself
+    assert rows.tolist() == [1, 2, 5]
+    assert scores[0] == pytest.approx(1.0, abs=1e-5) and scores[0] > scores[1] > scores[2] > 0
+    assert (centrifuge < scores[2]).all()
+    assert len(blank) == 0
+
+def test_similar_rows_are_limited_to_the_candidates(similarity_index):
+    candidates = np.array([True, False, True, True, True, True])
+    (rows, _), = similarity_index.similar([0], top=2, candidates=candidates)
+    assert rows.tolist() == [2, 5]
+
+# Function to find the rows where every query term starts a token of some cell, cell by cell
+def prefix_reference(frame, query, columns=None):
+    terms = set(tokenize(query))
+    cells = frame[list(columns or frame.columns)]
+    row_tokens = [
+        {token for value in row if not pd.isna(value) for token in tokenize(value)}
+        for row in cells.itertuples(index=False)
+    ]
+    return [n for n, tokens in enumerate(row_tokens) if all(any(t.startswith(term) for t in tokens) for term in terms)]
+
+@pytest.mark.parametrize("query, columns", [
+    ("school", None),
+    ("sch micro", None),
+    ("Micro School", None),
+    ("sn0000001", None),
+    ("lab 1", ["Lab Name"]),
+    ("lab 1", ["Lab Name", "Room No"]),
+    ("thermo", ["Make", "Supplier"]),
+    ("working", ["Make"]),
+    ("2015", None),
+    ("zzqx", None),
+])
+def test_keyword_search_matches_term_prefixes(query, columns):
+    frame = normalize_frame(synthetic_inventory(300))
+    result = KeywordIndex(frame).search(query, columns=columns)
+    assert result.tolist() == prefix_reference(frame, query, columns)
+
+def test_keyword_search_of_blank_and_symbol_queries():
+    index = KeywordIndex(normalize_frame(synthetic_inventory(20)))
+    assert index.search("   ") is None
+    assert index.search("-- /").tolist() == []
+    # Columns the index does not know are ignored rather than matching everything
+    assert index.search("school", columns=["Colour"]).tolist() == []
+
+@pytest.fixture(scope="module")
+def faceted():
+    return build_dataset("v1", normalize_frame(synthetic_inventory(500)), {})
+
+# Function to select rows by plain equality on the dropdown columns
+def selection_reference(dataset, selections, rows=None):
+    mask = pd.Series(True, index=dataset.data.index)
+    for role, option in selections.items():
+        if option != "All":
+            mask &= dataset.data[dataset.columns[role]].astype(object) == option
+    matching = np.flatnonzero(mask.to_numpy())
+    return matching if rows is None else rows[mask.to_numpy()[rows]]
+
+# Function to pick the most and least common option of a dropdown column
+def common_and_rare(dataset, role):
+    counts = dataset.data[dataset.columns[role]].value_counts()
+    counts = counts[counts > 0]
+    return counts.index[0], counts.index[-1]
+
+def test_facet_selections_match_plain_filtering(faceted):
+    common_school, rare_school = common_and_rare(faceted, "department")
+    common_type, _ = common_and_rare(faceted, "equipment")
+    _, rare_purpose = common_and_rare(faceted, "measure")
+    for selections in (
+        {"department": common_school},
+        {"department": rare_school, "equipment": "All"},
+        {"department": common_school, "equipment": common_type},
+        {"department": common_school, "measure": rare_purpose},
+        {"department": "No Such School"},
+    ):
+        assert sorted(faceted.facet_index.select_rows(selections).tolist()) == selection_reference(faceted, selections).tolist()
+    assert faceted.facet_index.select_rows({"department": "All"}) is None
+
+def test_facet_selection_keeps_the_order_of_given_rows(faceted):
+    rows = faceted.keyword_index.search("school")[::-1].copy()
+    selections = {"equipment": common_and_rare(faceted, "equipment")[0]}
+    assert faceted.facet_index.select_rows(selections, rows).tolist() == selection_reference(faceted, selections, rows).tolist()
+
+@pytest.mark.parametrize("query", ["", "school", "zzqx"])
+def test_option_counts_match_value_counts_under_the_other_selections(faceted, query):
+    rows = faceted.keyword_index.search(query)
+    selections = {
+        "department": common_and_rare(faceted, "department")[0],
+        "equipment": "All",
+        "measure": common_and_rare(faceted, "measure")[0],
+    }
+    counts = faceted.facet_index.option_counts(selections, rows)
+    for role, facet in faceted.facet_index.facets.items():
+        others = {other: option for other, option in selections.items() if other != role}
+        column = faceted.data[facet.column]
+        expected = column.iloc[selection_reference(faceted, others, rows)].value_counts().reindex(facet.options, fill_value=0)
+        assert counts[role].tolist() == expected.tolist()
+
+@pytest.mark.parametrize("ascending", [True, False])
+def test_sorted_rows_keep_ties_in_result_order_and_empty_values_last(ascending):
+    frame = pd.DataFrame({"Cost": [5.0, np.nan, 1.0, 5.0, 3.0, np.nan, 1.0], "Room": ["B", None, "A", "B", "C", "A", None]})
+    rows = np.array([6, 5, 4, 3, 2, 1, 0])
+    costs = sort_rows(frame, rows, "Cost", ascending=ascending)
+    assert costs.tolist() == ([6, 2, 4, 3, 0, 5, 1] if ascending else [3, 0, 4, 6, 2, 5, 1])
+    rooms = sort_rows(frame, rows, "Room", ascending=ascending)
+    assert rooms.tolist() == ([5, 2, 3, 0, 4, 6, 1] if ascending else [4, 3, 0, 5, 2, 6, 1])
+
+def test_sorting_a_categorical_column_follows_its_values(faceted):
+    rows = faceted.keyword_index.search("school")
+    column = faceted.columns["department"]
+    ordered = faceted.data[column].iloc[sort_rows(faceted.data, rows, column)].astype(object).tolist()
+    assert ordered == sorted(ordered)
+
+def test_snapshot_round_trip_keeps_only_the_latest_version(tmp_path):
+    # Mixed text/number cells and repeated headers, as sheets often have
+    sheet = pd.DataFrame([[1, "G-1", 2.5], [2, 17, None]], columns=["S.No", "Room", "Room"])
+    frame = normalize_frame(sheet)
+    assert list(frame.columns) == ["S.No", "Room", "Room.1"] and frame["Room"].tolist() == ["G-1", "17"]
+
+    store = SnapshotStore("https://example.org/inventory.xlsx", cache_dir=str(tmp_path))
+    assert store.load() == (None, {})
+    store.save("aaa", frame, etag='"e1"', last_modified="Mon, 01 Jan 2024 00:00:00 GMT")
+    store.save("bbb", frame.iloc[:1], etag='"e2"')
+    data, manifest = store.load()
+    assert manifest == {"version": "bbb", "etag": '"e2"', "last_modified": None}
+    pd.testing.assert_frame_equal(data, frame.iloc[:1])
+    assert [name for name in os.listdir(store.directory) if name.endswith(".feather")] == ["snapshot-bbb.feather"]
+
+def test_snapshot_with_a_missing_file_is_not_loaded(tmp_path):
+    store = SnapshotStore("inventory.xlsx", cache_dir=str(tmp_path))
+    store.save("aaa", normalize_frame(synthetic_inventory(5)))
+    os.remove(os.path.join(store.directory, "snapshot-aaa.feather"))
+    assert store.load() == (None, {})
+
+# Function to load a cache while recording every progress report as (stage, fraction)
+def reported_load(cache):
+    reports = []
+    dataset = cache.get(progress=lambda stage, fraction, detail="": reports.append((stage, fraction)))
+    return dataset, reports
+
+def test_progress_follows_the_timed_load_stages(tmp_path):
+    write_workbook(tmp_path / "a.xlsx")
+    dataset, reports = reported_load(local_cache(tmp_path / "cache", tmp_path / "a.xlsx"))
+    stages = list(dict.fromkeys(stage for stage, _ in reports))
+    # The missing snapshot is tried first, then the workbook is read and indexed
+    assert stages[0] == "Loading snapshot"
+    assert stages.index("Downloading") < stages.index("Parsing") < stages.index("Building search index")
+    assert set(stages) <= set(LOAD_STAGES)
+    # Every stage of the load that produced the dataset is timed, and runs from 0 to 1
+    assert set(stages[1:]) <= set(dataset.timings)
+    for stage in stages:
+        assert [fraction for name, fraction in reports if name == stage] == [0.0, 1.0]
+
+    # A new process starts from the snapshot instead of parsing the workbook
+    restarted, reports = reported_load(local_cache(tmp_path / "cache", tmp_path / "a.xlsx"))
+    stages = {stage for stage, _ in reports}
+    assert "Loading snapshot" in stages and "Parsing" not in stages
+    assert restarted.data.equals(dataset.data)
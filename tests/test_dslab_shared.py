@@ -0,0 +1,105 @@
+import json
+import os
+import threading
+
+import numpy as np
+import pytest
+
+from dslab_bench import synthetic_inventory
+from dslab_engine import (
+    DatasetCache,
+    PackedStrings,
+    SharedDatasetStore,
+    SnapshotStore,
+    build_dataset,
+    normalize_frame,
+)
+
+QUERIES = ("digital", "school chem", "sn0000", "zzqx")
+
+# Function to build a shared dataset cache over one workbook, as one worker process
+# would, with the store and the snapshots under `cache_dir`
+def worker_cache(cache_dir, path):
+    sources = [("Main", str(path))]
+    cache = DatasetCache(sources=sources, shared=False)
+    cache.shared = SharedDatasetStore(sources, cache_dir=str(cache_dir))
+    cache.sources[0].snapshots = SnapshotStore(str(path), cache_dir=str(cache_dir))
+    return cache
+
+@pytest.fixture
+def workbook(tmp_path):
+    path = tmp_path / "inventory.xlsx"
+    synthetic_inventory(300).to_excel(path, index=False)
+    return path
+
+def test_published_dataset_attaches_with_the_same_answers(tmp_path):
+    dataset = build_dataset("v1", normalize_frame(synthetic_inventory(300)), {})
+    store = SharedDatasetStore([("Main", "inventory.xlsx")], cache_dir=str(tmp_path))
+    store.publish(dataset, [{"version": "v1", "etag": None, "last_modified": None, "error": None}], checked_at=1.0)
+    manifest = store.current()
+    assert (manifest["version"], manifest["checked_at"]) == ("v1", 1.0)
+
+    attached = store.attach(manifest)
+    assert attached.version == "v1" and attached.data.equals(dataset.data)
+    for query in QUERIES:
+        assert attached.keyword_index.search(query).tolist() == dataset.keyword_index.search(query).tolist()
+        assert attached.fuzzy_index.search(query).tolist() == dataset.fuzzy_index.search(query).tolist()
+    assert attached.row_keys.keys(np.arange(5)).tolist() == dataset.row_keys.keys(np.arange(5)).tolist()
+    assert attached.aggregates.counts("department").to_dict() == dataset.aggregates.counts("department").to_dict()
+
+    # Vocabularies and postings are read-only memory maps, not private copies
+    vocabulary = attached.keyword_index.vocabulary
+    assert isinstance(vocabulary, PackedStrings) and list(vocabulary) == dataset.keyword_index.vocabulary
+    for array in (vocabulary.data, attached.keyword_index._all[1], attached.fuzzy_index._weights):
+        assert not array.flags.writeable and isinstance(array.base, np.memmap)
+
+def test_attached_dataset_can_be_patched(tmp_path):
+    frame = normalize_frame(synthetic_inventory(300))
+    store = SharedDatasetStore([("Main", "inventory.xlsx")], cache_dir=str(tmp_path))
+    store.publish(build_dataset("v1", frame, {}), [], checked_at=1.0)
+    attached = store.attach(store.current())
+
+    edited = frame.copy()
+    edited.loc[[3, 30], "Equipment Name"] = "Quantum Flux Analyser"
+    timings = {}
+    patched = build_dataset("v2", edited, timings, previous=attached)
+    rebuilt = build_dataset("v2", edited, {})
+    assert "Patching search index" in timings
+    assert patched.keyword_index.vocabulary == rebuilt.keyword_index.vocabulary
+    for query in QUERIES + ("quantum",):
+        assert patched.keyword_index.search(query).tolist() == rebuilt.keyword_index.search(query).tolist()
+        assert patched.fuzzy_index.search(query).tolist() == rebuilt.fuzzy_index.search(query).tolist()
+
+def test_workers_competing_for_the_lock_build_once(tmp_path, workbook):
+    caches = [worker_cache(tmp_path / "cache", workbook) for _ in range(2)]
+    datasets = [None, None]
+    start = threading.Barrier(len(caches))
+
+    def load(number):
+        start.wait()
+        datasets[number] = caches[number].get()
+
+    threads = [threading.Thread(target=load, args=(number,)) for number in range(len(caches))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=120)
+
+    assert datasets[0].version == datasets[1].version
+    stages = [set(dataset.timings) for dataset in datasets]
+    # One worker parsed and published under the lock, the other waited and attached
+    assert sorted("Publishing shared dataset" in timings for timings in stages) == [False, True]
+    assert sorted("Attaching shared dataset" in timings for timings in stages) == [False, True]
+    published = [entry for entry in os.listdir(caches[0].shared.directory) if entry.startswith("dataset-")]
+    assert len(published) == 1
+
+def test_broken_manifest_falls_back_to_building(tmp_path, workbook):
+    cache = worker_cache(tmp_path / "cache", workbook)
+    os.makedirs(cache.shared.directory)
+    with open(cache.shared.manifest_path, "w") as f:
+        json.dump({"version": "gone", "directory": "dataset-gone", "loaded_at": 0.0, "checked_at": 9e9, "sources": []}, f)
+
+    dataset = cache.get()
+    assert "Publishing shared dataset" in dataset.timings
+    assert cache.shared.current()["version"] == dataset.version
+    assert len(dataset.data) == 300
@@ -0,0 +1,55 @@
+import re
+
+from dslab_telemetry import Telemetry
+
+SAMPLE = re.compile(r'^[a-z_]+(\{[a-z]+="(?:[^"\\]|\\.)*"\})? -?[0-9.e+-]+$')
+
+# Function to read the samples of a Prometheus text export into {name and labels: value}
+def samples(text):
+    lines = [line for line in text.splitlines() if not line.startswith("#")]
+    assert all(SAMPLE.match(line) for line in lines), lines
+    return {line.rsplit(" ", 1)[0]: float(line.rsplit(" ", 1)[1]) for line in lines}
+
+def test_stages_counters_and_gauges_are_exported():
+    telemetry = Telemetry(enabled=True)
+    with telemetry.stage("search", rows_in=100) as stage:
+        stage.rows_out = 7
+    telemetry.record("search", 0.5, rows_in=100, rows_out=3)
+    telemetry.count("result_cache_hit")
+    telemetry.count("result_cache_hit", 2)
+    telemetry.register_gauges("results", lambda: {"result_cache_bytes": 12_345_678_901, "unknown": None})
+
+    exported = samples(telemetry.prometheus_text())
+    assert exported['dslab_stage_calls_total{stage="search"}'] == 2
+    assert exported['dslab_stage_seconds_max{stage="search"}'] == 0.5
+    assert exported['dslab_stage_seconds_last{stage="search"}'] == 0.5
+    assert exported['dslab_stage_rows_in_total{stage="search"}'] == 200
+    assert exported['dslab_stage_rows_out_total{stage="search"}'] == 10
+    assert exported['dslab_events_total{event="result_cache_hit"}'] == 3
+    # Large counts keep every digit and gauges without a value are left out
+    assert "dslab_result_cache_bytes 12345678901" in telemetry.prometheus_text().splitlines()
+    assert "dslab_unknown" not in exported and "dslab_uptime_seconds" in exported
+
+def test_label_values_are_escaped():
+    telemetry = Telemetry(enabled=True)
+    telemetry.record('export: "CSV"\\gzip\n', 0.25)
+    assert 'dslab_stage_calls_total{stage="export: \\"CSV\\"\\\\gzip\\n"} 1' in telemetry.prometheus_text()
+
+def test_disabled_telemetry_records_nothing():
+    telemetry = Telemetry(enabled=False)
+    with telemetry.stage("search", rows_in=10) as stage:
+        stage.rows_out = 5
+    telemetry.count("result_cache_hit")
+    assert telemetry.stages == {} and telemetry.counters == {}
+    assert "dslab_stage_calls_total{" not in telemetry.prometheus_text()
+
+def test_metrics_file_is_written_on_flush(tmp_path):
+    path = tmp_path / "metrics.prom"
+    telemetry = Telemetry(enabled=True, metrics_file=str(path))
+    telemetry.record("load", 1.25)
+    assert samples(path.read_text())['dslab_stage_seconds_total{stage="load"}'] == 1.25
+    telemetry.record("load", 1.0)
+    # Flushes are rate limited unless forced
+    assert samples(path.read_text())['dslab_stage_calls_total{stage="load"}'] == 1
+    telemetry.flush(force=True)
+    assert samples(path.read_text())['dslab_stage_calls_total{stage="load"}'] == 2